@@ -0,0 +1,107 @@
+"""Mesure la construction des fichiers de BrandAnalysis en fonction du nombre de sous-marques.
+
+Compare l'ancienne boucle (pd.concat à chaque ligne et recherche par iterrows)
+aux listes + index de BrandAnalysis.add_holding_result, sans appel à l'API.
+
+Exemple :
+    python benchmarks/bench_brand_analysis.py --sizes 1000 10000 100000
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'brand_analysis'))
+
+from brand_analysis import HOLDINGS_COLUMNS, SUB_BRANDS_COLUMNS, BrandAnalysis
+
+
+def make_results(sub_brands, per_holding=50, subs_per_main=5):
+    """Réponses synthétiques : `sub_brands` sous-marques réparties par holding."""
+    results = []
+    for start in range(0, sub_brands, per_holding):
+        holding = f"HOLDING {start // per_holding}"
+        count = min(per_holding, sub_brands - start)
+        results.append((holding, [f"BRAND {start + i}" for i in range(5)], {
+            'marques_manquantes': [f"NEW {start}"],
+            'sous_marques': [
+                {'marque_principale': f"MAIN {(start + i) // subs_per_main}", 'sous_marque': f"SUB {start + i}"}
+                for i in range(count)
+            ]
+        }))
+    return results
+
+
+def legacy_build(results):
+    """Ancienne construction, reprise telle quelle de process_holdings."""
+    holdings_df = pd.DataFrame(columns=HOLDINGS_COLUMNS)
+    sub_brands_df = pd.DataFrame(columns=SUB_BRANDS_COLUMNS)
+    for holding, known_brands, result in results:
+        new_brands = result['marques_manquantes']
+        for sub_brand_info in result['sous_marques']:
+            main_brand = sub_brand_info['marque_principale']
+            sub_brand = sub_brand_info['sous_marque']
+            if not any(row['Brand Name'] == main_brand for _, row in sub_brands_df.iterrows()):
+                sub_brands_df = pd.concat([sub_brands_df, pd.DataFrame([{
+                    'Main Holding Name': holding, 'Brand Name': main_brand, 'Sub-Brand Name': '',
+                    'Marque Parente': '', 'Statut sous marque': 'Faux'
+                }])], ignore_index=True)
+            sub_brands_df = pd.concat([sub_brands_df, pd.DataFrame([{
+                'Main Holding Name': holding, 'Brand Name': sub_brand, 'Sub-Brand Name': sub_brand,
+                'Marque Parente': main_brand, 'Statut sous marque': 'Vrai'
+            }])], ignore_index=True)
+        holdings_df = pd.concat([holdings_df, pd.DataFrame({
+            'Holding': [holding],
+            'Marques': [', '.join(known_brands)],
+            'Nouvelles Marques': [', '.join(new_brands) if new_brands else 'Aucune']
+        })], ignore_index=True)
+    return holdings_df, sub_brands_df
+
+
+def indexed_build(analyzer, results):
+    """Construction actuelle : listes, index des marques, DataFrames créés une fois."""
+    holdings_records, sub_brand_records, listed_brands = [], [], set()
+    for holding, known_brands, result in results:
+        analyzer.add_holding_result(holding, known_brands, result,
+                                    holdings_records, sub_brand_records, listed_brands)
+    return (pd.DataFrame(holdings_records, columns=HOLDINGS_COLUMNS),
+            pd.DataFrame(sub_brand_records, columns=SUB_BRANDS_COLUMNS))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="Nombres de sous-marques à générer")
+    parser.add_argument('--legacy-max', type=int, default=1000,
+                        help="Taille maximale mesurée avec l'ancienne boucle (quadratique)")
+    args = parser.parse_args()
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        analyzer = BrandAnalysis()
+
+    print(f"{'sous-marques':>12} {'ancienne':>10} {'actuelle':>10} {'µs/ligne':>9}")
+    for size in args.sizes:
+        results = make_results(size)
+        elapsed, frames = timed(indexed_build, analyzer, results)
+        legacy = "-"
+        if size <= args.legacy_max:
+            legacy_elapsed, legacy_frames = timed(legacy_build, results)
+            for frame, legacy_frame in zip(frames, legacy_frames):
+                pd.testing.assert_frame_equal(frame, legacy_frame.astype(frame.dtypes.to_dict()))
+            legacy = f"{legacy_elapsed:9.2f}s"
+        rows = len(frames[1])
+        print(f"{size:>12} {legacy:>10} {elapsed:9.3f}s {elapsed / rows * 1e6:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Compare les fichiers de résultats CSV et Parquet : taille, écriture, relecture et lecture filtrée.
+
+Les résultats synthétiques reprennent les colonnes de brand_verification.py
+(sources jointes par " | ") ou de brand_verification_multiprocessing.py
+(liste de sources). Pour chaque format : durée d'écriture, taille du
+fichier, relecture complète, lecture de `Propriété_Directe` comme
+BrandAnalysis et lecture des seules lignes `À_Vérifier` (filtre évalué à
+la lecture en Parquet), sans appel à l'API.
+
+Exemple :
+    python benchmarks/bench_columnar.py --sizes 10000 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from brand_common.reader import read_catalog_chunks, read_table, write_table
+
+OWNED_COLUMNS = ['Holding Name', 'Brand Name', 'Propriété_Directe']
+
+
+def make_results(rows, pipeline):
+    """Résultats synthétiques : une ligne sur quatre à vérifier manuellement."""
+    records = []
+    for i in range(rows):
+        sources = [
+            {'metadata': {'title': f"Rapport annuel {i % 50} 2024", 'url': f"https://www.holding{i % 50}.com/{i}"}},
+            {'metadata': {'title': f"Communiqué {i}", 'url': f"https://news.example.com/{i}"}}
+        ]
+        records.append({
+            'Holding Name': f"HOLDING {i % 50}",
+            'Brand Name': f"BRAND {i}",
+            'Class Key - Description': f"CLASSE {i % 30}",
+            'Propriété_Directe': i % 5 != 0,
+            'Score_Confiance': 100.0 if i % 4 else 62.5,
+            'Type_Relation': 'Propriété directe',
+            'Zones_Géographiques': 'France, Europe',
+            'Détails_Relation': f"BRAND {i} → HOLDING {i % 50}",
+            'Explication': f"BRAND {i} appartient à HOLDING {i % 50} selon son rapport annuel.",
+            'Sources': (sources if pipeline == 'multi' else
+                        " | ".join(f"{s['metadata']['title']} - {s['metadata']['url']}" for s in sources)),
+            'À_Vérifier': i % 4 == 0,
+            'Statut_Vérification': 'Succès',
+        })
+    return pd.DataFrame(records)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def owned_pairs(path):
+    return sum(len(chunk) for chunk in read_catalog_chunks(path, 50000, OWNED_COLUMNS, required=OWNED_COLUMNS,
+                                                           filters={'Propriété_Directe': True}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--pipeline', choices=['sync', 'multi'], default='sync',
+                        help="Format de la colonne Sources : texte joint (sync) ou liste (multi)")
+    args = parser.parse_args()
+
+    print(f"{'lignes':>8} {'format':>8} {'taille':>9} {'écriture':>9} {'relecture':>10} "
+          f"{'propriété':>10} {'à vérifier':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.sizes:
+            df = make_results(rows, args.pipeline)
+            for extension in ('csv', 'parquet'):
+                path = os.path.join(tmp, f"results_{rows}.{extension}")
+                write_time, _ = timed(write_table, df, path)
+                read_time, _ = timed(read_table, path)
+                owned_time, owned = timed(owned_pairs, path)
+                review_time, review = timed(read_table, path, ['Brand Name', 'Score_Confiance'],
+                                            {'À_Vérifier': True})
+                assert owned == int(df['Propriété_Directe'].sum()) and len(review) == int(df['À_Vérifier'].sum())
+                print(f"{rows:>8} {extension:>8} {os.path.getsize(path) / 1e6:>7.2f}Mo {write_time:>8.2f}s "
+                      f"{read_time:>9.2f}s {owned_time:>9.2f}s {review_time:>10.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""Débit de bout en bout des trois modules contre le stub Perplexica, sur des catalogues synthétiques.
+
+Chaque moteur (BrandVerification séquentiel ou asyncio, BrandVerificationMulti,
+BrandAnalysis) traite un catalogue de chaque taille dans un processus à part,
+pour que la mémoire maximale (RSS) de l'un ne compte pas pour les suivants.
+Le stub tourne dans le processus principal, avec la distribution de latence,
+le taux d'erreurs et le taux de réponses JSON tronquées demandés.
+
+Rapport par moteur et par taille : lignes/s, latence par ligne (p50, p95,
+p99 ; par holding pour BrandAnalysis ; attente d'une place de concurrence
+comprise pour le moteur asyncio), requêtes reçues par le stub, nouvelles
+tentatives et RSS maximale. `--results-file` ajoute chaque mesure à un
+fichier JSON Lines pour suivre les régressions d'une version à l'autre.
+
+Le moteur séquentiel attend chaque requête : sur 100 000 lignes, compter
+au moins `lignes × latence` secondes.
+
+Exemple :
+    python benchmarks/bench_end_to_end.py --sizes 1000 10000 --latency 0.01 --error-rate 0.01 --malformed-rate 0.02
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows : pas de mesure de la RSS maximale
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_multiprocessing import make_catalog
+from stub_server import StubPerplexicaServer
+
+ENGINES = ["sync", "async", "multi", "analysis"]
+
+
+def make_verified_catalog(path, rows, per_holding=50):
+    """Résultats de vérification synthétiques, entrée de BrandAnalysis (une holding pour `per_holding` marques)."""
+    pd.DataFrame({
+        'Holding Name': [f"HOLDING {i // per_holding}" for i in range(rows)],
+        'Brand Name': [f"BRAND {i}" for i in range(rows)],
+        'Propriété_Directe': [True] * rows,
+    }).to_csv(path, index=False)
+
+
+def timed(durations, func):
+    """Enveloppe `func` pour ajouter la durée de chaque appel à `durations`."""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            durations.append(time.perf_counter() - start)
+    return wrapper
+
+
+def timed_async(durations, func):
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            durations.append(time.perf_counter() - start)
+    return wrapper
+
+
+def run_engine(engine, url, input_file, workdir, concurrency):
+    """Traite un catalogue avec un moteur ; retourne (client, durées par ligne)."""
+    durations = []
+    output_file = os.path.join(workdir, f"{engine}.csv")
+    if engine == "analysis":
+        sys.path.insert(0, os.path.join(ROOT, 'brand_analysis'))
+        from brand_analysis import BrandAnalysis
+        analyzer = BrandAnalysis(workers=concurrency)
+        analyzer.client.url = url
+        analyzer.retry_delay = 0.1
+        analyzer.max_retry_delay = 1
+        analyzer.verified_brands_file = input_file
+        analyzer.holdings_brands_file = output_file
+        analyzer.sub_brands_file = os.path.join(workdir, "sub_brands.csv")
+        analyzer.verify_holding_brands = timed(durations, analyzer.verify_holding_brands)
+        analyzer.process_holdings()
+        return analyzer.client, durations
+    if engine == "multi":
+        sys.path.insert(0, os.path.join(ROOT, 'brand_verification_multiprocessing'))
+        from brand_verification_multiprocessing import BrandVerificationMulti
+        verifier = BrandVerificationMulti(concurrency=concurrency)
+        verifier.client.url = url
+        verifier.retry_delay = 0.1
+        verifier.max_retry_delay = 1
+        verifier.process_brand = timed(durations, verifier.process_brand)
+        verifier.process_all_brands(input_file, output_file)
+        return verifier.client, durations
+    sys.path.insert(0, os.path.join(ROOT, 'brand_verification'))
+    from brand_verification import BrandVerification
+    from brand_common.client import PerplexicaClient
+    from brand_verification import SYSTEM_INSTRUCTIONS
+    client = PerplexicaClient(url=url, system_instructions=SYSTEM_INSTRUCTIONS,
+                              max_connections=concurrency if engine == "async" else 1)
+    verifier = BrandVerification(client=client)
+    verifier.retry_delay = 0.1
+    verifier.max_retry_delay = 1
+    if engine == "async":
+        from async_engine import AsyncVerificationEngine
+        runner = AsyncVerificationEngine(verifier, concurrency=concurrency)
+        runner.verify_row = timed_async(durations, runner.verify_row)
+        runner.process_all_brands(input_file, output_file)
+    else:
+        verifier.verify_brand = timed(durations, verifier.verify_brand)
+        verifier.process_all_brands(input_file, output_file)
+    return client, durations
+
+
+def child(args):
+    """Processus de mesure d'un moteur : imprime une ligne JSON de résultats."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+            contextlib.redirect_stderr(devnull):
+        start = time.perf_counter()
+        client, durations = run_engine(args.engine, args.url, args.input, args.workdir, args.concurrency)
+        elapsed = time.perf_counter() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource is not None else None
+    p50, p95, p99 = np.percentile(durations, [50, 95, 99]) if durations else (0.0, 0.0, 0.0)
+    print(json.dumps({
+        'elapsed': elapsed, 'units': len(durations), 'p50': p50, 'p95': p95, 'p99': p99,
+        'client_requests': client.stats['requests'], 'retries': client.stats['retries'], 'rss_mb': rss
+    }))
+
+
+def measure(engine, stub, input_file, workdir, concurrency):
+    requests = stub.request_count
+    command = [sys.executable, os.path.abspath(__file__), '--child', engine, '--url', stub.url,
+               '--input', input_file, '--workdir', workdir, '--concurrency', str(concurrency)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{engine}: échec du processus de mesure\n{completed.stderr}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['requests'] = stub.request_count - requests
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=ENGINES)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+    parser.add_argument('--latency', type=float, default=0.01, help="Latence du stub, en secondes")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="Dispersion de la latence (écart-type, ou du logarithme en lognormal)")
+    parser.add_argument('--distribution', choices=["normal", "lognormal", "exponential"], default="normal")
+    parser.add_argument('--tail-rate', type=float, default=0.0, help="Part des requêtes très lentes")
+    parser.add_argument('--tail-latency', type=float, default=0.0, help="Latence ajoutée aux requêtes lentes")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Part des requêtes en erreur 500")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="Part des réponses au JSON tronqué")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--results-file', default=None, help="Fichier JSON Lines où ajouter les mesures")
+    # Processus de mesure d'un moteur (usage interne)
+    parser.add_argument('--child', choices=ENGINES, dest='engine', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    parser.add_argument('--input', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.engine:
+        child(args)
+        return
+
+    config = {key: getattr(args, key) for key in ('latency', 'jitter', 'distribution', 'tail_rate',
+                                                   'tail_latency', 'error_rate', 'malformed_rate', 'concurrency')}
+    with tempfile.TemporaryDirectory() as tmp, \
+            StubPerplexicaServer(latency=args.latency, jitter=args.jitter, distribution=args.distribution,
+                                 tail_rate=args.tail_rate, tail_latency=args.tail_latency,
+                                 error_rate=args.error_rate, malformed_rate=args.malformed_rate) as stub:
+        print(f"Stub: latence {args.latency}s ({args.distribution}, dispersion {args.jitter}), "
+              f"{args.error_rate:.1%} d'erreurs, {args.malformed_rate:.1%} de JSON tronqués, "
+              f"concurrence {args.concurrency}\n")
+        print(f"{'moteur':<9} {'lignes':>7} {'durée':>9} {'lignes/s':>9} {'p50':>7} {'p95':>7} {'p99':>7} "
+              f"{'requêtes':>9} {'réessais':>9} {'RSS max':>9}")
+        for size in args.sizes:
+            catalog = os.path.join(tmp, f'catalog_{size}.csv')
+            make_catalog(catalog, size)
+            verified = os.path.join(tmp, f'verified_{size}.csv')
+            make_verified_catalog(verified, size)
+            for engine in args.engines:
+                workdir = os.path.join(tmp, f'{engine}_{size}')
+                os.makedirs(workdir)
+                result = measure(engine, stub, verified if engine == "analysis" else catalog, workdir,
+                                 args.concurrency)
+                rss = f"{result['rss_mb']:.0f} Mo" if result['rss_mb'] is not None else "n/d"
+                print(f"{engine:<9} {size:>7} {result['elapsed']:8.1f}s {size / result['elapsed']:9.1f} "
+                      f"{result['p50']:6.3f}s {result['p95']:6.3f}s {result['p99']:6.3f}s "
+                      f"{result['requests']:>9} {result['retries']:>9} {rss:>9}")
+                if args.results_file:
+                    with open(args.results_file, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps({'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                                            'engine': engine, 'rows': size, **config, **result}) + "\n")
+
+
+if __name__ == '__main__':
+    main()
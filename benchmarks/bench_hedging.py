@@ -0,0 +1,89 @@
+"""Latence par ligne de BrandVerificationMulti : 2ème vérification spéculative et requêtes de couverture.
+
+Le stub ajoute `--tail-latency` secondes à une part `--tail-rate` des
+requêtes (latence de queue). Chaque mode traite le même catalogue ; la
+durée de process_brand est mesurée ligne par ligne (p50, p95, p99) avec
+le nombre de requêtes envoyées, qui montre la charge supplémentaire.
+
+Exemple :
+    python benchmarks/bench_hedging.py --rows 200 --latency 0.05 --tail-rate 0.05 --tail-latency 1.0
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_multiprocessing import make_catalog, make_verifier
+from brand_common.client import PerplexicaClient
+from brand_common.throttle import CircuitBreaker, HedgePolicy
+from brand_verification_multiprocessing import SYSTEM_INSTRUCTIONS, BrandVerificationMulti
+from stub_server import StubPerplexicaServer
+
+
+def run(stub, input_file, output_file, concurrency, speculative, hedge_percentile):
+    client = PerplexicaClient(system_instructions=SYSTEM_INSTRUCTIONS, optimization_mode="accuracy",
+                              max_connections=BrandVerificationMulti.max_requests_in_flight(concurrency, speculative),
+                              breaker=CircuitBreaker(),
+                              hedge=HedgePolicy(hedge_percentile) if hedge_percentile else None)
+    verifier = make_verifier(stub.url, concurrency=concurrency, client=client, speculative=speculative)
+    durations = []
+    process_brand = verifier.process_brand
+
+    def timed_process_brand(args):
+        start = time.perf_counter()
+        result = process_brand(args)
+        durations.append(time.perf_counter() - start)
+        return result
+
+    verifier.process_brand = timed_process_brand
+    requests = stub.request_count
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        start = time.perf_counter()
+        verifier.process_all_brands(input_file, output_file)
+        elapsed = time.perf_counter() - start
+    verifier.client.close()
+    return elapsed, np.percentile(durations, [50, 95, 99]), stub.request_count - requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help="Latence habituelle du stub, en secondes")
+    parser.add_argument('--tail-rate', type=float, default=0.05, help="Part des requêtes très lentes")
+    parser.add_argument('--tail-latency', type=float, default=1.0, help="Latence ajoutée aux requêtes lentes")
+    parser.add_argument('--hedge-percentile', type=float, default=95)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    modes = [
+        ("Séquentiel", False, None),
+        ("2ème passe spéculative", True, None),
+        (f"Couverture p{args.hedge_percentile:g}", False, args.hedge_percentile),
+        ("Spéculative + couverture", True, args.hedge_percentile),
+    ]
+    with tempfile.TemporaryDirectory() as tmp, \
+            StubPerplexicaServer(latency=args.latency, tail_rate=args.tail_rate,
+                                 tail_latency=args.tail_latency) as stub:
+        input_file = os.path.join(tmp, 'catalog.csv')
+        make_catalog(input_file, args.rows)
+
+        print(f"{args.rows} lignes, latence {args.latency}s, {args.tail_rate:.0%} des requêtes "
+              f"+{args.tail_latency}s, concurrence {args.concurrency}\n")
+        print(f"{'mode':<26} {'durée':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'requêtes':>9}")
+        for position, (label, speculative, hedge_percentile) in enumerate(modes):
+            output_file = os.path.join(tmp, f'out_{position}.csv')
+            elapsed, (p50, p95, p99), requests = run(stub, input_file, output_file, args.concurrency,
+                                                     speculative, hedge_percentile)
+            print(f"{label:<26} {elapsed:7.2f}s {p50:6.2f}s {p95:6.2f}s {p99:6.2f}s {requests:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Compare l'ancien Pool dimensionné sur les CPU au scheduler orienté I/O.
+
+Exemple :
+    python benchmarks/bench_multiprocessing.py --rows 200 --latency 0.2 --concurrency 16
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'brand_verification_multiprocessing'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from brand_verification_multiprocessing import BrandVerificationMulti
+from stub_server import StubPerplexicaServer
+
+
+def make_catalog(path, rows):
+    """Écrit un catalogue synthétique au format du fichier d'origine."""
+    pd.DataFrame({
+        'Main Holding Name': [f"HOLDING {i % 20}" for i in range(rows)],
+        'Holding Name': [f"HOLDING {i % 20}" for i in range(rows)],
+        'Brand Name': [f"BRAND {i}" for i in range(rows)],
+        'Class Key - Description': ['1550 - ICE CREAM'] * rows,
+        'Group Class Key - Description': ['155 - FROZEN DESSERTS'] * rows,
+        'Business Unit Description': ['FMCG'] * rows,
+    }).to_csv(path, index=False)
+
+
+def make_verifier(url, **kwargs):
+    verifier = BrandVerificationMulti(**kwargs)
+    verifier.client.url = url
+    verifier.retry_delay = 0.1
+    return verifier
+
+
+# Vérificateur de chaque processus du Pool : le client HTTP partagé (session,
+# verrous) ne se transmet pas d'un processus à l'autre
+_pool_verifier = None
+
+
+def init_pool(url):
+    global _pool_verifier
+    _pool_verifier = make_verifier(url)
+
+
+def pool_process_brand(args):
+    return _pool_verifier.process_brand(args)
+
+
+def run_pool(url, input_file):
+    """Reproduit l'ancienne boucle: Pool(cpu_count).imap(process_brand)."""
+    df = pd.read_csv(input_file)
+    args_list = [(row['Holding Name'], row['Brand Name'], i, len(df)) for i, row in df.iterrows()]
+    with Pool(processes=multiprocessing.cpu_count(), initializer=init_pool, initargs=(url,)) as pool:
+        return list(pool.imap(pool_process_brand, args_list))
+
+
+def run_scheduler(url, input_file, output_file, concurrency, cpu_workers):
+    verifier = make_verifier(url, concurrency=concurrency, cpu_workers=cpu_workers)
+    verifier.process_all_brands(input_file, output_file)
+
+
+def timed(label, rows, func, *args):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed:8.2f} s {rows / elapsed:8.1f} lignes/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.2, help="Latence du stub en secondes")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--cpu-workers', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            StubPerplexicaServer(latency=args.latency, error_rate=args.error_rate) as stub:
+        input_file = os.path.join(tmp, 'catalog.csv')
+        make_catalog(input_file, args.rows)
+
+        print(f"{args.rows} lignes, latence {args.latency}s, {multiprocessing.cpu_count()} CPU\n")
+        timed(f"Pool ({multiprocessing.cpu_count()} processus)", args.rows, run_pool, stub.url, input_file)
+        timed(f"Scheduler ({args.concurrency} en vol)", args.rows, run_scheduler,
+              stub.url, input_file, os.path.join(tmp, 'out.csv'), args.concurrency, 0)
+        timed(f"Scheduler + {args.cpu_workers} processus CPU", args.rows, run_scheduler,
+              stub.url, input_file, os.path.join(tmp, 'out_cpu.csv'), args.concurrency, args.cpu_workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Compare la vérification marque par marque au préchargement du portefeuille de chaque holding.
+
+Le catalogue synthétique répartit `--rows` marques entre 20 holdings. Le
+stub répond aux demandes de portefeuille avec une part `--coverage` des
+marques de chaque holding, écrites dans une autre casse ("Brand 12" pour
+"BRAND 12") : les autres marques restent à la vérification individuelle.
+BrandVerification (moteur asyncio) et BrandVerificationMulti sont mesurés
+sans puis avec `--portfolio-prefetch` : durée, requêtes reçues par le stub
+et lignes résolues par les portefeuilles.
+
+Exemple :
+    python benchmarks/bench_portfolio.py --rows 2000 --latency 0.05 --coverage 0.9
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'brand_verification'))
+
+from async_engine import AsyncVerificationEngine
+from bench_multiprocessing import make_catalog, make_verifier
+from brand_common.client import PerplexicaClient
+from brand_common.portfolio import PortfolioIndex
+from brand_verification import SYSTEM_INSTRUCTIONS, BrandVerification
+from stub_server import StubPerplexicaServer
+
+HOLDINGS = 20
+
+
+def make_portfolios(rows, coverage):
+    """Portefeuilles du stub : part `coverage` des marques de chaque holding du catalogue synthétique."""
+    portfolios = {}
+    for i in range(rows):
+        portfolios.setdefault(f"HOLDING {i % HOLDINGS}", []).append(f"Brand {i}")
+    return {holding: brands[:int(len(brands) * coverage)] for holding, brands in portfolios.items()}
+
+
+def run(engine, url, input_file, output_file, concurrency, portfolio, min_brands):
+    if engine == "multi":
+        verifier = make_verifier(url, concurrency=concurrency)
+        runner = verifier
+    else:
+        client = PerplexicaClient(url=url, system_instructions=SYSTEM_INSTRUCTIONS, max_connections=concurrency)
+        verifier = BrandVerification(client=client)
+        verifier.retry_delay = 0.1
+        runner = AsyncVerificationEngine(verifier, concurrency=concurrency)
+    if portfolio:
+        verifier.portfolios = PortfolioIndex(min_brands)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+            contextlib.redirect_stderr(devnull):
+        start = time.perf_counter()
+        runner.process_all_brands(input_file, output_file)
+        elapsed = time.perf_counter() - start
+    return elapsed, verifier.portfolios
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.05, help="Latence du stub, en secondes")
+    parser.add_argument('--coverage', type=float, default=0.9,
+                        help="Part des marques de chaque holding présentes dans son portefeuille")
+    parser.add_argument('--min-brands', type=int, default=50,
+                        help="Nombre minimal de marques d'une holding pour demander son portefeuille")
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            StubPerplexicaServer(latency=args.latency, portfolios=make_portfolios(args.rows, args.coverage)) as stub:
+        input_file = os.path.join(tmp, 'catalog.csv')
+        make_catalog(input_file, args.rows)
+
+        print(f"{args.rows} lignes, {HOLDINGS} holdings, portefeuilles couvrant {args.coverage:.0%} des marques, "
+              f"latence {args.latency}s, concurrence {args.concurrency}\n")
+        for engine in ("async", "multi"):
+            for portfolio in (False, True):
+                output_file = os.path.join(tmp, f'out_{engine}_{portfolio}.csv')
+                requests_before = stub.request_count
+                elapsed, portfolios = run(engine, stub.url, input_file, output_file, args.concurrency,
+                                          portfolio, args.min_brands)
+                label = f"{engine}, {'portefeuilles' if portfolio else 'marque par marque'}"
+                print(f"{label}: {elapsed:.2f}s ({args.rows / elapsed:.1f} lignes/s), "
+                      f"{stub.request_count - requests_before} requêtes")
+                if portfolios is not None:
+                    print(portfolios.summary())
+            print()
+
+
+if __name__ == '__main__':
+    main()
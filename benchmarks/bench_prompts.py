@@ -0,0 +1,72 @@
+"""Compare les templates de prompt de BrandVerificationMulti : durée et tokens estimés par ligne.
+
+Le stub ajoute `--prompt-latency` secondes par tranche de 1000 caractères
+de question et d'instructions système, pour imiter la lecture du prompt
+par le modèle. Chaque template est mesuré seul, puis les deux ensemble en
+test A/B (chaque paire reçoit toujours le même template) : le résumé
+donne, par template, les requêtes, les tokens envoyés et reçus par ligne
+et la durée moyenne des requêtes.
+
+Exemple :
+    python benchmarks/bench_prompts.py --rows 200 --latency 0.05 --prompt-latency 0.02
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_multiprocessing import make_catalog, make_verifier
+from stub_server import StubPerplexicaServer
+
+
+def run(url, input_file, output_file, templates, concurrency, batch_size):
+    verifier = make_verifier(url, concurrency=concurrency)
+    verifier.set_prompt_templates(templates)
+    verifier.batch_size = batch_size
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+            contextlib.redirect_stderr(devnull):
+        start = time.perf_counter()
+        verifier.process_all_brands(input_file, output_file)
+        elapsed = time.perf_counter() - start
+    return elapsed, verifier.prompt_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help="Latence fixe du stub, en secondes")
+    parser.add_argument('--prompt-latency', type=float, default=0.02,
+                        help="Latence ajoutée par tranche de 1000 caractères de prompt")
+    parser.add_argument('--templates', nargs=2, default=["verification-fr-v1", "verification-fr-v2-compact"])
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    current, compact = args.templates
+    configurations = [
+        (current, [current]),
+        (compact, [compact]),
+        ("A/B", [current, compact]),
+    ]
+    with tempfile.TemporaryDirectory() as tmp, \
+            StubPerplexicaServer(latency=args.latency, prompt_latency=args.prompt_latency) as stub:
+        input_file = os.path.join(tmp, 'catalog.csv')
+        make_catalog(input_file, args.rows)
+
+        print(f"{args.rows} lignes, latence {args.latency}s + {args.prompt_latency}s par 1000 caractères "
+              f"de prompt, concurrence {args.concurrency}, lots de {args.batch_size}\n")
+        for position, (label, templates) in enumerate(configurations):
+            output_file = os.path.join(tmp, f'out_{position}.csv')
+            elapsed, stats = run(stub.url, input_file, output_file, templates, args.concurrency, args.batch_size)
+            print(f"{label}: {elapsed:.2f}s ({args.rows / elapsed:.1f} lignes/s)")
+            print(stats.summary() + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Compare les réponses complètes, lues en flux et coupées au verdict, sur le stub.
+
+Le stub génère le message par morceaux (`--chunk-delay` entre deux morceaux)
+avec un long details_relation après les champs requis ; le vérificateur
+standard est exécuté dans les trois modes, puis les verdicts sont comparés.
+
+Exemple :
+    python benchmarks/bench_streaming.py --rows 40 --chunk-delay 0.005 --details-words 40
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'brand_verification'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_multiprocessing import make_catalog
+from brand_verification import BrandVerification
+from stub_server import StubPerplexicaServer
+
+
+def run(stub, input_file, output_file, stream_responses, stop_early):
+    verifier = BrandVerification()
+    verifier.client.url = stub.url
+    verifier.client.stream_responses = stream_responses
+    verifier.client.stop_early = stop_early
+    chunks = stub.chunks_sent
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        verifier.process_all_brands(input_file, output_file)
+        elapsed = time.perf_counter() - start
+    stats = verifier.client.stats
+    verdict = stats['verdict_time'] / stats['verdicts'] if stats['verdicts'] else None
+    return elapsed, verdict, stub.chunks_sent - chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.05, help="Latence avant le premier octet, en secondes")
+    parser.add_argument('--chunk-delay', type=float, default=0.005, help="Délai entre deux morceaux du message")
+    parser.add_argument('--chunk-size', type=int, default=24)
+    parser.add_argument('--details-words', type=int, default=40,
+                        help="Longueur du texte généré après le verdict (details_relation)")
+    args = parser.parse_args()
+
+    modes = [('Réponse complète', False, False), ('Flux', True, False), ('Flux coupé au verdict', True, True)]
+    with tempfile.TemporaryDirectory() as tmp, \
+            StubPerplexicaServer(latency=args.latency, chunk_size=args.chunk_size, chunk_delay=args.chunk_delay,
+                                 details_words=args.details_words) as stub:
+        input_file = os.path.join(tmp, 'catalog.csv')
+        make_catalog(input_file, args.rows)
+
+        print(f"{args.rows} lignes, latence {args.latency}s, {args.chunk_delay}s par morceau de {args.chunk_size} caractères\n")
+        print(f"{'mode':<24} {'durée':>8} {'verdict moyen':>14} {'morceaux générés':>17}")
+        outputs = []
+        for label, stream_responses, stop_early in modes:
+            output_file = os.path.join(tmp, f'out_{len(outputs)}.csv')
+            elapsed, verdict, chunks = run(stub, input_file, output_file, stream_responses, stop_early)
+            verdict = f"{verdict:.3f}s" if verdict is not None else "-"
+            print(f"{label:<24} {elapsed:7.2f}s {verdict:>14} {chunks:>17}")
+            outputs.append(pd.read_csv(output_file))
+
+        # Même verdict dans les trois modes ; seul le texte après le verdict peut manquer
+        for column in ('Propriété_Directe', 'Explication', 'Statut_Vérification'):
+            assert all(output[column].equals(outputs[0][column]) for output in outputs), column
+        print("\nVerdicts identiques dans les trois modes")
+        print(f"Flux interrompus côté serveur: {stub.streams_cancelled}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Compare un seul palier (modèle lent) aux paliers modèle rapide puis modèle lent.
+
+Le stub répond plus lentement au modèle « fort » (`--strong-latency`) qu'au
+modèle « rapide » (`--fast-latency`). Les réponses peu sûres sont promues au
+modèle fort : avec les sources du stub, le score recalculé vaut 67.5 pour une
+marque détenue et 45 sinon, d'où `--promote-below 60`. Durée, appels et coût
+estimé sont affichés par palier, à partir de BrandVerificationMulti.
+
+Exemple :
+    python benchmarks/bench_tiers.py --rows 200 --fast-latency 0.05 --strong-latency 0.4
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_multiprocessing import make_catalog, make_verifier
+from brand_common.tiers import Tier
+from stub_server import StubPerplexicaServer
+
+FAST_MODEL = "gpt-4o-mini"
+STRONG_MODEL = "gpt-4o"
+
+
+def run(url, input_file, output_file, tiers, concurrency):
+    verifier = make_verifier(url, concurrency=concurrency)
+    verifier.set_tiers(tiers)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        verifier.process_all_brands(input_file, output_file)
+        elapsed = time.perf_counter() - start
+    return elapsed, verifier.tier_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--fast-latency', type=float, default=0.05, help="Latence du modèle rapide, en secondes")
+    parser.add_argument('--strong-latency', type=float, default=0.4, help="Latence du modèle fort, en secondes")
+    parser.add_argument('--fast-cost', type=float, default=0.15, help="Coût estimé d'un appel au modèle rapide")
+    parser.add_argument('--strong-cost', type=float, default=2.5, help="Coût estimé d'un appel au modèle fort")
+    parser.add_argument('--promote-below', type=float, default=60,
+                        help="Confiance en dessous de laquelle le modèle fort est appelé")
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    strong = Tier('fort', STRONG_MODEL, "quality", "webSearch", cost_per_request=args.strong_cost)
+    configurations = [
+        ("Modèle fort seul", [strong]),
+        ("Rapide puis fort", [Tier('rapide', FAST_MODEL, "speed", "webSearch", promote_below=args.promote_below,
+                                   cost_per_request=args.fast_cost), strong]),
+    ]
+    model_latency = {FAST_MODEL: args.fast_latency, STRONG_MODEL: args.strong_latency}
+    with tempfile.TemporaryDirectory() as tmp, StubPerplexicaServer(model_latency=model_latency) as stub:
+        input_file = os.path.join(tmp, 'catalog.csv')
+        make_catalog(input_file, args.rows)
+
+        print(f"{args.rows} lignes, modèle rapide {args.fast_latency}s, modèle fort {args.strong_latency}s, "
+              f"concurrence {args.concurrency}\n")
+        for position, (label, tiers) in enumerate(configurations):
+            output_file = os.path.join(tmp, f'out_{position}.csv')
+            elapsed, stats = run(stub.url, input_file, output_file, tiers, args.concurrency)
+            print(f"{label}: {elapsed:.2f}s ({args.rows / elapsed:.1f} lignes/s)")
+            print(stats.summary() + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+import gzip
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Demandes de portefeuille de marques (templates portfolio-en-v1 et portfolio-fr-v1)
+PORTFOLIO_RE = re.compile(r"(?:List the brands currently owned by|Listez les marques détenues aujourd'hui "
+                          r"par la société) '([^']+)'")
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    """Serveur de test qui ignore les connexions coupées par le client (flux interrompus)."""
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class StubPerplexicaServer:
+    """Serveur local qui imite le contrat de /api/search (message + sources).
+
+    Utilisable comme context manager ; l'URL à injecter dans les vérificateurs
+    est disponible dans `url` une fois le serveur démarré. Les requêtes avec
+    `"stream": true` reçoivent des événements JSON ligne par ligne (sources,
+    morceaux du message, done).
+
+    `distribution` règle la forme des latences autour de `latency` :
+    "normal" (écart-type `jitter`), "lognormal" (médiane `latency`, écart-type
+    du logarithme `jitter`) ou "exponential" (moyenne `latency`). Une part
+    `error_rate` des requêtes reçoit une erreur 500, une part
+    `malformed_rate` des réponses un message JSON tronqué. Les prompts de
+    BrandAnalysis ("Marques connues de ...") reçoivent des marques
+    manquantes et des sous-marques ; les demandes de portefeuille de marques
+    d'une holding reçoivent les marques de `portfolios` ({holding: [marques]},
+    liste vide pour une holding inconnue).
+    """
+
+    def __init__(self, latency=0.1, jitter=0.0, error_rate=0.0, seed=42,
+                 chunk_size=24, chunk_delay=0.0, details_words=0, model_latency=None,
+                 tail_rate=0.0, tail_latency=0.0, prompt_latency=0.0, distribution="normal",
+                 malformed_rate=0.0, portfolios=None):
+        if distribution not in ("normal", "lognormal", "exponential"):
+            raise ValueError(f"Distribution de latence inconnue: {distribution}")
+        self.latency = latency
+        self.distribution = distribution
+        # Lecture du prompt : secondes ajoutées par tranche de 1000 caractères
+        # (question et instructions système)
+        self.prompt_latency = prompt_latency
+        # Latence de queue : une part `tail_rate` des requêtes attend `tail_latency` de plus
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        # Latence propre à certains modèles de chat ({nom: secondes}), sinon `latency`
+        self.model_latency = model_latency or {}
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        # Réponses en flux ("stream": true) : taille et cadence des morceaux du message
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        # Longueur de details_relation (texte généré après le verdict)
+        self.details_words = details_words
+        # Portefeuilles de marques renvoyés par holding
+        self.portfolios = portfolios or {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.errors_served = 0
+        self.malformed_served = 0
+        self.chunks_sent = 0
+        self.streams_cancelled = 0
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/search"
+
+    def draw(self, model=None, prompt_chars=0):
+        """Tire la latence, l'éventuelle erreur et l'éventuelle réponse malformée d'une requête."""
+        base = self.model_latency.get(model, self.latency) + self.prompt_latency * prompt_chars / 1000
+        with self.lock:
+            self.request_count += 1
+            if self.distribution == "lognormal":
+                latency = base * math.exp(self.random.gauss(0.0, self.jitter)) if self.jitter else base
+            elif self.distribution == "exponential":
+                latency = self.random.expovariate(1.0 / base) if base > 0 else 0.0
+            else:
+                latency = max(0.0, self.random.gauss(base, self.jitter)) if self.jitter else base
+            if self.tail_rate and self.random.random() < self.tail_rate:
+                latency += self.tail_latency
+            fail = self.random.random() < self.error_rate
+            malformed = bool(self.malformed_rate) and not fail and self.random.random() < self.malformed_rate
+            self.errors_served += fail
+            self.malformed_served += malformed
+        return latency, fail, malformed
+
+    def build_item(self, query):
+        """Objet de réponse déterministe pour une requête (ou une marque d'un lot)."""
+        belongs_to = sum(query.encode('utf-8')) % 4 != 0
+        return {
+            "belongs_to": belongs_to,
+            "confidence": 85 if belongs_to else 40,
+            "explanation": "La marque est détenue directement par la holding." if belongs_to
+                           else "Aucune preuve de détention par la holding.",
+            "sources": ["https://www.example.com/annualreport-2024"],
+            "type_relation": "Propriété directe" if belongs_to else "Aucune relation",
+            "zones_geographiques": "Europe",
+            "date_changement": "",
+            "details_relation": " ".join(["Détail de la relation."] * self.details_words)
+        }
+
+    def build_analysis(self, query):
+        """Marques manquantes et sous-marques déterministes pour un prompt de BrandAnalysis."""
+        match = re.match(r"Marques connues de (.*?): (.*)", query)
+        holding, brands = (match.group(1), match.group(2).split(', ')) if match else ("", [])
+        return {
+            "marques_manquantes": [f"{holding} NOUVELLE MARQUE"],
+            "sous_marques": [{"marque_principale": brand, "sous_marque": f"{brand} PLUS"} for brand in brands[:3]]
+        }
+
+    def build_portfolio(self, holding):
+        """Portefeuille de marques d'une holding tel que décrit par `portfolios`."""
+        return {
+            "brands": [{"brand": brand, "owner": holding, "confidence": 90, "type_relation": "Propriété directe",
+                        "sources": ["https://www.example.com/brands"]} for brand in self.portfolios.get(holding, [])],
+            "sources": ["https://www.example.com/annualreport-2024"]
+        }
+
+    def build_answer(self, query, malformed=False):
+        """Réponse au format Perplexica ; tableau JSON pour les requêtes groupées."""
+        # Les prompts groupés listent les marques sous la forme "1. 'MARQUE'"
+        batch_brands = re.findall(r"^\s*\d+\. '([^']+)'", query, flags=re.MULTILINE)
+        portfolio = PORTFOLIO_RE.match(query)
+        if portfolio:
+            message = self.build_portfolio(portfolio.group(1))
+        elif query.startswith("Marques connues de "):
+            message = self.build_analysis(query)
+        elif batch_brands:
+            message = [dict(self.build_item(brand), brand=brand) for brand in batch_brands]
+        else:
+            message = self.build_item(query)
+        message = "```json\n" + json.dumps(message, ensure_ascii=False) + "\n```"
+        if malformed:
+            # Génération interrompue : JSON tronqué au milieu
+            message = message[:len(message) // 2]
+        return {
+            "message": message,
+            "sources": [
+                {"metadata": {"url": "https://www.sec.gov/annualreport", "title": "Annual report 2024",
+                              "content": "The brand is owned by the company."}},
+                {"metadata": {"url": "https://blog.example.net/post", "title": "Brand news",
+                              "content": "Blog post"}}
+            ]
+        }
+
+    def stream_events(self, answer):
+        """Événements d'une réponse en flux, comme /api/search avec "stream": true."""
+        yield {"type": "init", "data": "Stream connected"}
+        yield {"type": "sources", "data": answer["sources"]}
+        message = answer["message"]
+        for start in range(0, len(message), self.chunk_size):
+            yield {"type": "response", "data": message[start:start + self.chunk_size]}
+        yield {"type": "done"}
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length)
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                payload = json.loads(body or b'{}')
+                prompt_chars = len(payload.get('query') or '') + len(payload.get('systemInstructions') or '')
+                latency, fail, malformed = stub.draw((payload.get('chatModel') or {}).get('name'), prompt_chars)
+                time.sleep(latency)
+                if payload.get('stream') and not fail:
+                    self.send_stream(stub.build_answer(payload.get('query', ''), malformed))
+                    return
+                if fail:
+                    status, body = 500, json.dumps({"message": "Internal error"}).encode()
+                else:
+                    answer = stub.build_answer(payload.get('query', ''), malformed)
+                    # Réponse complète : attendre la génération de tout le message
+                    chunks = -(-len(answer["message"]) // stub.chunk_size)
+                    time.sleep(chunks * stub.chunk_delay)
+                    with stub.lock:
+                        stub.chunks_sent += chunks
+                    status, body = 200, json.dumps(answer).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body = gzip.compress(body)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_stream(self, answer):
+                # Une ligne JSON par événement, en Transfer-Encoding: chunked
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                try:
+                    for event in stub.stream_events(answer):
+                        if event["type"] == "response":
+                            time.sleep(stub.chunk_delay)
+                            with stub.lock:
+                                stub.chunks_sent += 1
+                        data = (json.dumps(event, ensure_ascii=False) + "\n").encode('utf-8')
+                        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # Le client a coupé la génération
+                    with stub.lock:
+                        stub.streams_cancelled += 1
+                    self.close_connection = True
+
+        self.server = QuietHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,16 +1,60 @@
 import pandas as pd
-import requests
-import json
 from typing import Dict, List, Tuple
 import time
 import re
+import os
+import sys
+import argparse
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from brand_common.client import PerplexicaClient
+from brand_common.dedup import BrandIndex
+from brand_common.metrics import NORMAL, QUIET, VERBOSE, PipelineMetrics
+from brand_common.ownership import ANALYSIS, OwnershipGraph
+from brand_common.reader import read_catalog_chunks, write_table
+from brand_common.response import HOLDING_ANALYSIS_SCHEMA, parse_answer
+from brand_common.templates import estimate_tokens, request_tokens
+from brand_common.throttle import CircuitBreaker, backoff_delay
+
+HOLDINGS_COLUMNS = ['Holding', 'Marques', 'Nouvelles Marques']
+SUB_BRANDS_COLUMNS = ['Main Holding Name', 'Brand Name', 'Sub-Brand Name', 'Marque Parente', 'Statut sous marque']
 
 class BrandAnalysis:
-    def __init__(self):
-        self.perplexica_url = "http://localhost:3000/api/search"
+    def __init__(self, client=None, workers=1):
+        # Nombre de holdings analysées en parallèle (1 = une à la fois)
+        self.workers = max(1, workers)
+        # Client HTTP partagé : connexions keep-alive réutilisées d'une holding à l'autre
+        self.client = client or PerplexicaClient(
+            system_instructions="Tu es un expert en marques. Liste les marques manquantes et les sous-marques. Réponds en français avec le format JSON demandé.",
+            optimization_mode="accuracy",
+            max_connections=self.workers,
+            breaker=CircuitBreaker()
+        )
+        # Durées par étape, compteurs et messages selon la verbosité (voir brand_common/metrics.py)
+        self.set_metrics(PipelineMetrics('analysis'))
+        # Fichiers d'entrée et de sortie, au format Parquet si leur extension est .parquet
         self.verified_brands_file = "brand_verification_results.csv"
         self.holdings_brands_file = "holdings_brands.csv"
+        self.sub_brands_file = "sub_brands.csv"
+        # Taille des blocs de lecture du fichier de vérification
+        self.chunksize = 50000
+        self.max_retries = 3
+        self.retry_delay = 30
+        self.max_retry_delay = 120
+        self.search_timeout = 300
+        # Similarité à partir de laquelle deux orthographes sont la même marque (voir brand_common/dedup.py)
+        self.dedup_threshold = 1.0
+        # Graphe de propriété (OwnershipGraph) enrichi des sous-marques trouvées, avec
+        # une confiance fixe (réponses non vérifiées) ; None = désactivé
+        self.ownership = None
+        self.sub_brand_confidence = 80
+
+    def set_metrics(self, metrics):
+        """Remplace l'instrumentation (verbosité, journal JSON Lines, fichier Prometheus), client compris."""
+        self.metrics = metrics
+        self.client.metrics = metrics
 
     def create_prompt(self, holding: str, known_brands: List[str]) -> str:
         """Crée un prompt simple pour vérifier les marques manquantes et les sous-marques."""
@@ -29,79 +73,56 @@ Format JSON:
 
     def verify_holding_brands(self, holding: str, known_brands: List[str]) -> Dict:
         """Vérifie les marques d'une holding via l'API Perplexica."""
-        print(f"\nVérification des marques de {holding}...")
-        
-        payload = {
-            "chatModel": {
-                "provider": "openai",
-                "name": "gpt-4o-mini"
-            },
-            "embeddingModel": {
-                "provider": "openai",
-                "name": "text-embedding-3-large"
-            },
-            "optimizationMode": "accuracy",
-            "focusMode": "webSearch",
-            "query": self.create_prompt(holding, known_brands),
-            "history": [],
-            "systemInstructions": "Tu es un expert en marques. Liste les marques manquantes et les sous-marques. Réponds en français avec le format JSON demandé.",
-            "stream": False
-        }
+        self.metrics.say(VERBOSE, f"\nVérification des marques de {holding}...")
         
-        max_retries = 3
-        retry_delay = 30
-        search_timeout = 300
+        with self.metrics.stage('prompt'):
+            query = self.create_prompt(holding, known_brands)
         
-        for attempt in range(max_retries):
+        for attempt in range(self.max_retries):
             try:
-                response = requests.post(
-                    self.perplexica_url,
-                    json=payload,
-                    timeout=search_timeout
-                )
-                response.raise_for_status()
+                response = self.client.post(query, timeout=self.search_timeout)
                 
                 result = response.json()
+                self.metrics.record_tokens(
+                    request_tokens(estimate_tokens(self.client.system_instructions), query, result))
                 message_content = result.get('message', '{}')
                 
-                if isinstance(message_content, str):
-                    # Nettoyer le contenu JSON
-                    message_content = message_content.replace('```json', '').replace('```', '').strip()
-                    try:
-                        content = json.loads(message_content)
-                        if isinstance(content, dict):
-                            # Vérifier si nous avons au moins une des clés attendues
-                            if 'marques_manquantes' in content or 'sous_marques' in content:
-                                print(f"Réponse reçue pour {holding}")
-                                return content
-                            else:
-                                print(f"Format de réponse invalide pour {holding}")
-                    except json.JSONDecodeError as e:
-                        print(f"Erreur de décodage JSON pour {holding}: {str(e)}")
+                # Extraire le JSON (blocs de code, texte autour, apostrophes, virgules
+                # finales tolérés) et vérifier la présence d'au moins une des clés attendues
+                with self.metrics.stage('parse'):
+                    content = parse_answer(message_content, HOLDING_ANALYSIS_SCHEMA)
+                if content is not None:
+                    self.metrics.say(VERBOSE, f"Réponse reçue pour {holding}")
+                    return content
+                self.metrics.say(VERBOSE, f"Format de réponse invalide pour {holding}")
                 
-                if attempt < max_retries - 1:
-                    print(f"Tentative {attempt + 1} échouée, nouvelle tentative dans {retry_delay} secondes...")
-                    time.sleep(retry_delay)
+                if attempt < self.max_retries - 1:
+                    self.client.record_retry()
+                    delay = backoff_delay(attempt, self.retry_delay, self.max_retry_delay)
+                    self.metrics.say(VERBOSE, f"Tentative {attempt + 1} échouée, nouvelle tentative dans "
+                                              f"{delay:.0f} secondes...")
+                    time.sleep(delay)
                 else:
-                    print(f"Échec de la vérification pour {holding} après toutes les tentatives")
+                    self.metrics.say(NORMAL, f"Échec de la vérification pour {holding} après toutes les tentatives")
                     return None
                     
             except Exception as e:
-                print(f"Erreur lors de la vérification de {holding}: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
+                self.metrics.say(VERBOSE, f"Erreur lors de la vérification de {holding}: {str(e)}")
+                if attempt < self.max_retries - 1:
+                    self.client.record_retry()
+                    time.sleep(backoff_delay(attempt, self.retry_delay, self.max_retry_delay))
                 else:
                     return None
 
     def clean_brand_list(self, brands: List[str]) -> List[str]:
         """Nettoie la liste des marques en supprimant les doublons et en normalisant les noms."""
-        # Normaliser les noms (supprimer les espaces en trop, mettre en minuscules)
-        normalized = [brand.strip().lower() for brand in brands]
-        # Supprimer les doublons tout en préservant l'ordre
+        # Noms sans accents, casse ni ponctuation, orthographes proches rapprochées
+        index = BrandIndex(self.dedup_threshold)
+        # Supprimer les doublons tout en préservant l'ordre (1ère orthographe conservée)
         seen = set()
         cleaned = []
         for brand in brands:
-            norm = brand.strip().lower()
+            norm = index.key('', brand)
             if norm not in seen:
                 seen.add(norm)
                 cleaned.append(brand)
@@ -135,94 +156,185 @@ Format JSON:
                 })
         return sub_brands
 
+    def analyze_holding(self, holding: str, known_brands: List[str]) -> Tuple[Dict, str]:
+        """Analyse une holding sans lever d'exception.
+
+        Retourne (résultat, None) en cas de succès, (None, raison) en cas
+        d'échec : une holding en échec n'interrompt pas les autres.
+        """
+        self.metrics.say(VERBOSE, f"\nTraitement de {holding}...")
+        with self.metrics.unit('holding', holding=holding, brands=len(known_brands)) as unit:
+            try:
+                result = self.verify_holding_brands(holding, known_brands)
+                error = None if result else "aucune réponse valide après toutes les tentatives"
+            except Exception as e:
+                result, error = None, str(e)
+            if error:
+                unit.status, unit.error = 'Échec', error
+        return (result, None) if not error else (None, error)
+
+    def add_holding_result(self, holding, known_brands, result, holdings_records, sub_brand_records, listed_brands):
+        """Ajoute aux listes de sortie les lignes d'une holding et de ses sous-marques.
+
+        `listed_brands` est l'ensemble des 'Brand Name' déjà présents dans
+        `sub_brand_records` : une marque principale n'est ajoutée qu'une fois.
+        Retourne la liste des nouvelles marques.
+        """
+        # Initialiser la liste des nouvelles marques
+        new_brands = []
+        
+        if result:
+            # Traiter les marques manquantes
+            if 'marques_manquantes' in result:
+                new_brands = self.clean_brand_list(result['marques_manquantes'])
+            
+            # Traiter les sous-marques
+            if 'sous_marques' in result:
+                for sub_brand_info in result['sous_marques']:
+                    main_brand = sub_brand_info['marque_principale']
+                    sub_brand = sub_brand_info['sous_marque']
+                    
+                    # Ajouter la marque principale si elle n'existe pas déjà
+                    if main_brand not in listed_brands:
+                        listed_brands.add(main_brand)
+                        sub_brand_records.append({
+                            'Main Holding Name': holding,
+                            'Brand Name': main_brand,
+                            'Sub-Brand Name': '',
+                            'Marque Parente': '',
+                            'Statut sous marque': 'Faux'
+                        })
+                    
+                    if self.ownership is not None:
+                        self.ownership.add(sub_brand, main_brand, self.sub_brand_confidence, 'Sous-marque', ANALYSIS)
+                        self.ownership.add(main_brand, holding, self.sub_brand_confidence, 'Marque', ANALYSIS)
+                    
+                    # Ajouter la sous-marque
+                    listed_brands.add(sub_brand)
+                    sub_brand_records.append({
+                        'Main Holding Name': holding,
+                        'Brand Name': sub_brand,
+                        'Sub-Brand Name': sub_brand,
+                        'Marque Parente': main_brand,
+                        'Statut sous marque': 'Vrai'
+                    })
+        
+        # Ajouter la holding et ses marques
+        holdings_records.append({
+            'Holding': holding,
+            'Marques': ', '.join(known_brands),
+            'Nouvelles Marques': ', '.join(new_brands) if new_brands else 'Aucune'
+        })
+        return new_brands
+
     def process_holdings(self):
         """Traite toutes les holdings et leurs marques."""
         try:
-            # Lire le fichier de vérification
-            df = pd.read_csv(self.verified_brands_file)
-            
-            # Créer un dictionnaire des marques par holding
+            # Lire le fichier de vérification par blocs, seulement les colonnes et les lignes
+            # utiles (filtre évalué à la lecture en Parquet), et créer un dictionnaire des
+            # marques par holding
             holdings_brands = defaultdict(list)
-            for _, row in df.iterrows():
-                if row['Propriété_Directe']:
-                    holdings_brands[row['Holding Name']].append(row['Brand Name'])
+            columns = ['Holding Name', 'Brand Name', 'Propriété_Directe']
+            for chunk in read_catalog_chunks(self.verified_brands_file, self.chunksize, columns, required=columns,
+                                             filters={'Propriété_Directe': True}):
+                for holding, brand in zip(chunk['Holding Name'], chunk['Brand Name']):
+                    holdings_brands[holding].append(brand)
             
-            # Créer les DataFrames pour les fichiers de sortie
-            holdings_df = pd.DataFrame(columns=['Holding', 'Marques', 'Nouvelles Marques'])
-            sub_brands_df = pd.DataFrame(columns=['Main Holding Name', 'Brand Name', 'Sub-Brand Name', 'Marque Parente', 'Statut sous marque'])
+            # Lignes des fichiers de sortie, converties en DataFrames une seule fois à la fin
+            holdings_records = []
+            sub_brand_records = []
+            # Index des 'Brand Name' déjà présents dans les sous-marques
+            listed_brands = set()
             
-            # Pour chaque holding, vérifier les marques manquantes
-            for holding, known_brands in holdings_brands.items():
-                print(f"\nTraitement de {holding}...")
-                
-                # Nettoyer les marques connues
-                known_brands = self.clean_brand_list(known_brands)
-                
-                # Vérifier les marques via l'API
-                result = self.verify_holding_brands(holding, known_brands)
-                
-                # Initialiser la liste des nouvelles marques
-                new_brands = []
-                
-                if result:
-                    # Traiter les marques manquantes
-                    if 'marques_manquantes' in result:
-                        new_brands = self.clean_brand_list(result['marques_manquantes'])
-                    
-                    # Traiter les sous-marques
-                    if 'sous_marques' in result:
-                        for sub_brand_info in result['sous_marques']:
-                            main_brand = sub_brand_info['marque_principale']
-                            sub_brand = sub_brand_info['sous_marque']
-                            
-                            # Ajouter la marque principale si elle n'existe pas déjà
-                            if not any(row['Brand Name'] == main_brand for _, row in sub_brands_df.iterrows()):
-                                sub_brands_df = pd.concat([sub_brands_df, pd.DataFrame([{
-                                    'Main Holding Name': holding,
-                                    'Brand Name': main_brand,
-                                    'Sub-Brand Name': '',
-                                    'Marque Parente': '',
-                                    'Statut sous marque': 'Faux'
-                                }])], ignore_index=True)
-                            
-                            # Ajouter la sous-marque
-                            sub_brands_df = pd.concat([sub_brands_df, pd.DataFrame([{
-                                'Main Holding Name': holding,
-                                'Brand Name': sub_brand,
-                                'Sub-Brand Name': sub_brand,
-                                'Marque Parente': main_brand,
-                                'Statut sous marque': 'Vrai'
-                            }])], ignore_index=True)
-                
-                # Ajouter la holding et ses marques au DataFrame principal
-                holdings_df = pd.concat([holdings_df, pd.DataFrame({
-                    'Holding': [holding],
-                    'Marques': [', '.join(known_brands)],
-                    'Nouvelles Marques': [', '.join(new_brands) if new_brands else 'Aucune']
-                })], ignore_index=True)
+            # Nettoyer les marques connues
+            holdings = [(holding, self.clean_brand_list(brands)) for holding, brands in holdings_brands.items()]
+            failures = []
+            
+            # Vérifier les marques manquantes de plusieurs holdings en parallèle ;
+            # map rend les résultats dans l'ordre des holdings, la sortie ne dépend
+            # donc pas de l'ordre d'arrivée des réponses
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                outcomes = executor.map(lambda item: self.analyze_holding(*item), holdings)
+                for (holding, known_brands), (result, error) in zip(holdings, outcomes):
+                    if error:
+                        failures.append((holding, error))
+                    self.add_holding_result(holding, known_brands, result,
+                                            holdings_records, sub_brand_records, listed_brands)
+            
+            holdings_df = pd.DataFrame(holdings_records, columns=HOLDINGS_COLUMNS)
+            sub_brands_df = pd.DataFrame(sub_brand_records, columns=SUB_BRANDS_COLUMNS)
             
             # Sauvegarder les fichiers
-            holdings_df.to_csv(self.holdings_brands_file, index=False)
-            sub_brands_df.to_csv('sub_brands.csv', index=False)
-            print(f"\nFichiers sauvegardés:")
-            print(f"- {self.holdings_brands_file}")
-            print(f"- sub_brands.csv")
+            write_table(holdings_df, self.holdings_brands_file)
+            write_table(sub_brands_df, self.sub_brands_file)
+            say = self.metrics.say
+            say(NORMAL, f"\nFichiers sauvegardés:\n- {self.holdings_brands_file}\n- {self.sub_brands_file}")
             
             # Afficher un résumé
-            print("\nRésumé:")
-            print(f"Nombre de holdings traitées: {len(holdings_df)}")
-            total_brands = sum(len(row['Marques'].split(', ')) for _, row in holdings_df.iterrows())
-            total_new_brands = sum(len(row['Nouvelles Marques'].split(', ')) if row['Nouvelles Marques'] != 'Aucune' else 0 for _, row in holdings_df.iterrows())
-            print(f"Nombre total de marques (sans doublons): {total_brands}")
-            print(f"Nombre de nouvelles marques détectées: {total_new_brands}")
-            print(f"Nombre de sous-marques identifiées: {len(sub_brands_df[sub_brands_df['Statut sous marque'] == 'Vrai'])}")
+            say(NORMAL, "\nRésumé:")
+            say(NORMAL, f"Nombre de holdings traitées: {len(holdings_df)}")
+            total_brands = sum(len(record['Marques'].split(', ')) for record in holdings_records)
+            total_new_brands = sum(len(record['Nouvelles Marques'].split(', ')) if record['Nouvelles Marques'] != 'Aucune' else 0 for record in holdings_records)
+            say(NORMAL, f"Nombre total de marques (sans doublons): {total_brands}")
+            say(NORMAL, f"Nombre de nouvelles marques détectées: {total_new_brands}")
+            say(NORMAL, f"Nombre de sous-marques identifiées: {sum(record['Statut sous marque'] == 'Vrai' for record in sub_brand_records)}")
+            say(NORMAL, self.client.summary())
+            if self.ownership is not None:
+                say(NORMAL, self.ownership.summary())
+            say(NORMAL, self.metrics.summary())
+            if failures:
+                say(NORMAL, f"\nHoldings en échec ({len(failures)}), conservées sans nouvelles marques:")
+                for holding, error in failures:
+                    say(NORMAL, f"- {holding}: {error}")
             
         except Exception as e:
-            print(f"Erreur lors du traitement: {str(e)}")
+            self.metrics.say(QUIET, f"Erreur lors du traitement: {str(e)}")
             raise e
+        finally:
+            self.metrics.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Analyse des marques manquantes et des sous-marques par holding")
+    parser.add_argument("--input", default="brand_verification_results.csv",
+                        help="Résultats de brand_verification.py (CSV, ou Parquet si l'extension est .parquet)")
+    parser.add_argument("--holdings-output", default="holdings_brands.csv",
+                        help="Fichier des marques par holding (CSV, ou Parquet si l'extension est .parquet)")
+    parser.add_argument("--sub-brands-output", default="sub_brands.csv",
+                        help="Fichier des sous-marques (CSV, ou Parquet si l'extension est .parquet)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Nombre de holdings analysées en parallèle (1 = une à la fois)")
+    parser.add_argument("--dedup-threshold", type=float, default=1.0,
+                        help="Similarité (0-1) à partir de laquelle deux orthographes d'une marque sont "
+                             "dédupliquées (0.9 par exemple) ; 1 = accents, casse, ponctuation et ordre des "
+                             "mots seulement (défaut)")
+    parser.add_argument("--ownership-graph", default=None,
+                        help="Fichier SQLite du graphe de propriété où ajouter les sous-marques trouvées "
+                             "(sous-marque → marque → holding)")
+    parser.add_argument("--sub-brand-confidence", type=float, default=80,
+                        help="Confiance donnée aux liens de sous-marques dans le graphe de propriété")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="Détail par holding (-v)")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="N'affiche que les erreurs fatales")
+    parser.add_argument("--log-file", default=None,
+                        help="Journal JSON Lines des mesures par holding (durée par étape, requêtes, "
+                             "nouvelles tentatives, tokens)")
+    parser.add_argument("--metrics-file", default=None,
+                        help="Fichier texte au format Prometheus des cumuls, réécrit pendant le traitement")
+    return parser.parse_args()
 
 def main():
-    analyzer = BrandAnalysis()
+    args = parse_args()
+    analyzer = BrandAnalysis(workers=args.workers)
+    analyzer.verified_brands_file = args.input
+    analyzer.holdings_brands_file = args.holdings_output
+    analyzer.sub_brands_file = args.sub_brands_output
+    analyzer.dedup_threshold = args.dedup_threshold
+    if args.ownership_graph:
+        analyzer.ownership = OwnershipGraph(args.ownership_graph)
+        analyzer.sub_brand_confidence = args.sub_brand_confidence
+    analyzer.set_metrics(PipelineMetrics('analysis', QUIET if args.quiet else NORMAL + args.verbose,
+                                         args.log_file, args.metrics_file))
     analyzer.process_holdings()
 
 if __name__ == "__main__":
@@ -0,0 +1,54 @@
+from brand_common.cache import normalize_key_part
+from brand_common.response import extract_json
+
+
+def make_batches(pairs, batch_size, key=None):
+    """Regroupe des paires (holding, marque) par holding en lots d'au plus `batch_size` marques.
+
+    Les doublons sont ignorés et l'ordre d'apparition est conservé. Avec
+    `key(holding, marque)`, seules les paires de même clé partagent un lot
+    (même template de prompt, par exemple).
+    """
+    by_holding = {}
+    for holding, brand in pairs:
+        group = (holding, key(holding, brand) if key is not None else None)
+        brands = by_holding.setdefault(group, [])
+        if brand not in brands:
+            brands.append(brand)
+    batches = []
+    for (holding, _), brands in by_holding.items():
+        for start in range(0, len(brands), batch_size):
+            batches.append((holding, brands[start:start + batch_size]))
+    return batches
+
+
+def extract_batch_items(message, brands, brand_field='brand'):
+    """Découpe une réponse en tableau JSON en {marque demandée: objet}.
+
+    Les objets sont associés aux marques par nom normalisé. Retourne None si
+    la réponse ne contient pas de tableau JSON exploitable (voir
+    response.extract_json) ; les marques absentes du tableau sont simplement
+    omises.
+    """
+    items = extract_json(message, list)
+    if items is None:
+        return None
+
+    wanted = {normalize_key_part(brand): brand for brand in brands}
+    found = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        brand = wanted.get(normalize_key_part(item.get(brand_field, '')))
+        if brand is not None and brand not in found:
+            found[brand] = item
+    return found
+
+
+def source_mentions(source, brand):
+    """Indique si une source de l'API (dict metadata) mentionne la marque."""
+    if not isinstance(source, dict):
+        return False
+    metadata = source.get('metadata', {})
+    text = ' '.join(str(metadata.get(field, '')) for field in ('title', 'url', 'content'))
+    return normalize_key_part(brand) in normalize_key_part(text)
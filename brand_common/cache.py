@@ -0,0 +1,132 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def normalize_key_part(value):
+    """Normalise un nom de holding ou de marque pour la clé de cache."""
+    return ' '.join(str(value).split()).casefold()
+
+
+class VerificationCache:
+    """Cache SQLite des résultats de vérification, partagé entre exécutions.
+
+    Les entrées sont adressées par le contenu : holding et marque normalisées,
+    version du template de prompt et nom du modèle. Elles expirent après
+    `ttl` secondes et le nombre d'entrées est borné (éviction LRU).
+    """
+
+    def __init__(self, path="verification_cache.sqlite", ttl=30 * 24 * 3600, max_entries=100000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS verification_cache (
+                key TEXT PRIMARY KEY,
+                holding TEXT,
+                brand TEXT,
+                prompt_version TEXT,
+                model TEXT,
+                value TEXT,
+                created_at REAL,
+                accessed_at REAL
+            )
+        """)
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_verification_cache_accessed ON verification_cache (accessed_at)"
+        )
+        self.connection.commit()
+        # Taille tenue à jour en mémoire pour éviter un COUNT(*) à chaque écriture
+        self.size = self.connection.execute("SELECT COUNT(*) FROM verification_cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(holding, brand, prompt_version, model, variant=''):
+        """Clé SHA-256 des paramètres qui déterminent la réponse du modèle."""
+        parts = [normalize_key_part(holding), normalize_key_part(brand), prompt_version, model, variant]
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def get(self, holding, brand, prompt_version, model, variant=''):
+        """Retourne le résultat en cache, ou None s'il est absent ou expiré."""
+        key = self.make_key(holding, brand, prompt_version, model, variant)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value, created_at FROM verification_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self.connection.execute("DELETE FROM verification_cache WHERE key = ?", (key,))
+                self.connection.commit()
+                self.size -= 1
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self.connection.execute(
+                "UPDATE verification_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self.connection.commit()
+            self.stats['hits'] += 1
+        return json.loads(value)
+
+    def seen(self, holding, brand, prompt_version, model, variant=''):
+        """Indique si une entrée a déjà été enregistrée, même expirée (historique des exécutions)."""
+        key = self.make_key(holding, brand, prompt_version, model, variant)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM verification_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None
+
+    def put(self, holding, brand, prompt_version, model, value, variant=''):
+        """Enregistre un résultat puis applique la limite de taille."""
+        key = self.make_key(holding, brand, prompt_version, model, variant)
+        now = time.time()
+        with self.lock:
+            exists = self.connection.execute(
+                "SELECT 1 FROM verification_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if exists is None:
+                self.size += 1
+            self.connection.execute(
+                "INSERT OR REPLACE INTO verification_cache "
+                "(key, holding, brand, prompt_version, model, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, str(holding), str(brand), prompt_version, model,
+                 json.dumps(value, ensure_ascii=False), now, now)
+            )
+            self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        # Supprime les entrées les moins récemment utilisées au-delà de max_entries
+        if self.max_entries is None:
+            return
+        excess = self.size - self.max_entries
+        if excess > 0:
+            self.connection.execute(
+                "DELETE FROM verification_cache WHERE key IN ("
+                "SELECT key FROM verification_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (excess,)
+            )
+            self.stats['evicted'] += excess
+            self.size -= excess
+
+    def summary(self):
+        """Résumé lisible des compteurs de la session."""
+        total = self.stats['hits'] + self.stats['misses']
+        hit_rate = (self.stats['hits'] / total * 100) if total else 0
+        return (f"Cache: {self.stats['hits']} hits, {self.stats['misses']} misses "
+                f"({hit_rate:.1f}% de hits), {self.stats['expired']} expirés, {self.stats['evicted']} évincés")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
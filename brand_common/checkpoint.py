@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+import time
+
+
+def row_key(index, holding, brand):
+    """Identifiant d'une ligne du fichier d'origine dans le journal."""
+    return f"{index}|{holding}|{brand}"
+
+
+class CheckpointJournal:
+    """Journal append-only des lignes terminées (clé de ligne -> résultat).
+
+    Les enregistrements sont des lignes JSON écrites en un seul appel `write`
+    sur un descripteur ouvert en O_APPEND, puis synchronisées sur disque : les
+    écritures de plusieurs threads ou processus ne s'entremêlent pas, et une
+    ligne tronquée par un crash est ignorée à la relecture.
+
+    Les lignes sont regroupées et écrites toutes les `flush_rows` lignes ou
+    toutes les `flush_interval` secondes ; un crash perd au plus ce lot.
+    """
+
+    def __init__(self, path, fsync=True, flush_rows=1, flush_interval=None):
+        self.path = path
+        self.fsync = fsync
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.fd = None
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.skipped_lines = 0
+
+    def load(self):
+        """Relit le journal et retourne {clé: résultat} des lignes terminées."""
+        completed = {}
+        self.skipped_lines = 0
+        if not os.path.exists(self.path):
+            return completed
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                    completed[record['key']] = record['result']
+                except (ValueError, KeyError, TypeError):
+                    # Écriture partielle (crash au milieu d'une ligne)
+                    self.skipped_lines += 1
+        return completed
+
+    def open(self, resume=False):
+        """Ouvre le journal en ajout ; sans reprise, l'ancien journal est vidé."""
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        if not resume:
+            flags |= os.O_TRUNC
+        self.fd = os.open(self.path, flags, 0o644)
+        # Terminer une éventuelle ligne tronquée pour ne pas la coller à la suivante
+        size = os.fstat(self.fd).st_size
+        if size:
+            with open(self.path, 'rb') as f:
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    os.write(self.fd, b'\n')
+        return self
+
+    def append(self, key, result):
+        """Ajoute un enregistrement ; le lot est écrit quand un seuil est atteint."""
+        line = json.dumps({'key': key, 'result': result}, ensure_ascii=False, default=str) + '\n'
+        with self.lock:
+            self.buffer.append(line)
+            interval_elapsed = (self.flush_interval is not None
+                                and time.monotonic() - self.last_flush >= self.flush_interval)
+            if len(self.buffer) >= self.flush_rows or interval_elapsed:
+                self._flush()
+
+    def _flush(self):
+        # Un seul write pour tout le lot, puis synchronisation disque
+        if self.buffer:
+            data = ''.join(self.buffer).encode('utf-8')
+            written = os.write(self.fd, data)
+            while written < len(data):
+                written += os.write(self.fd, data[written:])
+            if self.fsync:
+                os.fsync(self.fd)
+            self.buffer = []
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                self._flush()
+                os.close(self.fd)
+                self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
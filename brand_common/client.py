@@ -0,0 +1,383 @@
+import contextvars
+import functools
+import gzip
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from brand_common.response import StreamingJsonParser
+
+
+class PerplexicaClient:
+    """Client HTTP de l'API /api/search de Perplexica, partagé par les trois modules.
+
+    Une seule session requests garde un pool de connexions keep-alive
+    (`max_connections` au plus). Les parties fixes du payload (modèles,
+    instructions système, modes) sont sérialisées une fois : chaque requête
+    n'encode plus que la question. Les réponses gzip sont acceptées ; la
+    compression des requêtes est optionnelle car tous les déploiements de
+    Perplexica ne décodent pas `Content-Encoding: gzip`.
+
+    Avec `stream_responses`, la réponse est lue en flux (voir post_stream) ;
+    `stop_early` coupe la génération dès que les champs requis du schéma
+    sont complets. Avec `hedge` (HedgePolicy), une requête trop lente est
+    doublée et la première réponse valide est gardée (voir post_hedged).
+    `metrics` (PipelineMetrics, voir set_metrics des vérificateurs) reçoit
+    la durée HTTP de chaque requête et les nouvelles tentatives.
+    """
+
+    def __init__(self, url="http://localhost:3000/api/search", chat_model="gpt-4o-mini",
+                 embedding_model="text-embedding-3-large", system_instructions="",
+                 optimization_mode="speed", focus_mode="webSearch", max_connections=10,
+                 timeout=60, compress_requests=False, compress_min_size=1024,
+                 limiter=None, breaker=None, stream_responses=False, stop_early=False, hedge=None):
+        self.url = url
+        self.chat_model = chat_model
+        self.embedding_model = embedding_model
+        self.system_instructions = system_instructions
+        self.optimization_mode = optimization_mode
+        self.focus_mode = focus_mode
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.compress_requests = compress_requests
+        self.compress_min_size = compress_min_size
+        # Limiteur de débit (RateLimiter) et disjoncteur (CircuitBreaker) optionnels,
+        # partagés par tous les workers qui utilisent ce client
+        self.limiter = limiter
+        self.breaker = breaker
+        self.stream_responses = stream_responses
+        self.stop_early = stop_early
+        # Requêtes de couverture : les copies passent par un pool de threads dédié
+        self.hedge = hedge
+        self.hedge_pool = ThreadPoolExecutor(max_workers=max_connections * 2) if hedge is not None else None
+        self.metrics = None
+        self.headers = {'Content-Type': 'application/json', 'Accept-Encoding': 'gzip, deflate'}
+        # Début du corps JSON sérialisé, par modèle de chat, modes et instructions système
+        self.prefixes = {}
+
+        self.session = requests.Session()
+        # pool_block: au-delà de max_connections, on attend une connexion libre
+        # plutôt que d'ouvrir des connexions jetables (copies des requêtes de couverture comprises)
+        pool_size = max_connections * 2 if hedge is not None else max_connections
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(self.headers)
+
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0,
+                      'bytes_sent': 0, 'streamed': 0, 'verdicts': 0, 'verdict_time': 0.0,
+                      'stopped_early': 0, 'retries': 0}
+
+    def payload_prefix(self, chat_model=None, stream=False, optimization_mode=None, focus_mode=None,
+                       system_instructions=None):
+        """Parties fixes du payload, sérialisées une seule fois par combinaison de modèle, modes et instructions."""
+        key = (chat_model or self.chat_model, stream, optimization_mode or self.optimization_mode,
+               focus_mode or self.focus_mode,
+               self.system_instructions if system_instructions is None else system_instructions)
+        chat_model, stream, optimization_mode, focus_mode, system_instructions = key
+        prefix = self.prefixes.get(key)
+        if prefix is None:
+            fixed = json.dumps({
+                "chatModel": {
+                    "provider": "openai",
+                    "name": chat_model
+                },
+                "embeddingModel": {
+                    "provider": "openai",
+                    "name": self.embedding_model
+                },
+                "optimizationMode": optimization_mode,
+                "focusMode": focus_mode,
+                "history": [],
+                "systemInstructions": system_instructions,
+                "stream": stream
+            }, ensure_ascii=False)
+            # Le corps final est {<parties fixes>, "query": <question>}
+            prefix = (fixed[:-1] + ', "query": ').encode('utf-8')
+            self.prefixes[key] = prefix
+        return prefix
+
+    def encode(self, query, chat_model=None, stream=False, optimization_mode=None, focus_mode=None,
+               system_instructions=None):
+        """Corps JSON de la requête pour une question."""
+        prefix = self.payload_prefix(chat_model, stream, optimization_mode, focus_mode, system_instructions)
+        return prefix + json.dumps(query, ensure_ascii=False).encode('utf-8') + b'}'
+
+    def build_payload(self, query, chat_model=None):
+        """Payload sous forme de dict (affichage, débogage)."""
+        return json.loads(self.encode(query, chat_model))
+
+    def prepare_body(self, query, chat_model=None, stream=False, optimization_mode=None, focus_mode=None,
+                     system_instructions=None):
+        """Corps et en-têtes supplémentaires, avec compression gzip éventuelle."""
+        body = self.encode(query, chat_model, stream, optimization_mode, focus_mode, system_instructions)
+        if self.compress_requests and len(body) >= self.compress_min_size:
+            return gzip.compress(body, compresslevel=5), {'Content-Encoding': 'gzip'}
+        return body, {}
+
+    def record(self, elapsed, error, bytes_sent=0, sample=True, ticket=None):
+        """Comptabilise la durée d'une requête (utilisé aussi par le moteur asyncio).
+
+        `sample=False` exclut la durée des mesures de la HedgePolicy et l'issue
+        du disjoncteur (requête annulée parce que sa copie a répondu avant).
+        `ticket` est celui que le disjoncteur a donné à l'envoi.
+        """
+        if self.breaker is not None:
+            if sample:
+                self.breaker.record(error, self.metrics, ticket)
+            else:
+                self.breaker.release(ticket)
+        if self.hedge is not None and sample and not error:
+            self.hedge.record(elapsed)
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['total_time'] += elapsed
+            self.stats['max_time'] = max(self.stats['max_time'], elapsed)
+            self.stats['bytes_sent'] += bytes_sent
+            if error:
+                self.stats['errors'] += 1
+        if self.metrics is not None:
+            self.metrics.count('requests')
+            self.metrics.observe('http', elapsed)
+
+    def record_retry(self):
+        """Comptabilise une nouvelle tentative décidée par un vérificateur (erreur ou réponse invalide)."""
+        with self.lock:
+            self.stats['retries'] += 1
+        if self.metrics is not None:
+            self.metrics.count('retries')
+
+    def record_stream(self, collector):
+        """Comptabilise le délai jusqu'au verdict d'une réponse lue en flux."""
+        with self.lock:
+            self.stats['streamed'] += 1
+            if collector.verdict_time is not None:
+                self.stats['verdicts'] += 1
+                self.stats['verdict_time'] += collector.verdict_time
+            if collector.stopped_early:
+                self.stats['stopped_early'] += 1
+
+    def post(self, query, timeout=None, chat_model=None, schema=None, optimization_mode=None, focus_mode=None,
+             system_instructions=None):
+        """Envoie une question et retourne la réponse (HTTPError si statut d'erreur).
+
+        `response.elapsed_time` contient la durée totale de l'appel,
+        lecture du corps comprise. En mode `stream_responses`, la réponse
+        est lue en flux et `schema` (ResponseSchema) définit le verdict.
+        `chat_model`, `optimization_mode` et `focus_mode` remplacent ceux du
+        client pour cet appel (paliers de vérification), `system_instructions`
+        ses instructions système (templates de prompt).
+        """
+        send = functools.partial(self.send, query, timeout, chat_model, schema, optimization_mode, focus_mode,
+                                 system_instructions)
+        if self.hedge is None:
+            return send()
+        return self.post_hedged(send)
+
+    def post_hedged(self, send):
+        """Appelle `send` et le relance une fois si la réponse tarde (requête de couverture).
+
+        La copie part après le délai donné par la HedgePolicy ; la première
+        réponse valide est retournée, l'autre requête se termine en arrière-plan.
+        """
+        delay = self.hedge.delay()
+        if delay is None:
+            return send()
+        # Les requêtes partent dans le contexte de l'appelant : leurs mesures restent attribuées à sa ligne
+        pending = {self.hedge_pool.submit(contextvars.copy_context().run, send)}
+        done, _ = wait(pending, timeout=delay)
+        copy = None
+        if not done and self.hedge.try_hedge():
+            copy = self.hedge_pool.submit(contextvars.copy_context().run, send)
+            pending.add(copy)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is copy:
+                    self.hedge.record_win()
+                return response
+        raise error
+
+    def send(self, query, timeout=None, chat_model=None, schema=None, optimization_mode=None, focus_mode=None,
+             system_instructions=None):
+        """Un envoi de la question (voir post), sans requête de couverture."""
+        if self.stream_responses:
+            return self.post_stream(query, timeout, chat_model, schema, optimization_mode, focus_mode,
+                                    system_instructions)
+        body, headers = self.prepare_body(query, chat_model, False, optimization_mode, focus_mode,
+                                          system_instructions)
+        ticket = self.breaker.wait() if self.breaker is not None else None
+        with self.limiter.slot() if self.limiter is not None else nullcontext():
+            start = time.perf_counter()
+            error = True
+            try:
+                response = self.session.post(self.url, data=body, headers=headers,
+                                             timeout=timeout or self.timeout)
+                response.raise_for_status()
+                # Lecture (et décompression) du corps dans la mesure de temps
+                response.content
+                error = False
+            finally:
+                elapsed = time.perf_counter() - start
+                self.record(elapsed, error, len(body), ticket=ticket)
+        response.elapsed_time = elapsed
+        return response
+
+    def post_stream(self, query, timeout=None, chat_model=None, schema=None, optimization_mode=None,
+                    focus_mode=None, system_instructions=None):
+        """Envoie une question avec `"stream": true` et lit les événements au fil de l'eau.
+
+        Retourne une StreamedResponse (json(), text, elapsed_time,
+        verdict_time). Si `stop_early` est actif, la connexion est fermée dès
+        que les champs requis de `schema` sont complets, ce qui interrompt la
+        génération ; le message est alors réduit à ces champs.
+        """
+        body, headers = self.prepare_body(query, chat_model, True, optimization_mode, focus_mode,
+                                          system_instructions)
+        ticket = self.breaker.wait() if self.breaker is not None else None
+        with self.limiter.slot() if self.limiter is not None else nullcontext():
+            collector = StreamCollector(schema, self.stop_early)
+            error = True
+            try:
+                response = self.session.post(self.url, data=body, headers=headers,
+                                             timeout=timeout or self.timeout, stream=True)
+                try:
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        if collector.feed_line(line):
+                            break
+                finally:
+                    # Flux non lu jusqu'au bout : la connexion est fermée, pas recyclée
+                    response.close()
+                error = False
+            finally:
+                elapsed = collector.elapsed()
+                self.record(elapsed, error, len(body), ticket=ticket)
+        self.record_stream(collector)
+        return StreamedResponse(collector, response.status_code, elapsed)
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+        average = stats['total_time'] / stats['requests'] if stats['requests'] else 0.0
+        summary = (f"Perplexica: {stats['requests']} requêtes, {stats['errors']} erreurs, "
+                   f"durée moyenne {average:.2f}s, max {stats['max_time']:.2f}s")
+        if stats['retries']:
+            summary += f", {stats['retries']} nouvelles tentatives"
+        if self.limiter is not None:
+            summary += (f", {self.limiter.stats['throttled']} requêtes retardées "
+                        f"({self.limiter.stats['wait_time']:.1f}s)")
+        if stats['streamed']:
+            verdict = stats['verdict_time'] / stats['verdicts'] if stats['verdicts'] else 0.0
+            summary += (f", {stats['streamed']} réponses en flux (verdict après {verdict:.2f}s en moyenne, "
+                        f"{stats['stopped_early']} coupées)")
+        if self.hedge is not None:
+            summary += f", {self.hedge.summary()}"
+        if self.breaker is not None:
+            summary += (f", disjoncteur ouvert {self.breaker.stats['opened']} fois "
+                        f"({self.breaker.stats['paused_time']:.1f}s de pause)")
+        return summary
+
+    def close(self):
+        if self.hedge_pool is not None:
+            # Les requêtes perdantes encore en vol ne sont pas attendues
+            self.hedge_pool.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+        if self.limiter is not None:
+            self.limiter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StreamCollector:
+    """Réassemble une réponse en flux de /api/search (une ligne JSON par événement).
+
+    Événements lus : `sources`, `response` (morceau du message), `done` et
+    `error`. Le message est analysé au fil de l'eau avec StreamingJsonParser ;
+    `verdict_time` est le délai jusqu'à ce que les champs requis de `schema`
+    soient complets.
+    """
+
+    def __init__(self, schema=None, stop_early=False):
+        self.schema = schema
+        self.stop_early = stop_early and schema is not None
+        self.parser = StreamingJsonParser() if schema is not None else None
+        self.chunks = []
+        self.sources = []
+        self.start = time.perf_counter()
+        self.verdict_time = None
+        self.stopped_early = False
+        self.done = False
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def feed_line(self, line):
+        """Traite une ligne du flux ; retourne True quand la lecture peut s'arrêter."""
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            return False
+        event = json.loads(line)
+        kind = event.get('type')
+        if kind == 'sources':
+            self.sources = event.get('data') or []
+        elif kind == 'response':
+            chunk = event.get('data') or ''
+            self.chunks.append(chunk)
+            if self.parser is not None and self.verdict_time is None:
+                if self.schema.validate(self.parser.feed(chunk)) is not None:
+                    self.verdict_time = self.elapsed()
+                    if self.stop_early:
+                        self.stopped_early = True
+                        return True
+        elif kind == 'done':
+            self.done = True
+            return True
+        elif kind == 'error':
+            raise ValueError(f"Erreur dans le flux Perplexica: {event.get('data')}")
+        return False
+
+    def result(self):
+        """Réponse au format non streamé : {'message': ..., 'sources': ...}."""
+        if self.stopped_early:
+            # Génération coupée : seuls les champs complets sont gardés
+            message = json.dumps(self.parser.fields, ensure_ascii=False)
+        else:
+            message = ''.join(self.chunks)
+        return {'message': message, 'sources': self.sources}
+
+
+class StreamedResponse:
+    """Résultat de post_stream, utilisable comme une réponse requests (json(), text)."""
+
+    def __init__(self, collector, status_code, elapsed_time):
+        self.status_code = status_code
+        self.elapsed_time = elapsed_time
+        self.verdict_time = collector.verdict_time
+        self.stopped_early = collector.stopped_early
+        self.result = collector.result()
+
+    def json(self):
+        return self.result
+
+    @property
+    def text(self):
+        return json.dumps(self.result, ensure_ascii=False)
@@ -0,0 +1,192 @@
+import ast
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # dépendance optionnelle : seul le format CSV est alors disponible
+    pa = None
+
+# Extensions des fichiers lus et écrits au format Parquet
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+
+# Colonnes typées des fichiers de résultats ; les autres colonnes sont écrites en texte
+BOOL_COLUMNS = ['Propriété_Directe', 'À_Vérifier', 'Chaîne_Propriété']
+FLOAT_COLUMNS = ['Score_Confiance']
+INT_COLUMNS = ['Sources_Officielles', 'Sources_Récentes', 'Nb_Sources']
+SOURCES_COLUMN = 'Sources'
+
+
+def is_parquet(path):
+    """True si le chemin désigne un fichier Parquet (d'après son extension)."""
+    return str(path).lower().endswith(PARQUET_EXTENSIONS)
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("Le format Parquet nécessite pyarrow (pip install pyarrow) ; "
+                          "utilisez un fichier .csv sinon")
+
+
+def source_type():
+    return pa.list_(pa.struct([('title', pa.string()), ('url', pa.string())]))
+
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def parse_source(source):
+    """Source d'un des deux pipelines ({'title', 'url'}, dict Perplexica ou texte "titre - url") en dict."""
+    if isinstance(source, dict):
+        metadata = source.get('metadata', source)
+        return {'title': metadata.get('title'), 'url': metadata.get('url')}
+    text = str(source).strip()
+    title, separator, url = text.rpartition(' - ')
+    if separator and '://' in url:
+        return {'title': title, 'url': url}
+    if '://' in text and ' ' not in text:
+        return {'title': None, 'url': text}
+    return {'title': text, 'url': None}
+
+
+def parse_sources(value):
+    """Liste de sources {'title', 'url'} d'une cellule Sources.
+
+    Accepte le texte joint par " | " de brand_verification, la liste (ou sa
+    représentation texte, relue d'un CSV) de brand_verification_multiprocessing
+    et la liste relue d'un fichier Parquet.
+    """
+    if is_missing(value):
+        return []
+    if isinstance(value, str):
+        text = value.strip()
+        if not text:
+            return []
+        if text.startswith('['):
+            try:
+                value = ast.literal_eval(text)
+            except (ValueError, SyntaxError):
+                value = [text]
+        else:
+            value = [source for source in text.split(' | ') if source]
+    return [parse_source(source) for source in value if not is_missing(source)]
+
+
+def source_strings(value):
+    """Sources d'une cellule sous forme de textes "titre - url", comme dans les CSV de brand_verification."""
+    return [' - '.join(part for part in (source['title'], source['url']) if part)
+            for source in parse_sources(value)]
+
+
+def to_bool(value):
+    if is_missing(value):
+        return None
+    if isinstance(value, str):
+        return value.strip().casefold() in ('true', 'vrai', '1', '1.0')
+    return bool(value)
+
+
+def to_int(value):
+    if is_missing(value) or value == '':
+        return None
+    return int(float(value))
+
+
+def column_array(name, values):
+    """Colonne Arrow typée d'un DataFrame de résultats."""
+    if name in BOOL_COLUMNS:
+        return pa.array([to_bool(value) for value in values], type=pa.bool_())
+    if name in FLOAT_COLUMNS:
+        return pa.array(pd.to_numeric(values, errors='coerce').astype('float32'), type=pa.float32(),
+                        from_pandas=True)
+    if name in INT_COLUMNS:
+        return pa.array([to_int(value) for value in values], type=pa.int32())
+    if name == SOURCES_COLUMN:
+        return pa.array([parse_sources(value) for value in values], type=source_type())
+    return pa.array([None if is_missing(value) else str(value) for value in values], type=pa.string())
+
+
+def to_arrow(df):
+    """Table Arrow d'un DataFrame : booléens, score en float32, sources en list<struct<title, url>>."""
+    require_pyarrow()
+    return pa.Table.from_arrays([column_array(name, df[name].tolist()) for name in df.columns],
+                                names=[str(name) for name in df.columns])
+
+
+def from_arrow(table):
+    """DataFrame d'une table Arrow ; les sources sont rendues en listes de dicts {'title', 'url'}."""
+    df = table.to_pandas()
+    for name in FLOAT_COLUMNS:
+        if name in df.columns:
+            # Écriture décimale la plus courte du float32 : 52.44 et non 52.439998626708984
+            df[name] = df[name].astype(str).astype(float)
+    if SOURCES_COLUMN in df.columns:
+        df[SOURCES_COLUMN] = [[] if value is None else list(value) for value in df[SOURCES_COLUMN]]
+    return df
+
+
+def filter_expression(filters):
+    """Expression de filtre Arrow d'un dict {colonne: valeur} (égalités combinées par ET)."""
+    expression = None
+    for column, value in filters.items():
+        condition = ds.field(column) == value
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def write_parquet(df, path):
+    """Écrit un DataFrame de résultats dans un fichier Parquet typé."""
+    require_pyarrow()
+    pq.write_table(to_arrow(df), path, compression='zstd')
+
+
+def read_parquet_chunks(path, chunksize=5000, columns=None, required=(), filters=None):
+    """Lit un fichier Parquet par blocs d'au plus `chunksize` lignes, comme reader.read_catalog_chunks.
+
+    Seules `columns` sont lues (None = toutes) ; `filters` ({colonne: valeur})
+    est évalué par Arrow à la lecture : les groupes de lignes dont les
+    statistiques excluent la valeur ne sont pas décodés.
+    """
+    require_pyarrow()
+    dataset = ds.dataset(path, format='parquet')
+    header = dataset.schema.names
+    missing = [col for col in required if col not in header]
+    if missing:
+        raise ValueError(f"Colonnes manquantes dans {path}: {', '.join(missing)}")
+    usecols = [col for col in columns if col in header] if columns is not None else None
+    scanner = dataset.scanner(columns=usecols, filter=filter_expression(filters) if filters else None,
+                              batch_size=chunksize)
+    start = 0
+    for batch in scanner.to_batches():
+        if not batch.num_rows:
+            continue
+        chunk = from_arrow(pa.Table.from_batches([batch]))
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        yield chunk
+
+
+class ChunkedParquetWriter:
+    """Ajoute des blocs de DataFrame à un fichier Parquet, un groupe de lignes par bloc.
+
+    Le schéma est fixé par le premier bloc ; `close` termine le fichier.
+    """
+
+    def __init__(self, path):
+        require_pyarrow()
+        self.path = path
+        self.writer = None
+
+    def write(self, chunk):
+        table = to_arrow(chunk)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema, compression='zstd')
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
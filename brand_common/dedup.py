@@ -0,0 +1,155 @@
+import re
+import unicodedata
+
+# Tout ce qui n'est ni lettre ni chiffre sépare deux mots (ponctuation, tirets, apostrophes, symboles)
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def normalize_name(value):
+    """Forme canonique d'un nom de holding ou de marque : sans accents ni casse, ponctuation et espaces réduits.
+
+    "L'Oréal", "L OREAL" et " l’oréal " donnent tous "l oreal".
+    """
+    decomposed = unicodedata.normalize('NFKD', str(value))
+    folded = ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    return ' '.join(_SEPARATORS.sub(' ', folded).split())
+
+
+def bounded_distance(a, b, limit):
+    """Distance d'édition (Levenshtein) entre `a` et `b`, ou `limit + 1` dès qu'elle dépasse `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+class BrandIndex:
+    """Index des quasi-doublons de paires (holding, marque), pour ne vérifier qu'une fois chaque marque.
+
+    Les noms sont d'abord normalisés (`normalize_name`) : deux paires de même
+    forme normalisée, de mêmes mots dans un autre ordre ou de mêmes lettres
+    sans espaces ("COCA-COLA", "Coca Cola", "COCACOLA") sont la même paire.
+    C'est le seul rapprochement par défaut (`threshold=1`).
+
+    Avec `threshold` < 1, une marque est aussi rapprochée d'une marque déjà
+    vue de la même holding si leurs mots triés sont à une distance d'édition
+    d'au plus `1 - threshold` de la longueur ("NUTELLA BISCUITS" et
+    "NUTELLA BISCUIT" à 0,9 ; les noms de moins de 10 lettres ne sont jamais
+    rapprochés). Les chiffres doivent être identiques ("BRAND 10" n'est pas
+    "BRAND 11"). Une lettre d'écart peut aussi séparer deux marques
+    distinctes ("KINDER BUENO" et "KINDER BUENA") : ce rapprochement est à
+    réserver aux catalogues dont les fautes de saisie sont connues.
+
+    Les comparaisons approchées se limitent aux marques d'un même bloc (même
+    holding, mêmes chiffres, mêmes 3 premières ou 3 dernières lettres) et
+    à `max_candidates` marques par bloc, ce qui tient sur 100 000 marques.
+    """
+
+    def __init__(self, threshold=1.0, max_candidates=200):
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        # Paire telle qu'écrite dans le catalogue -> clé canonique
+        self.keys = {}
+        # Forme exacte (nom normalisé, mots triés ou lettres sans espaces) -> clé canonique
+        self.exact = {}
+        # Bloc -> marques déjà indexées (mots triés, chiffres, clé canonique)
+        self.blocks = {}
+        self.stats = {'pairs': 0, 'merged': 0, 'fuzzy': 0}
+
+    def key(self, holding, brand):
+        """Clé canonique de la paire : celle de la première orthographe indexée de la marque."""
+        canonical = self.keys.get((holding, brand))
+        if canonical is None:
+            canonical = self.keys[(holding, brand)] = self.index(holding, brand)
+        return canonical
+
+    def describe(self, holding, brand):
+        """Clé propre, mots triés, formes exactes et blocs de comparaison d'une paire."""
+        holding_name = normalize_name(holding)
+        name = normalize_name(brand)
+        tokens = name.split()
+        sorted_name = ' '.join(sorted(tokens))
+        forms = [(holding_name, name), (holding_name, sorted_name), (holding_name, name.replace(' ', ''))]
+        digits = tuple(sorted(token for token in tokens if any(char.isdigit() for char in token)))
+        compact = sorted_name.replace(' ', '')
+        blocks = [(holding_name, digits, 'prefix', compact[:3]), (holding_name, digits, 'suffix', compact[-3:])]
+        return f"{holding_name}\x1f{name}", sorted_name, forms, blocks
+
+    def index(self, holding, brand):
+        own_key, sorted_name, forms, blocks = self.describe(holding, brand)
+        for form in forms:
+            if form in self.exact:
+                canonical = self.exact[form]
+                self.remember(forms, canonical)
+                self.stats['merged'] += 1
+                return canonical
+
+        canonical = self.find_similar(sorted_name, blocks)[0] if self.threshold < 1 else None
+        if canonical is None:
+            canonical = own_key
+            self.stats['pairs'] += 1
+            for block in blocks:
+                members = self.blocks.setdefault(block, [])
+                if len(members) < self.max_candidates:
+                    members.append((sorted_name, canonical))
+        else:
+            self.stats['merged'] += 1
+            self.stats['fuzzy'] += 1
+        self.remember(forms, canonical)
+        return canonical
+
+    def find(self, holding, brand):
+        """Marque déjà indexée qui correspond à la paire, sans l'indexer : (clé canonique, distance).
+
+        La distance vaut 0 pour une forme exacte. Sans marque assez proche,
+        retourne (None, None) ; si plusieurs marques distinctes sont aussi
+        proches, (None, distance).
+        """
+        _, sorted_name, forms, blocks = self.describe(holding, brand)
+        for form in forms:
+            if form in self.exact:
+                return self.exact[form], 0
+        if self.threshold >= 1:
+            return None, None
+        canonical, distance, tied = self.find_similar(sorted_name, blocks)
+        return (None if tied else canonical), distance
+
+    def remember(self, forms, canonical):
+        for form in forms:
+            self.exact.setdefault(form, canonical)
+
+    def find_similar(self, sorted_name, blocks):
+        """Marque la plus proche des blocs de `sorted_name` : (clé canonique ou None, distance, ex æquo).
+
+        `ex æquo` est vrai si une autre marque distincte est à la même distance ;
+        la première trouvée est retenue.
+        """
+        best, best_distance, tied = None, None, False
+        for block in blocks:
+            for candidate, canonical in self.blocks.get(block, ()):
+                limit = int((1 - self.threshold) * max(len(candidate), len(sorted_name)))
+                if best_distance is not None:
+                    limit = min(limit, best_distance)
+                if limit < 1:
+                    continue
+                distance = bounded_distance(candidate, sorted_name, limit)
+                if distance > limit:
+                    continue
+                if distance == best_distance:
+                    tied = tied or canonical != best
+                else:
+                    best, best_distance, tied = canonical, distance, False
+        return best, best_distance, tied
+
+    def summary(self):
+        return (f"Déduplication des marques: {self.stats['pairs']} paires distinctes, "
+                f"{self.stats['merged']} autres orthographes rapprochées ({self.stats['fuzzy']} par similarité)")
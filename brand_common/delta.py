@@ -0,0 +1,110 @@
+import math
+from datetime import datetime, timezone
+
+from brand_common.columnar import source_strings
+from brand_common.reader import read_catalog_chunks
+
+# Date de la vérification d'une ligne (UTC), utilisée pour l'ancienneté en mode delta
+DATE_COLUMN = 'Date_Vérification'
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def verification_date():
+    """Date du jour au format de la colonne Date_Vérification."""
+    return datetime.now(timezone.utc).strftime(DATE_FORMAT)
+
+
+class PreviousResults:
+    """Résultats d'une exécution précédente, repris tels quels en mode delta.
+
+    Une paire (holding, marque) du fichier précédent est reprise si sa
+    vérification a réussi, que son score atteint `min_confidence` et qu'elle
+    date de moins de `max_age_days` jours (critères ignorés s'ils valent
+    None). Les autres paires, et celles absentes du fichier, sont vérifiées
+    à nouveau ; les paires réussies mais trop anciennes ou peu sûres
+    (`needs_refresh`) contournent aussi le cache de vérification,
+    le graphe de propriété et les portefeuilles en cache.
+    """
+
+    def __init__(self, path, result_columns, min_confidence=None, max_age_days=None, chunksize=50000):
+        self.path = path
+        self.result_columns = list(result_columns)
+        self.min_confidence = min_confidence
+        self.max_age_days = max_age_days
+        self.carried = {}
+        self.refresh = set()
+        self.stats = {'carried': 0, 'failed': 0, 'low_confidence': 0, 'stale': 0}
+        # Lignes du catalogue courant servies par le fichier précédent
+        self.reused_rows = 0
+        self.load(chunksize)
+
+    def load(self, chunksize):
+        today = datetime.now(timezone.utc).date()
+        columns = ['Holding Name', 'Brand Name'] + self.result_columns
+        seen = set()
+        for chunk in read_catalog_chunks(self.path, chunksize, columns,
+                                         required=['Holding Name', 'Brand Name', 'Statut_Vérification']):
+            for record in chunk.to_dict('records'):
+                # Une paire en double dans le fichier précédent a le même résultat
+                pair = (record['Holding Name'], record['Brand Name'])
+                if pair in seen:
+                    continue
+                seen.add(pair)
+                reason = self.refresh_reason(record, today)
+                if reason:
+                    self.stats[reason] += 1
+                    # Sans résultat valide, rien à contourner dans le cache
+                    if reason != 'failed':
+                        self.refresh.add(pair)
+                    continue
+                self.stats['carried'] += 1
+                self.carried[pair] = {column: self.carried_value(record.get(column))
+                                      for column in self.result_columns}
+
+    @staticmethod
+    def carried_value(value):
+        """Valeur reprise d'une cellule : NaN devient None, une liste de sources (Parquet) le texte " | "."""
+        if isinstance(value, float) and math.isnan(value):
+            return None
+        if isinstance(value, list):
+            return " | ".join(source_strings(value))
+        return value
+
+    def refresh_reason(self, record, today):
+        """Raison de revérifier une ligne du fichier précédent, ou None pour la reprendre."""
+        # Échec, Erreur ou ligne jamais vérifiée
+        if record['Statut_Vérification'] != 'Succès':
+            return 'failed'
+        if self.min_confidence is not None:
+            score = record.get('Score_Confiance')
+            if score is None or not score >= self.min_confidence:
+                return 'low_confidence'
+        if self.max_age_days is not None:
+            date = record.get(DATE_COLUMN)
+            if not isinstance(date, str):
+                return 'stale'
+            age = (today - datetime.strptime(date, DATE_FORMAT).date()).days
+            if age > self.max_age_days:
+                return 'stale'
+        return None
+
+    def carries(self, holding, brand):
+        """True si la paire est reprise du fichier précédent."""
+        return (holding, brand) in self.carried
+
+    def get(self, holding, brand):
+        """Valeurs de colonnes reprises pour cette paire, ou None si elle est à vérifier."""
+        carried = self.carried.get((holding, brand))
+        if carried is not None:
+            self.reused_rows += 1
+        return carried
+
+    def needs_refresh(self, holding, brand):
+        """True si la paire doit être réinterrogée sans passer par le cache."""
+        return (holding, brand) in self.refresh
+
+    def summary(self):
+        stats = self.stats
+        return (f"Mode delta ({self.path}): {stats['carried']} paires reprises, "
+                f"à revérifier: {stats['failed']} en échec, {stats['low_confidence']} sous le seuil de confiance, "
+                f"{stats['stale']} trop anciennes ; {self.reused_rows} lignes reprises sans appel à l'API")
@@ -0,0 +1,111 @@
+import json
+import os
+import re
+
+# Listes de motifs par défaut ; BRAND_PATTERNS_FILE (ou --patterns-file) pointe vers un autre fichier
+DEFAULT_PATTERNS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patterns.json')
+PATTERNS_ENV = 'BRAND_PATTERNS_FILE'
+# Phrases d'une explication qui imposent une vérification manuelle
+NEGATIVE_PHRASES = 'negative_phrases'
+
+
+def trie_pattern(words):
+    """Expression régulière en arbre préfixe équivalente à `mot1|mot2|...`.
+
+    Les préfixes communs ne sont testés qu'une fois : le moteur d'expressions
+    régulières élimine une position dès le premier caractère au lieu
+    d'essayer chaque mot. À une même position, la correspondance la plus
+    longue est retenue.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char != '']
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            # Fin d'un mot qui est aussi le préfixe d'un autre : suite optionnelle (gloutonne)
+            pattern = '(?:' + pattern + ')?'
+        return pattern
+
+    return build(trie) if words else '(?!)'
+
+
+class PatternMatcher:
+    """Recherche d'une liste de sous-chaînes en un seul passage.
+
+    La liste est compilée une fois en expression régulière (arbre préfixe).
+    `search` indique si au moins un motif apparaît, `matches` retourne les
+    motifs trouvés. La casse est ignorée par défaut (texte mis en minuscules).
+    """
+
+    def __init__(self, patterns, ignore_case=True):
+        self.ignore_case = ignore_case
+        self.patterns = list(dict.fromkeys(p.lower() if ignore_case else p for p in patterns if p))
+        # Expression utilisable telle quelle avec pandas .str.contains (texte déjà en minuscules)
+        self.pattern = trie_pattern(self.patterns)
+        self.regex = re.compile(self.pattern)
+        # Recherche avec chevauchement pour lister tous les motifs présents
+        self.overlapping = re.compile(f'(?=({self.pattern}))')
+        # Motifs qui sont préfixes d'un autre : trouvés à la même position que lui
+        self.prefixes = {
+            pattern: [other for other in self.patterns if pattern.startswith(other)]
+            for pattern in self.patterns
+        }
+
+    def prepare(self, text):
+        return text.lower() if self.ignore_case else text
+
+    def search(self, text):
+        """True si au moins un motif apparaît dans le texte."""
+        return self.regex.search(self.prepare(text)) is not None
+
+    def matches(self, text):
+        """Motifs présents dans le texte, dans l'ordre de première apparition."""
+        found = {}
+        for match in self.overlapping.finditer(self.prepare(text)):
+            for pattern in self.prefixes[match.group(1)]:
+                found.setdefault(pattern)
+        return list(found)
+
+
+def patterns_file():
+    return os.environ.get(PATTERNS_ENV) or DEFAULT_PATTERNS_FILE
+
+
+def load_pattern_lists(path=None):
+    """Charge les listes de motifs (domaines officiels, phrases négatives, ...) d'un fichier JSON."""
+    with open(path or patterns_file(), encoding='utf-8') as f:
+        lists = json.load(f)
+    if not isinstance(lists, dict) or not all(isinstance(value, list) for value in lists.values()):
+        raise ValueError(f"{path or patterns_file()}: un objet JSON de listes de motifs est attendu")
+    return lists
+
+
+_matchers = {}
+
+
+def get_matcher(name):
+    """Matcher compilé pour une liste du fichier de motifs courant (compilé une seule fois)."""
+    matcher = _matchers.get(name)
+    if matcher is None:
+        lists = load_pattern_lists()
+        if name not in lists:
+            raise KeyError(f"Liste de motifs inconnue dans {patterns_file()}: {name}")
+        for list_name, patterns in lists.items():
+            _matchers[list_name] = PatternMatcher(patterns)
+        matcher = _matchers[name]
+    return matcher
+
+
+def configure_patterns(path):
+    """Utilise un autre fichier de motifs, y compris dans les processus de calcul créés ensuite."""
+    load_pattern_lists(path)
+    os.environ[PATTERNS_ENV] = os.path.abspath(path)
+    _matchers.clear()
@@ -0,0 +1,289 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Niveaux de verbosité : -q (erreurs fatales seulement), défaut, -v (détail par ligne), -vv (réponses brutes)
+QUIET, NORMAL, VERBOSE, DEBUG = 0, 1, 2, 3
+
+# Étapes mesurées d'une vérification
+STAGES = ('prompt', 'http', 'parse', 'scoring')
+
+# Compteurs cumulés, par traitement et par unité de travail
+COUNTERS = ('requests', 'retries', 'cache_hits', 'cache_misses', 'prompt_tokens', 'answer_tokens', 'batched_rows')
+
+# Bornes des histogrammes de durée exportés (secondes)
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Unité de travail en cours : suit le thread ou la tâche asyncio qui la traite
+_current_unit = contextvars.ContextVar('brand_metrics_unit', default=None)
+
+
+class Histogram:
+    """Histogramme de durées aux bornes BUCKETS (nombre, somme, effectif par borne)."""
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        index = bisect_left(BUCKETS, value)
+        if index < len(BUCKETS):
+            self.buckets[index] += 1
+
+    def cumulative(self):
+        """Effectifs cumulés par borne, au format des histogrammes Prometheus."""
+        total = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            total += count
+            yield bound, total
+
+
+class WorkUnit:
+    """Mesures d'une unité de travail (ligne vérifiée, lot ou holding), écrite dans le journal JSON Lines."""
+
+    def __init__(self, metrics, kind, fields):
+        self.metrics = metrics
+        self.kind = kind
+        self.fields = fields
+        self.status = None
+        self.error = None
+        self.stages = {}
+        self.counters = {}
+        self.start = time.perf_counter()
+
+
+class PipelineMetrics:
+    """Instrumentation d'un traitement : durée des étapes, compteurs et messages filtrés par verbosité.
+
+    Les durées des étapes (STAGES) et les compteurs (COUNTERS) sont cumulés
+    pour tout le traitement et pour l'unité de travail en cours (voir
+    `unit`) ; chaque unité terminée devient une ligne JSON de `log_file`.
+    `metrics_file` reçoit les cumuls au format texte de Prometheus (lisible
+    par le collecteur textfile de node_exporter), réécrit toutes les
+    `export_interval` secondes et à la fermeture. Partagé entre threads.
+    """
+
+    def __init__(self, module, verbosity=NORMAL, log_file=None, metrics_file=None):
+        self.module = module
+        self.verbosity = verbosity
+        self.log_file = log_file
+        self.metrics_file = metrics_file
+        self.export_interval = 15.0
+        # Ligne de progression au niveau NORMAL (None = désactivée, par exemple avec tqdm)
+        self.progress_interval = 30.0
+        self.lock = threading.Lock()
+        self.output_lock = threading.Lock()
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.units = {}
+        self.unit_durations = {}
+        self.log = None
+        self.start = time.perf_counter()
+        self.last_export = self.start
+        self.last_progress = self.start
+
+    def shows(self, level):
+        return level <= self.verbosity
+
+    def say(self, level, *values):
+        """Affiche `values` (comme print) si la verbosité le permet, sans mélanger les lignes des threads."""
+        if level <= self.verbosity:
+            with self.output_lock:
+                print(*values)
+
+    def event(self, kind, level, message, **fields):
+        """Signale un événement ponctuel (hors unité de travail) : message selon la verbosité et ligne du journal."""
+        self.say(level, message)
+        if self.log_file:
+            self.write_event({'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+                              'module': self.module, 'event': kind, **fields, 'message': message})
+
+    def current(self):
+        """Unité de travail en cours de ce traitement, ou None."""
+        unit = _current_unit.get()
+        return unit if unit is not None and unit.metrics is self else None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        unit = self.current()
+        with self.lock:
+            self.stages[name].observe(seconds)
+            if unit is not None:
+                unit.stages[name] = unit.stages.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        unit = self.current()
+        with self.lock:
+            self.counters[name] += value
+            if unit is not None:
+                unit.counters[name] = unit.counters.get(name, 0) + value
+
+    def record_tokens(self, tokens):
+        """Ajoute les tokens estimés (envoyés, reçus) d'une requête."""
+        prompt_tokens, answer_tokens = tokens
+        self.count('prompt_tokens', prompt_tokens)
+        self.count('answer_tokens', answer_tokens)
+
+    @contextmanager
+    def unit(self, kind, **fields):
+        """Mesure une unité de travail : les étapes et compteurs du bloc lui sont attribués.
+
+        `status` (et `error`) se renseignent sur l'unité retournée ; une
+        exception qui sort du bloc marque l'unité en erreur.
+        """
+        unit = WorkUnit(self, kind, fields)
+        token = _current_unit.set(unit)
+        try:
+            yield unit
+        except Exception as e:
+            unit.status, unit.error = 'Erreur', str(e)
+            raise
+        finally:
+            _current_unit.reset(token)
+            self.finish(unit)
+
+    def finish(self, unit):
+        elapsed = time.perf_counter() - unit.start
+        status = unit.status or 'Succès'
+        with self.lock:
+            self.units[(unit.kind, status)] = self.units.get((unit.kind, status), 0) + 1
+            self.unit_durations.setdefault(unit.kind, Histogram()).observe(elapsed)
+            stages = {name: round(seconds, 6) for name, seconds in unit.stages.items()}
+            counters = dict(unit.counters)
+        if self.log_file:
+            event = {'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+                     'module': self.module, 'event': unit.kind, **unit.fields, 'status': status,
+                     'duration': round(elapsed, 6), 'stages': stages, **counters}
+            if unit.error:
+                event['error'] = unit.error
+            self.write_event(event)
+        now = time.perf_counter()
+        if self.metrics_file and now - self.last_export >= self.export_interval:
+            self.export()
+        if (self.progress_interval is not None and self.verbosity == NORMAL
+                and now - self.last_progress >= self.progress_interval):
+            self.last_progress = now
+            self.say(NORMAL, self.progress())
+
+    def write_event(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+        with self.output_lock:
+            if self.log is None:
+                self.log = open(self.log_file, 'a', encoding='utf-8')
+            self.log.write(line)
+
+    def rows(self):
+        """Lignes traitées : unités 'row' et 'holding', plus les lignes résolues par des requêtes groupées."""
+        with self.lock:
+            units = sum(count for (kind, _), count in self.units.items() if kind != 'batch')
+            return units + self.counters['batched_rows']
+
+    def progress(self):
+        rows = self.rows()
+        elapsed = time.perf_counter() - self.start
+        return f"Progression: {rows} lignes traitées en {elapsed:.0f}s ({rows / elapsed if elapsed else 0:.1f} lignes/s)"
+
+    def summary(self):
+        rows = self.rows() or 1
+        with self.lock:
+            stages = {name: (histogram.count, histogram.sum) for name, histogram in self.stages.items()}
+            counters = dict(self.counters)
+        timings = ", ".join(f"{name} {total / count * 1000:.1f}ms" for name, (count, total) in stages.items()
+                            if count)
+        summary = (f"Instrumentation: {timings or 'aucune étape mesurée'} (moyenne par appel), "
+                   f"{counters['prompt_tokens'] / rows:.0f} tokens envoyés et "
+                   f"{counters['answer_tokens'] / rows:.0f} reçus par ligne")
+        if counters['cache_hits'] or counters['cache_misses']:
+            summary += f", {counters['cache_hits']} lectures en cache"
+        return summary
+
+    def prometheus(self):
+        """Cumuls au format texte d'exposition de Prometheus."""
+        labels = f'module="{self.module}"'
+        with self.lock:
+            lines = ["# HELP brand_pipeline_stage_seconds Durée des étapes de vérification",
+                     "# TYPE brand_pipeline_stage_seconds histogram"]
+            for name, histogram in self.stages.items():
+                lines.extend(self.histogram_lines('brand_pipeline_stage_seconds', f'{labels},stage="{name}"',
+                                                  histogram))
+            lines += ["# HELP brand_pipeline_unit_seconds Durée des unités de travail (ligne, lot, holding)",
+                      "# TYPE brand_pipeline_unit_seconds histogram"]
+            for kind, histogram in self.unit_durations.items():
+                lines.extend(self.histogram_lines('brand_pipeline_unit_seconds', f'{labels},kind="{kind}"',
+                                                  histogram))
+            lines += ["# HELP brand_pipeline_units_total Unités de travail terminées, par statut",
+                      "# TYPE brand_pipeline_units_total counter"]
+            for (kind, status), count in self.units.items():
+                lines.append(f'brand_pipeline_units_total{{{labels},kind="{kind}",status="{status}"}} {count}')
+            for name, value in self.counters.items():
+                lines += [f"# TYPE brand_pipeline_{name}_total counter",
+                          f"brand_pipeline_{name}_total{{{labels}}} {value}"]
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def histogram_lines(name, labels, histogram):
+        for bound, count in histogram.cumulative():
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}'
+        yield f'{name}_sum{{{labels}}} {histogram.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {histogram.count}'
+
+    def export(self):
+        """Réécrit le fichier Prometheus (remplacement atomique) et vide le journal sur disque."""
+        self.last_export = time.perf_counter()
+        if self.metrics_file:
+            temporary = f"{self.metrics_file}.tmp"
+            with open(temporary, 'w', encoding='utf-8') as f:
+                f.write(self.prometheus())
+            os.replace(temporary, self.metrics_file)
+        with self.output_lock:
+            if self.log is not None:
+                self.log.flush()
+
+    def close(self):
+        self.export()
+        with self.output_lock:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+
+
+def current_metrics():
+    """Instrumentation de l'unité de travail en cours, ou None (par exemple dans un pool de processus)."""
+    unit = _current_unit.get()
+    return unit.metrics if unit is not None else None
+
+
+@contextmanager
+def stage(name):
+    """Mesure une étape pour l'unité de travail en cours ; sans unité en cours, ne mesure rien."""
+    metrics = current_metrics()
+    if metrics is None:
+        yield
+        return
+    with metrics.stage(name):
+        yield
+
+
+def say(level, *values):
+    """PipelineMetrics.say de l'unité en cours ; sans unité en cours, niveau NORMAL."""
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.say(level, *values)
+    elif level <= NORMAL:
+        print(*values)
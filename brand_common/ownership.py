@@ -0,0 +1,251 @@
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from brand_common.dedup import normalize_name
+from brand_common.reader import read_catalog_chunks
+
+# Origine d'un lien : résultat de vérification, confirmation d'une chaîne connue, sous-marque de BrandAnalysis
+VERIFICATION, CONFIRMATION, ANALYSIS = 'verification', 'confirmation', 'analysis'
+
+# Version_Prompt des lignes résolues par une chaîne connue, sans appel à l'API
+GRAPH_VERSION = 'graphe-propriete'
+
+
+def is_true(value):
+    """Valeur booléenne d'une cellule CSV (booléen, 'True'/'Vrai' ou nombre)."""
+    return str(value).strip().casefold() in ('true', 'vrai', '1', '1.0')
+
+
+class OwnershipEdge:
+    """Lien « `child` appartient à `parent` », avec la confiance (0-100) du résultat qui l'a établi."""
+
+    def __init__(self, child, parent, confidence, relation='', origin=VERIFICATION, updated_at=None):
+        self.child = child
+        self.parent = parent
+        self.confidence = confidence
+        self.relation = relation
+        self.origin = origin
+        self.updated_at = updated_at or time.time()
+
+
+class OwnershipPath:
+    """Chaîne de propriété marque → ... → holding ; sa confiance est celle de son lien le plus faible."""
+
+    def __init__(self, edges):
+        self.edges = edges
+        self.confidence = min(edge.confidence for edge in edges)
+
+    def names(self):
+        return [self.edges[0].child] + [edge.parent for edge in self.edges]
+
+    def describe(self):
+        return " → ".join(self.names())
+
+    def details(self):
+        return "; ".join(f"{edge.child} → {edge.parent}: {edge.confidence:.0f}% ({edge.origin})"
+                         for edge in self.edges)
+
+    def result(self):
+        """Résultat au format des réponses du modèle, pour une ligne résolue par cette chaîne."""
+        return {
+            'belongs_to': True,
+            'confidence': self.confidence,
+            'explanation': f"Chaîne de propriété connue: {self.describe()}",
+            'sources': [],
+            'type_relation': self.edges[0].relation if len(self.edges) == 1 else 'Propriété indirecte',
+            'zones_geographiques': '',
+            'details_relation': self.details(),
+            'prompt_version': GRAPH_VERSION
+        }
+
+
+class OwnershipGraph:
+    """Graphe de propriété (marque → filiale → holding) construit à partir des résultats, persisté en SQLite.
+
+    Chaque lien relie deux noms normalisés (voir dedup.normalize_name) ; un
+    résultat de vérification ou de confirmation remplace le lien existant,
+    une sous-marque de BrandAnalysis (non vérifiée) ne remplace pas un lien
+    vérifié. `path` cherche la chaîne la plus sûre d'au plus `max_depth`
+    liens : au-dessus de `resolve_confidence`, la ligne est résolue sans
+    appel à l'API ; au-dessus de `confirm_confidence`, une question courte
+    confirme la chaîne à la place de la vérification complète. Sans `path`
+    de fichier, le graphe ne vit que le temps du traitement. Partagé entre
+    threads.
+    """
+
+    def __init__(self, path=None, resolve_confidence=90, confirm_confidence=70, max_depth=4):
+        self.resolve_confidence = resolve_confidence
+        self.confirm_confidence = confirm_confidence
+        self.max_depth = max_depth
+        self.lock = threading.Lock()
+        # Nom normalisé -> {nom normalisé du parent: OwnershipEdge}
+        self.parents = {}
+        self.stats = {'resolved': 0, 'confirmed': 0, 'rejected': 0, 'added': 0, 'removed': 0}
+        self.connection = None
+        if path:
+            self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS ownership_edges (
+                    child_key TEXT,
+                    parent_key TEXT,
+                    child TEXT,
+                    parent TEXT,
+                    confidence REAL,
+                    relation TEXT,
+                    origin TEXT,
+                    updated_at REAL,
+                    PRIMARY KEY (child_key, parent_key)
+                )
+            """)
+            self.connection.commit()
+            for row in self.connection.execute(
+                    "SELECT child_key, parent_key, child, parent, confidence, relation, origin, updated_at "
+                    "FROM ownership_edges"):
+                self.parents.setdefault(row[0], {})[row[1]] = OwnershipEdge(*row[2:])
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(parents) for parents in self.parents.values())
+
+    def add(self, child, parent, confidence, relation='', origin=VERIFICATION):
+        """Ajoute ou remplace le lien `child` → `parent` ; retourne False s'il est ignoré."""
+        child_key, parent_key = normalize_name(child), normalize_name(parent)
+        if not child_key or not parent_key or child_key == parent_key:
+            return False
+        edge = OwnershipEdge(str(child), str(parent), float(confidence), str(relation or ''), origin)
+        with self.lock:
+            existing = self.parents.get(child_key, {}).get(parent_key)
+            if existing is not None and origin == ANALYSIS and (
+                    existing.origin != ANALYSIS or existing.confidence >= edge.confidence):
+                return False
+            self.parents.setdefault(child_key, {})[parent_key] = edge
+            self.stats['added'] += 1
+            if self.connection is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO ownership_edges "
+                    "(child_key, parent_key, child, parent, confidence, relation, origin, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (child_key, parent_key, edge.child, edge.parent, edge.confidence, edge.relation,
+                     edge.origin, edge.updated_at))
+                self.connection.commit()
+        return True
+
+    def remove(self, child, parent):
+        """Retire le lien direct `child` → `parent` (propriété démentie par une vérification)."""
+        child_key, parent_key = normalize_name(child), normalize_name(parent)
+        with self.lock:
+            if self.parents.get(child_key, {}).pop(parent_key, None) is None:
+                return
+            self.stats['removed'] += 1
+            if self.connection is not None:
+                self.connection.execute("DELETE FROM ownership_edges WHERE child_key = ? AND parent_key = ?",
+                                        (child_key, parent_key))
+                self.connection.commit()
+
+    def record_result(self, holding, brand, result, origin=VERIFICATION):
+        """Met à jour le lien marque → holding à partir d'un résultat de vérification (dict du modèle)."""
+        if result.get('belongs_to'):
+            self.add(brand, holding, result.get('confidence', 0), result.get('type_relation', ''), origin)
+        else:
+            self.remove(brand, holding)
+
+    def reachable(self, child):
+        """Fermeture transitive depuis `child` : {nom normalisé: (confiance du meilleur chemin, lien d'arrivée)}.
+
+        La confiance d'un chemin est celle de son lien le plus faible ; les
+        chemins sont limités à `max_depth` liens.
+        """
+        best = {normalize_name(child): (float('inf'), None)}
+        frontier = list(best)
+        with self.lock:
+            for _ in range(self.max_depth):
+                following = []
+                for node in frontier:
+                    width = best[node][0]
+                    for parent_key, edge in self.parents.get(node, {}).items():
+                        confidence = min(width, edge.confidence)
+                        if confidence > best.get(parent_key, (-1, None))[0]:
+                            best[parent_key] = (confidence, edge)
+                            following.append(parent_key)
+                frontier = following
+                if not frontier:
+                    break
+        return best
+
+    def ancestors(self, child, min_confidence=0):
+        """Sociétés et marques dont `child` dépend, directement ou non : {nom: confiance}."""
+        return {edge.parent: confidence for confidence, edge in self.reachable(child).values()
+                if edge is not None and confidence >= min_confidence}
+
+    def path(self, child, ancestor):
+        """Chaîne la plus sûre de `child` à `ancestor`, ou None."""
+        reachable = self.reachable(child)
+        node = normalize_name(ancestor)
+        if node not in reachable or reachable[node][1] is None:
+            return None
+        edges = []
+        while reachable[node][1] is not None and len(edges) < self.max_depth:
+            edge = reachable[node][1]
+            edges.append(edge)
+            node = normalize_name(edge.child)
+        return OwnershipPath(edges[::-1])
+
+    def known_chain(self, holding, brand):
+        """Chaîne marque → holding assez sûre pour éviter la vérification complète, ou None."""
+        chain = self.path(brand, holding)
+        if chain is None or chain.confidence < self.confirm_confidence:
+            return None
+        return chain
+
+    def resolves(self, chain):
+        """True si la chaîne est assez sûre pour résoudre la ligne sans appel à l'API."""
+        return chain.confidence >= self.resolve_confidence
+
+    def count(self, outcome):
+        with self.lock:
+            self.stats[outcome] += 1
+
+    def load_results(self, path, chunksize=50000):
+        """Ajoute les liens marque → holding des lignes confirmées d'un CSV de résultats de vérification."""
+        columns = ['Holding Name', 'Brand Name', 'Propriété_Directe', 'Score_Confiance']
+        added = 0
+        for chunk in read_catalog_chunks(path, chunksize, columns + ['Type_Relation'], required=columns):
+            relations = chunk['Type_Relation'] if 'Type_Relation' in chunk else [''] * len(chunk)
+            for holding, brand, owned, confidence, relation in zip(
+                    chunk['Holding Name'], chunk['Brand Name'], chunk['Propriété_Directe'],
+                    chunk['Score_Confiance'], relations):
+                if is_true(owned) and pd.notna(confidence):
+                    added += self.add(brand, holding, float(confidence), relation if isinstance(relation, str) else '')
+        return added
+
+    def load_sub_brands(self, path, confidence=80):
+        """Ajoute les liens sous-marque → marque parente → holding du fichier sub_brands.csv de BrandAnalysis."""
+        columns = ['Main Holding Name', 'Brand Name', 'Marque Parente', 'Statut sous marque']
+        added = 0
+        for chunk in read_catalog_chunks(path, 50000, columns, required=columns):
+            for holding, brand, parent, is_sub_brand in zip(chunk['Main Holding Name'], chunk['Brand Name'],
+                                                           chunk['Marque Parente'], chunk['Statut sous marque']):
+                if is_true(is_sub_brand) and isinstance(parent, str) and parent:
+                    added += self.add(brand, parent, confidence, 'Sous-marque', ANALYSIS)
+                else:
+                    added += self.add(brand, holding, confidence, 'Marque', ANALYSIS)
+        return added
+
+    def summary(self):
+        stats = self.stats
+        summary = (f"Graphe de propriété: {len(self)} liens ({stats['added']} ajoutés ou mis à jour, "
+                   f"{stats['removed']} retirés)")
+        if stats['resolved'] or stats['confirmed'] or stats['rejected']:
+            summary += (f", {stats['resolved']} lignes résolues par une chaîne connue, {stats['confirmed']} "
+                        f"confirmées par une question courte, {stats['rejected']} chaînes non confirmées")
+        return summary
+
+    def close(self):
+        if self.connection is not None:
+            with self.lock:
+                self.connection.close()
+                self.connection = None
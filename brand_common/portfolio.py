@@ -0,0 +1,143 @@
+import threading
+
+from brand_common.dedup import BrandIndex, normalize_name
+
+# Rapprochement d'une marque du catalogue avec le portefeuille de sa holding
+EXACT, FUZZY, AMBIGUOUS, UNMATCHED = 'exact', 'fuzzy', 'ambiguous', 'unmatched'
+
+
+class Portfolio:
+    """Portefeuille de marques officiel d'une holding, indexé pour y retrouver les marques du catalogue.
+
+    `brands` sont les objets validés par PORTFOLIO_BRAND_SCHEMA (nom, société
+    propriétaire, relation, sources), `sources` les sources Perplexica de la
+    réponse : elles documentent le portefeuille et valent pour chacune de
+    ses marques.
+    """
+
+    def __init__(self, holding, brands, sources=(), prompt_version='', threshold=1.0):
+        self.holding = holding
+        self.sources = list(sources)
+        self.prompt_version = prompt_version
+        self.index = BrandIndex(threshold)
+        # Clé canonique -> objet du portefeuille
+        self.brands = {}
+        for item in brands:
+            self.brands.setdefault(self.index.key('', item['brand']), item)
+        # Une marque du catalogue qui prolonge un nom du portefeuille ("DOVE CHOCOLATE"
+        # pour "DOVE") peut être une autre marque : elle est ambiguë
+        self.names = {normalize_name(item['brand']) for item in brands}
+
+    def __len__(self):
+        return len(self.brands)
+
+    def match(self, brand):
+        """Objet du portefeuille qui correspond à `brand` (ou None) et nature du rapprochement."""
+        canonical, distance = self.index.find('', brand)
+        if canonical is not None:
+            return self.brands[canonical], EXACT if distance == 0 else FUZZY
+        if distance is not None:
+            return None, AMBIGUOUS
+        tokens = normalize_name(brand).split()
+        if any(' '.join(tokens[:size]) in self.names for size in range(1, len(tokens))):
+            return None, AMBIGUOUS
+        return None, UNMATCHED
+
+    def result(self, brand, item, kind):
+        """Résultat au format des réponses du modèle pour une marque du portefeuille (score à calculer)."""
+        owner = item.get('owner') or self.holding
+        subsidiary = normalize_name(owner) != normalize_name(self.holding)
+        explanation = f"{brand} figure dans le portefeuille de marques officiel de {self.holding}"
+        if kind == FUZZY:
+            explanation += f" (sous le nom {item['brand']})"
+        if subsidiary:
+            explanation += f", par sa filiale {owner}"
+        chain = [item['brand'], owner, self.holding] if subsidiary else [item['brand'], self.holding]
+        result = {
+            'belongs_to': True,
+            'explanation': explanation,
+            'sources': list(item.get('sources', [])),
+            'type_relation': item.get('type_relation') or ('Filiale' if subsidiary else 'Propriété directe'),
+            'zones_geographiques': item.get('zones_geographiques', ''),
+            'details_relation': " → ".join(chain),
+            'prompt_version': self.prompt_version
+        }
+        if 'confidence' in item:
+            result['confidence'] = item['confidence']
+        return result
+
+
+class PortfolioIndex:
+    """Portefeuilles de marques officiels par holding, demandés une seule fois par traitement.
+
+    Une holding n'est interrogée que si au moins `min_brands` de ses marques
+    restent à vérifier ; une demande en échec n'est pas renouvelée. `match`
+    rapproche une marque du portefeuille de sa holding (formes normalisées,
+    puis, si `threshold` < 1, similarité, voir dedup.BrandIndex) : seules
+    les marques trouvées sans ambiguïté sont résolues, les marques absentes
+    ou ambiguës (plusieurs marques aussi proches, nom qui prolonge une
+    marque du portefeuille) passent par la vérification marque par marque.
+    Partagé entre threads.
+    """
+
+    def __init__(self, min_brands=50, threshold=1.0):
+        self.min_brands = min_brands
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        # Holding normalisée -> Portfolio, ou None si la demande a échoué
+        self.portfolios = {}
+        self.stats = {'portfolios': 0, 'failed': 0, EXACT: 0, FUZZY: 0, AMBIGUOUS: 0, UNMATCHED: 0}
+
+    def select(self, pairs):
+        """Marques à rapprocher par holding parmi les paires (holding, marque) restantes : {holding: [marques]}.
+
+        Retient les holdings au portefeuille déjà obtenu et celles d'au moins
+        `min_brands` marques dont le portefeuille n'a pas encore été demandé.
+        """
+        groups = {}
+        for holding, brand in pairs:
+            groups.setdefault(holding, []).append(brand)
+        selected = {}
+        with self.lock:
+            for holding, brands in groups.items():
+                key = normalize_name(holding)
+                if self.portfolios.get(key) is not None or (key not in self.portfolios
+                                                            and len(brands) >= self.min_brands):
+                    selected[holding] = brands
+        return selected
+
+    def known(self, holding):
+        """True si le portefeuille de la holding a déjà été demandé (avec ou sans succès)."""
+        with self.lock:
+            return normalize_name(holding) in self.portfolios
+
+    def add(self, holding, content, prompt_version=''):
+        """Enregistre la réponse validée (PORTFOLIO_SCHEMA) d'une holding, ou son échec (None) ; retourne le Portfolio."""
+        portfolio = None
+        if content is not None and content['brands']:
+            portfolio = Portfolio(holding, content['brands'], content.get('sources', []), prompt_version,
+                                  self.threshold)
+        with self.lock:
+            self.portfolios[normalize_name(holding)] = portfolio
+            self.stats['portfolios'] += 1
+            self.stats['failed'] += portfolio is None
+        return portfolio
+
+    def match(self, holding, brand):
+        """Résultat d'une marque trouvée dans le portefeuille de sa holding et ses sources Perplexica, ou (None, [])."""
+        with self.lock:
+            portfolio = self.portfolios.get(normalize_name(holding))
+        if portfolio is None:
+            return None, []
+        item, kind = portfolio.match(brand)
+        with self.lock:
+            self.stats[kind] += 1
+        if item is None:
+            return None, []
+        return portfolio.result(brand, item, kind), list(portfolio.sources)
+
+    def summary(self):
+        stats = self.stats
+        return (f"Portefeuilles de marques: {stats['portfolios']} holdings ({stats['failed']} sans portefeuille), "
+                f"{stats[EXACT] + stats[FUZZY]} marques trouvées ({stats[FUZZY]} par similarité), "
+                f"{stats[AMBIGUOUS]} ambiguës et {stats[UNMATCHED]} absentes vérifiées marque par marque")
@@ -0,0 +1,83 @@
+import pandas as pd
+
+from brand_common.columnar import ChunkedParquetWriter, is_parquet, read_parquet_chunks, write_parquet
+
+# Colonnes du fichier d'origine utilisées par la vérification
+CATALOG_COLUMNS = [
+    'Holding Name',
+    'Brand Name',
+    'Class Key - Description',
+    'Group Class Key - Description',
+    'Business Unit Description'
+]
+
+REQUIRED_COLUMNS = ['Holding Name', 'Brand Name']
+
+
+def read_catalog_chunks(path, chunksize=5000, columns=CATALOG_COLUMNS, required=REQUIRED_COLUMNS, filters=None):
+    """Lit un CSV ou un fichier Parquet par blocs de `chunksize` lignes en ne chargeant que `columns`.
+
+    Les colonnes demandées absentes du fichier sont ignorées ; `columns=None`
+    conserve toutes les colonnes. L'index des blocs est continu sur tout le
+    fichier, comme avec un `pd.read_csv` complet. `filters` ({colonne: valeur})
+    ne garde que les lignes égales à ces valeurs : filtre évalué à la lecture
+    en Parquet, comparaison du texte des cellules bloc par bloc en CSV.
+    """
+    if is_parquet(path):
+        return read_parquet_chunks(path, chunksize, columns, required, filters)
+    header = pd.read_csv(path, nrows=0).columns
+    missing = [col for col in required if col not in header]
+    if missing:
+        raise ValueError(f"Colonnes manquantes dans {path}: {', '.join(missing)}")
+    usecols = [col for col in columns if col in header] if columns is not None else None
+    if filters:
+        if usecols is not None:
+            usecols += [col for col in filters if col not in usecols]
+        return filter_chunks(pd.read_csv(path, usecols=usecols, chunksize=chunksize), filters)
+    return pd.read_csv(path, usecols=usecols, chunksize=chunksize)
+
+
+def filter_chunks(chunks, filters):
+    for chunk in chunks:
+        keep = pd.Series(True, index=chunk.index)
+        for column, value in filters.items():
+            # Le type d'une colonne peut varier d'un bloc à l'autre (booléen ou texte)
+            keep &= chunk[column].astype(str) == str(value)
+        yield chunk[keep]
+
+
+def read_table(path, columns=None, filters=None):
+    """Lit un fichier de résultats complet (CSV ou Parquet), voir read_catalog_chunks."""
+    if not is_parquet(path) and not filters:
+        return pd.read_csv(path, usecols=columns)
+    chunks = list(read_catalog_chunks(path, 50000, columns, required=(), filters=filters))
+    return pd.concat(chunks) if chunks else pd.DataFrame(columns=columns)
+
+
+def write_table(df, path):
+    """Écrit un DataFrame en CSV, ou en Parquet typé si `path` se termine par .parquet."""
+    if is_parquet(path):
+        write_parquet(df, path)
+    else:
+        df.to_csv(path, index=False)
+
+
+def open_writer(path):
+    """Écriture par blocs au format du fichier de sortie (CSV ou Parquet)."""
+    return ChunkedParquetWriter(path) if is_parquet(path) else ChunkedCsvWriter(path)
+
+
+class ChunkedCsvWriter:
+    """Ajoute des blocs de DataFrame à un CSV, l'en-tête n'étant écrit qu'une fois."""
+
+    def __init__(self, path):
+        self.path = path
+        self.header_written = False
+
+    def write(self, chunk):
+        chunk.to_csv(self.path, mode='a' if self.header_written else 'w',
+                     header=not self.header_written, index=False)
+        self.header_written = True
+
+    def close(self):
+        pass
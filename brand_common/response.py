@@ -0,0 +1,381 @@
+import json
+import re
+
+# Blocs de code markdown (```json ... ```), éventuellement imbriqués ou répétés
+FENCE_RE = re.compile(r'```[A-Za-z]*')
+# Littéraux Python parfois renvoyés à la place de true / false / null
+PYTHON_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+# Nombre maximal de débuts de JSON essayés dans un même message
+MAX_CANDIDATES = 20
+# Une apostrophe ne ferme une chaîne 'entre apostrophes' que si elle est suivie
+# d'un séparateur JSON : "l'entreprise" reste dans la chaîne
+SINGLE_QUOTE_END_RE = re.compile(r"\s*(?:[,:}\]]|$)")
+# Virgule finale avant une fermeture
+TRAILING_COMMA_RE = re.compile(r"\s*[}\]]")
+WORD_RE = re.compile(r"\w+")
+KEY_SEPARATOR_RE = re.compile(r"\s*:")
+
+_decoder = json.JSONDecoder()
+
+
+def strip_fences(text):
+    """Supprime les marqueurs de blocs de code markdown."""
+    return FENCE_RE.sub('', text).strip()
+
+
+def repair_json(text, start):
+    """Réécrit en JSON strict la structure qui commence à `start`.
+
+    Parcours caractère par caractère : les chaînes entre apostrophes et les
+    clés sans guillemets passent entre guillemets, les virgules finales sont
+    supprimées, True / False / None deviennent des littéraux JSON et la
+    lecture s'arrête à la fermeture de la structure (le texte qui suit est
+    ignoré). Retourne None si la structure n'est pas fermée.
+    """
+    out = []
+    depth = 0
+    quote = None
+    pos = start
+    length = len(text)
+    while pos < length:
+        char = text[pos]
+        if quote:
+            if char == '\\' and pos + 1 < length:
+                escaped = text[pos + 1]
+                out.append("'" if escaped == "'" else text[pos:pos + 2])
+                pos += 2
+                continue
+            if char == quote and (quote == '"' or SINGLE_QUOTE_END_RE.match(text, pos + 1)):
+                out.append('"')
+                quote = None
+            elif char == '"':
+                out.append('\\"')
+            elif char < ' ':
+                out.append(json.dumps(char)[1:-1])
+            else:
+                out.append(char)
+        elif char in '"\'':
+            quote = char
+            out.append('"')
+        elif char in '{[':
+            depth += 1
+            out.append(char)
+        elif char in '}]':
+            depth -= 1
+            out.append(char)
+            if depth == 0:
+                return ''.join(out)
+        elif char == ',':
+            if not TRAILING_COMMA_RE.match(text, pos + 1):
+                out.append(char)
+        elif char.isalpha() or char == '_':
+            word = WORD_RE.match(text, pos).group(0)
+            if KEY_SEPARATOR_RE.match(text, pos + len(word)):
+                out.append(f'"{word}"')
+            else:
+                out.append(PYTHON_LITERALS.get(word, word))
+            pos += len(word)
+            continue
+        else:
+            out.append(char)
+        pos += 1
+    return None
+
+
+def iter_json_values(text, expect=dict):
+    """Valeurs JSON de type `expect` trouvées dans un texte, dans l'ordre.
+
+    Chaque début d'objet (ou de tableau) est d'abord décodé tel quel avec
+    raw_decode, qui ignore le texte qui suit, puis après réparation.
+    """
+    opener = '{' if expect is dict else '['
+    pos = text.find(opener)
+    candidates = 0
+    while pos != -1 and candidates < MAX_CANDIDATES:
+        candidates += 1
+        try:
+            value = _decoder.raw_decode(text, pos)[0]
+        except ValueError:
+            value = None
+            repaired = repair_json(text, pos)
+            if repaired is not None:
+                try:
+                    value = json.loads(repaired)
+                except ValueError:
+                    pass
+        if isinstance(value, expect):
+            yield value
+        pos = text.find(opener, pos + 1)
+
+
+def extract_json(message, expect=dict):
+    """Premier objet (ou tableau si `expect=list`) JSON d'une réponse du modèle, ou None.
+
+    Tolère les blocs de code, le texte avant et après le JSON, les
+    apostrophes à la place des guillemets, les virgules finales et les
+    littéraux Python.
+    """
+    if isinstance(message, expect):
+        return message
+    if not isinstance(message, str):
+        return None
+    text = strip_fences(message)
+    try:
+        value = json.loads(text)
+        if isinstance(value, expect):
+            return value
+    except ValueError:
+        pass
+    return next(iter_json_values(text, expect), None)
+
+
+class ListOf:
+    """Type de champ : liste dont les éléments sont du type `item` (type simple ou ResponseSchema)."""
+
+    def __init__(self, item):
+        self.item = item
+
+
+TRUE_WORDS = {'true', 'vrai', 'oui', 'yes', '1'}
+FALSE_WORDS = {'false', 'faux', 'non', 'no', '0'}
+
+
+def coerce(value, expected):
+    """Convertit `value` dans le type attendu ; lève ValueError si c'est impossible."""
+    if isinstance(expected, ResponseSchema):
+        result = expected.validate(value)
+        if result is None:
+            raise ValueError("objet invalide")
+        return result
+    if isinstance(expected, ListOf):
+        if isinstance(value, (str, dict)):
+            value = [value]
+        if not isinstance(value, list):
+            raise ValueError("liste attendue")
+        items = []
+        for item in value:
+            # Les éléments invalides sont ignorés, pas toute la liste
+            try:
+                items.append(coerce(item, expected.item))
+            except ValueError:
+                pass
+        return items
+    if expected is bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, (int, float)) and value in (0, 1):
+            return bool(value)
+        if isinstance(value, str) and value.strip().lower() in TRUE_WORDS | FALSE_WORDS:
+            return value.strip().lower() in TRUE_WORDS
+        raise ValueError("booléen attendu")
+    if expected is float:
+        if isinstance(value, bool):
+            raise ValueError("nombre attendu")
+        if isinstance(value, (int, float)):
+            return value
+        if isinstance(value, str):
+            return float(value.strip().rstrip('%').strip().replace(',', '.'))
+        raise ValueError("nombre attendu")
+    if expected is str:
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        raise ValueError("texte attendu")
+    if not isinstance(value, expected):
+        raise ValueError(f"{expected.__name__} attendu")
+    return value
+
+
+class ResponseSchema:
+    """Schéma déclaratif d'une réponse JSON du modèle.
+
+    `fields` associe chaque champ connu à son type (bool, float, str, list,
+    ListOf ou un autre ResponseSchema). Les champs `required` doivent être
+    présents et convertibles ; `any_of` exige au moins un des champs listés.
+    Un champ optionnel nul ou inconvertible est retiré, les champs inconnus
+    sont conservés tels quels.
+    """
+
+    def __init__(self, fields, required=(), any_of=()):
+        self.fields = fields
+        self.required = tuple(required)
+        self.any_of = tuple(any_of)
+
+    def validate(self, content):
+        """Copie validée et convertie de `content`, ou None si elle ne respecte pas le schéma."""
+        if not isinstance(content, dict):
+            return None
+        result = dict(content)
+        for name, expected in self.fields.items():
+            if name not in result:
+                continue
+            try:
+                if result[name] is None:
+                    raise ValueError("valeur nulle")
+                result[name] = coerce(result[name], expected)
+            except ValueError:
+                if name in self.required:
+                    return None
+                del result[name]
+        if any(name not in result for name in self.required):
+            return None
+        if self.any_of and not any(name in result for name in self.any_of):
+            return None
+        return result
+
+
+def parse_answer(message, schema, expect=dict):
+    """Premier objet JSON d'une réponse qui respecte `schema`, validé, ou None."""
+    if isinstance(message, dict):
+        return schema.validate(message)
+    if not isinstance(message, str):
+        return None
+    text = strip_fences(message)
+    try:
+        value = schema.validate(json.loads(text))
+        if value is not None:
+            return value
+    except ValueError:
+        pass
+    for value in iter_json_values(text, expect):
+        value = schema.validate(value)
+        if value is not None:
+            return value
+    return None
+
+
+VERIFICATION_FIELDS = {
+    'brand': str,
+    'belongs_to': bool,
+    'confidence': float,
+    'explanation': str,
+    'sources': ListOf(object),
+    'type_relation': str,
+    'zones_geographiques': str,
+    'date_changement': str,
+    'details_relation': str,
+}
+
+# Réponse de brand_verification (le score est recalculé à partir des sources)
+VERIFICATION_SCHEMA = ResponseSchema(VERIFICATION_FIELDS, required=('belongs_to', 'explanation'))
+# Réponse de brand_verification_multiprocessing (la confiance annoncée sert de score de base)
+MULTI_VERIFICATION_SCHEMA = ResponseSchema(VERIFICATION_FIELDS, required=('belongs_to', 'explanation', 'confidence'))
+
+SUB_BRAND_SCHEMA = ResponseSchema({'marque_principale': str, 'sous_marque': str},
+                                  required=('marque_principale', 'sous_marque'))
+# Réponse de brand_analysis
+HOLDING_ANALYSIS_SCHEMA = ResponseSchema(
+    {'marques_manquantes': ListOf(str), 'sous_marques': ListOf(SUB_BRAND_SCHEMA)},
+    any_of=('marques_manquantes', 'sous_marques')
+)
+
+PORTFOLIO_BRAND_SCHEMA = ResponseSchema(
+    {'brand': str, 'owner': str, 'type_relation': str, 'confidence': float, 'zones_geographiques': str,
+     'sources': ListOf(object)},
+    required=('brand',)
+)
+# Portefeuille de marques officiel d'une holding (préchargement par holding des vérificateurs)
+PORTFOLIO_SCHEMA = ResponseSchema({'brands': ListOf(PORTFOLIO_BRAND_SCHEMA), 'sources': ListOf(object)},
+                                  required=('brands',))
+
+
+def loads_tolerant(text):
+    """json.loads, puis json.loads après repair_json ; ValueError si le texte reste invalide."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        repaired = repair_json(text, 0)
+        if repaired is None:
+            raise
+        return json.loads(repaired)
+
+
+class StreamingJsonParser:
+    """Analyse incrémentale d'un objet JSON reçu par morceaux (réponse en flux).
+
+    `feed` ajoute un morceau et retourne les champs de premier niveau déjà
+    complets. L'état du parcours (position, profondeur, chaîne ouverte) est
+    gardé d'un morceau à l'autre : chaque caractère n'est parcouru qu'une
+    fois, et chaque virgule de premier niveau termine un champ qui est décodé
+    seul, avec les mêmes tolérances que extract_json. Seul le champ en cours
+    reste en mémoire.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.started = False
+        self.pos = 0
+        self.depth = 0
+        self.quote = None
+        self.fields = {}
+        self.complete = False
+
+    def feed(self, chunk):
+        if self.complete:
+            return self.fields
+        self.text += chunk
+        text = self.text
+        if not self.started:
+            start = text.find('{')
+            if start == -1:
+                self.text = ''
+                return self.fields
+            self.started = True
+            # Le texte gardé commence au premier champ, après l'accolade ouvrante
+            text = self.text = text[start + 1:]
+            self.depth = 1
+        pos = self.pos
+        field_start = 0
+        length = len(text)
+        while pos < length:
+            char = text[pos]
+            if self.quote:
+                if char == '\\':
+                    if pos + 1 >= length:
+                        break
+                    pos += 2
+                    continue
+                if char == self.quote:
+                    if self.quote == "'":
+                        # Fin de chaîne ou apostrophe ? Attendre le caractère suivant
+                        rest = text[pos + 1:pos + 64].lstrip()
+                        if not rest:
+                            break
+                        if rest[0] not in ',:}]':
+                            pos += 1
+                            continue
+                    self.quote = None
+            elif char in '"\'':
+                self.quote = char
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    self.add_field(text[field_start:pos])
+                    self.complete = True
+                    self.text = ''
+                    return self.fields
+            elif char == ',' and self.depth == 1:
+                if not self.add_field(text[field_start:pos]):
+                    # Champ invalide : l'objet entier l'est aussi, les champs lus sont gardés
+                    self.complete = True
+                    self.text = ''
+                    return self.fields
+                field_start = pos + 1
+            pos += 1
+        self.text = text[field_start:]
+        self.pos = pos - field_start
+        return self.fields
+
+    def add_field(self, text):
+        """Décode un champ complet ("clé": valeur) et l'ajoute aux champs lus ; False s'il est invalide."""
+        if not text.strip():
+            return True
+        try:
+            value = loads_tolerant('{' + text + '}')
+        except ValueError:
+            return False
+        self.fields.update(value)
+        return True
@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+
+from brand_common.matcher import get_matcher
+
+# Listes de motifs (domaines officiels, années récentes, indices de chaîne de
+# propriété) chargées de brand_common/patterns.json et compilées une fois
+OFFICIAL_DOMAINS = 'official_domains'
+RECENT_YEARS = 'recent_years'
+OWNERSHIP_KEYWORDS = 'ownership_keywords'
+
+# Pondérations de brand_verification
+STANDARD_WEIGHTS = {
+    'base_owned': 80,         # score de base si la marque appartient à la holding
+    'base_not_owned': 20,
+    'base': 0.4,              # poids du score de base
+    'quality': 0.4,           # poids de la part de sources officielles
+    'recency': 0.2,           # poids de la part de sources récentes
+    'official_bonus': 1.2,    # au moins 2 sources officielles
+    'chain_bonus': 1.15,      # chaîne de propriété vérifiée
+    'sold_malus': 0.7,        # "sold" dans l'explication sans source récente
+}
+
+# Pondérations de brand_verification_multiprocessing (score de base = confiance du modèle)
+MULTI_WEIGHTS = {
+    'base': 0.5,
+    'quality': 0.3,
+    'recency': 0.2,
+    'official_bonus': 1.2,            # au moins 2 sources officielles et qualité >= 80
+    'official_bonus_quality': 80,
+    'acquisition_bonus': 1.1,         # "acquisition" dans l'explication et au moins 2 sources officielles
+    'multi_official_bonus': 1.15,     # au moins 3 sources officielles
+}
+
+FEATURE_COLUMNS = ['official', 'recent', 'chain', 'quantity']
+
+
+def source_counts(content_sources=(), api_sources=()):
+    """Compte les sources officielles et récentes d'une réponse.
+
+    `content_sources` sont les sources citées par le modèle (chaînes) et
+    `api_sources` celles renvoyées par Perplexica (dicts avec `metadata`).
+    Les éléments d'un autre type comptent seulement dans `quantity`.
+    """
+    official_matcher = get_matcher(OFFICIAL_DOMAINS)
+    recent_matcher = get_matcher(RECENT_YEARS)
+    ownership_matcher = get_matcher(OWNERSHIP_KEYWORDS)
+    official = recent = 0
+    chain = False
+    for source in content_sources:
+        if isinstance(source, str):
+            if official_matcher.search(source):
+                official += 1
+            if recent_matcher.search(source):
+                recent += 1
+    for source in api_sources:
+        if isinstance(source, dict):
+            metadata = source.get('metadata', {})
+            if official_matcher.search(metadata.get('url', '')):
+                official += 1
+            if recent_matcher.search(metadata.get('title', '')):
+                recent += 1
+            if not chain and ownership_matcher.search(metadata.get('content', '')):
+                chain = True
+    return {'official': official, 'recent': recent, 'chain': chain,
+            'quantity': len(content_sources) + len(api_sources)}
+
+
+def standard_score(belongs_to, explanation, counts, weights=STANDARD_WEIGHTS):
+    """Score de confiance de brand_verification pour une réponse."""
+    official, recent, quantity = counts['official'], counts['recent'], counts['quantity']
+    # Règle 1: source officielle directe = 100%
+    if belongs_to and official > 0:
+        return 100
+    source_quality = (official / max(quantity, 1)) * 100
+    recency_score = (recent / max(quantity, 1)) * 100
+    base_score = weights['base_owned'] if belongs_to else weights['base_not_owned']
+    final_score = (
+        base_score * weights['base'] +
+        source_quality * weights['quality'] +
+        recency_score * weights['recency']
+    )
+    if official >= 2:
+        final_score = min(100, final_score * weights['official_bonus'])
+    if counts['chain']:
+        final_score = min(100, final_score * weights['chain_bonus'])
+    if recent == 0 and 'sold' in (explanation or '').lower():
+        final_score = max(0, final_score * weights['sold_malus'])
+    return min(100, max(0, final_score))
+
+
+def multi_score(base_score, explanation, counts, weights=MULTI_WEIGHTS):
+    """Score de confiance de brand_verification_multiprocessing pour une réponse."""
+    official, recent, quantity = counts['official'], counts['recent'], counts['quantity']
+    source_quality = (official / max(quantity, 1)) * 100
+    recency_score = (recent / max(quantity, 1)) * 100
+    final_score = (
+        base_score * weights['base'] +
+        source_quality * weights['quality'] +
+        recency_score * weights['recency']
+    )
+    if official >= 2 and source_quality >= weights['official_bonus_quality']:
+        final_score = min(100, final_score * weights['official_bonus'])
+    if 'acquisition' in (explanation or '').lower() and official >= 2:
+        final_score = min(100, final_score * weights['acquisition_bonus'])
+    if official >= 3:
+        final_score = min(100, final_score * weights['multi_official_bonus'])
+    return min(100, max(0, final_score))
+
+
+def sources_frame(rows):
+    """Table longue des sources : une ligne par source.
+
+    `rows` est un itérable de (identifiant de ligne, sources du modèle,
+    sources Perplexica). Les colonnes `official_text`, `recent_text` et
+    `chain_text` contiennent le texte sur lequel porte chaque critère.
+    """
+    records = []
+    for row_id, content_sources, api_sources in rows:
+        for source in content_sources:
+            if isinstance(source, str):
+                records.append((row_id, source.lower(), source, ''))
+            else:
+                records.append((row_id, '', '', ''))
+        for source in api_sources:
+            if isinstance(source, dict):
+                metadata = source.get('metadata', {})
+                records.append((row_id, metadata.get('url', '').lower(), metadata.get('title', '').lower(),
+                                metadata.get('content', '').lower()))
+            else:
+                records.append((row_id, '', '', ''))
+    return pd.DataFrame(records, columns=['row', 'official_text', 'recent_text', 'chain_text'])
+
+
+def source_counts_frame(sources, index):
+    """Version vectorisée de source_counts sur une table produite par sources_frame.
+
+    Retourne un DataFrame indexé par `index` avec les colonnes official,
+    recent, chain et quantity (0 / False pour les lignes sans source).
+    """
+    flags = pd.DataFrame({
+        'row': sources['row'],
+        'official': sources['official_text'].str.contains(get_matcher(OFFICIAL_DOMAINS).pattern, regex=True),
+        'recent': sources['recent_text'].str.contains(get_matcher(RECENT_YEARS).pattern, regex=True),
+        'chain': sources['chain_text'].str.contains(get_matcher(OWNERSHIP_KEYWORDS).pattern, regex=True),
+    })
+    grouped = flags.groupby('row')
+    counts = pd.DataFrame({
+        'official': grouped['official'].sum(),
+        'recent': grouped['recent'].sum(),
+        'chain': grouped['chain'].any(),
+        'quantity': grouped.size(),
+    }).reindex(index)
+    return counts.fillna({'official': 0, 'recent': 0, 'chain': False, 'quantity': 0}).astype(
+        {'official': int, 'recent': int, 'chain': bool, 'quantity': int})
+
+
+def standard_score_frame(frame, weights=STANDARD_WEIGHTS):
+    """Version vectorisée de standard_score.
+
+    `frame` contient belongs_to, explanation et les colonnes de
+    source_counts ; retourne une Series de scores alignée sur `frame`.
+    """
+    belongs_to = frame['belongs_to'].astype(bool).to_numpy()
+    official = frame['official'].to_numpy(dtype=float)
+    recent = frame['recent'].to_numpy(dtype=float)
+    quantity = np.maximum(frame['quantity'].to_numpy(dtype=float), 1)
+    sold = frame['explanation'].fillna('').astype(str).str.lower().str.contains('sold', regex=False).to_numpy()
+
+    base_score = np.where(belongs_to, weights['base_owned'], weights['base_not_owned'])
+    score = (
+        base_score * weights['base'] +
+        official / quantity * 100 * weights['quality'] +
+        recent / quantity * 100 * weights['recency']
+    )
+    score = np.where(official >= 2, np.minimum(100, score * weights['official_bonus']), score)
+    score = np.where(frame['chain'].astype(bool).to_numpy(), np.minimum(100, score * weights['chain_bonus']), score)
+    score = np.where((recent == 0) & sold, np.maximum(0, score * weights['sold_malus']), score)
+    score = np.clip(score, 0, 100)
+    # Règle 1: source officielle directe = 100%
+    score = np.where(belongs_to & (official > 0), 100, score)
+    return pd.Series(score, index=frame.index)
+
+
+def multi_score_frame(frame, weights=MULTI_WEIGHTS):
+    """Version vectorisée de multi_score ; le score de base est la colonne confidence."""
+    base_score = frame['confidence'].to_numpy(dtype=float)
+    official = frame['official'].to_numpy(dtype=float)
+    recent = frame['recent'].to_numpy(dtype=float)
+    quantity = np.maximum(frame['quantity'].to_numpy(dtype=float), 1)
+    source_quality = official / quantity * 100
+    acquisition = frame['explanation'].fillna('').astype(str).str.lower().str.contains(
+        'acquisition', regex=False).to_numpy()
+
+    score = (
+        base_score * weights['base'] +
+        source_quality * weights['quality'] +
+        recent / quantity * 100 * weights['recency']
+    )
+    score = np.where((official >= 2) & (source_quality >= weights['official_bonus_quality']),
+                     np.minimum(100, score * weights['official_bonus']), score)
+    score = np.where(acquisition & (official >= 2), np.minimum(100, score * weights['acquisition_bonus']), score)
+    score = np.where(official >= 3, np.minimum(100, score * weights['multi_official_bonus']), score)
+    return pd.Series(np.clip(score, 0, 100), index=frame.index)
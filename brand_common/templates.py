@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+from brand_common.cache import normalize_key_part
+
+# Registre des templates par défaut ; BRAND_PROMPTS_FILE (ou --prompts-file) pointe vers un autre fichier
+DEFAULT_PROMPTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompts', 'templates.json')
+PROMPTS_ENV = 'BRAND_PROMPTS_FILE'
+
+# Mots et signes de ponctuation, pour l'estimation du nombre de tokens
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """Estimation du nombre de tokens d'un texte, sans tokenizer.
+
+    Chaque signe de ponctuation compte pour un token, chaque mot pour un
+    token par tranche de 4 caractères : un ordre de grandeur proche des
+    tokenizers BPE des modèles OpenAI, suffisant pour comparer des templates.
+    """
+    if not text:
+        return 0
+    return sum((len(piece) + 3) // 4 for piece in TOKEN_PATTERN.findall(text))
+
+
+class PromptTemplate:
+    """Template versionné : instructions système fixes et question à compléter.
+
+    `user` est un modèle str.format (champs {brand}, {holding}, {context},
+    {brands}) ; `system` est envoyé tel quel. `batch` est le template des
+    requêtes groupées associé, s'il existe.
+    """
+
+    def __init__(self, name, system, user, batch=None, description=""):
+        self.name = name
+        self.system = system
+        self.user = user
+        self.batch = batch
+        self.description = description
+        self.system_tokens = estimate_tokens(system)
+
+    def render(self, **fields):
+        return self.user.format(**fields)
+
+    def __repr__(self):
+        return f"PromptTemplate({self.name!r})"
+
+
+def prompts_file():
+    return os.environ.get(PROMPTS_ENV) or DEFAULT_PROMPTS_FILE
+
+
+def read_template_text(directory, filename):
+    """Texte d'un fichier de template (le saut de ligne final du fichier n'en fait pas partie)."""
+    with open(os.path.join(directory, filename), encoding='utf-8') as f:
+        text = f.read()
+    return text[:-1] if text.endswith('\n') else text
+
+
+def load_templates(path=None):
+    """Charge le registre des templates : {nom: PromptTemplate}.
+
+    Le fichier JSON associe à chaque nom les fichiers `system` et `user`
+    (relatifs au registre) et, éventuellement, le nom du template `batch`.
+    """
+    path = path or prompts_file()
+    with open(path, encoding='utf-8') as f:
+        specs = json.load(f)
+    if not isinstance(specs, dict) or not all(isinstance(spec, dict) for spec in specs.values()):
+        raise ValueError(f"{path}: un objet JSON de templates est attendu")
+    directory = os.path.dirname(os.path.abspath(path))
+    templates = {}
+    for name, spec in specs.items():
+        try:
+            templates[name] = PromptTemplate(name, read_template_text(directory, spec['system']),
+                                             read_template_text(directory, spec['user']),
+                                             description=spec.get('description', ""))
+        except KeyError as e:
+            raise ValueError(f"{path}: template {name} sans champ {e}")
+    for name, spec in specs.items():
+        batch = spec.get('batch')
+        if batch is not None:
+            if batch not in templates:
+                raise ValueError(f"{path}: template groupé inconnu pour {name}: {batch}")
+            templates[name].batch = templates[batch]
+    return templates
+
+
+_templates = {}
+
+
+def get_template(name):
+    """Template du registre courant (registre chargé une seule fois)."""
+    if not _templates:
+        _templates.update(load_templates())
+    template = _templates.get(name)
+    if template is None:
+        raise KeyError(f"Template de prompt inconnu dans {prompts_file()}: {name} "
+                       f"(disponibles: {', '.join(sorted(_templates))})")
+    return template
+
+
+def configure_prompts(path):
+    """Utilise un autre registre de templates, y compris dans les processus de calcul créés ensuite."""
+    load_templates(path)
+    os.environ[PROMPTS_ENV] = os.path.abspath(path)
+    _templates.clear()
+
+
+def answer_tokens(result):
+    """Tokens estimés du message d'une réponse /api/search décodée."""
+    message = result.get('message') if isinstance(result, dict) else None
+    return estimate_tokens(message if isinstance(message, str) else None)
+
+
+def request_tokens(system_tokens, query, result):
+    """Tokens estimés (envoyés, reçus) d'une requête /api/search : instructions système et question, message."""
+    return system_tokens + estimate_tokens(query), answer_tokens(result)
+
+
+def assign_template(templates, holding, brand):
+    """Template d'une paire pour un test A/B : choix stable, réparti par hash de la paire normalisée."""
+    if len(templates) == 1:
+        return templates[0]
+    key = f"{normalize_key_part(holding)}\x1f{normalize_key_part(brand)}".encode('utf-8')
+    return templates[int.from_bytes(hashlib.sha1(key).digest()[:8], 'big') % len(templates)]
+
+
+class PromptStats:
+    """Requêtes, tokens estimés et durée par template (partagé entre threads).
+
+    Les statistiques sont regroupées par template comparé : les requêtes
+    groupées comptent pour le template dont elles dépendent (`batch`), pour
+    que les tokens par ligne d'un test A/B couvrent toutes les requêtes de
+    chaque bras. Les tokens envoyés comptent les instructions système et la
+    question, les tokens reçus le message de la réponse de /api/search.
+    """
+
+    def __init__(self, templates):
+        self.templates = templates
+        self.groups = {}
+        for template in templates:
+            self.groups[template.name] = template.name
+            if template.batch is not None:
+                self.groups.setdefault(template.batch.name, template.name)
+        self.lock = threading.Lock()
+        self.stats = {template.name: {'requests': 0, 'rows': 0, 'prompt_tokens': 0, 'answer_tokens': 0,
+                                      'time': 0.0} for template in templates}
+
+    def entry(self, name):
+        return self.stats.setdefault(self.groups.get(name, name), {'requests': 0, 'rows': 0, 'prompt_tokens': 0,
+                                                                   'answer_tokens': 0, 'time': 0.0})
+
+    def record_request(self, template, query, result, elapsed, received=None):
+        """Comptabilise une requête ; retourne ses tokens estimés (envoyés, reçus).
+
+        `received` donne les tokens reçus déjà estimés là où la réponse a été
+        décodée (pool de processus) ; `result` est alors ignoré.
+        """
+        prompt_tokens, received_tokens = request_tokens(template.system_tokens, query, result)
+        if received is not None:
+            received_tokens = received
+        with self.lock:
+            stats = self.entry(template.name)
+            stats['requests'] += 1
+            stats['prompt_tokens'] += prompt_tokens
+            stats['answer_tokens'] += received_tokens
+            stats['time'] += elapsed
+        return prompt_tokens, received_tokens
+
+    def record_row(self, name):
+        """Comptabilise une ligne vérifiée avec le template `name` (ou son template groupé)."""
+        with self.lock:
+            self.entry(name)['rows'] += 1
+
+    def summary(self):
+        with self.lock:
+            stats = {name: dict(values) for name, values in self.stats.items()}
+        lines = ["Templates de prompt (tokens estimés):"]
+        for name, values in stats.items():
+            rows = values['rows'] or 1
+            average = values['time'] / values['requests'] if values['requests'] else 0.0
+            lines.append(f"- {name}: {values['requests']} requêtes, {values['rows']} lignes, "
+                         f"{values['prompt_tokens'] / rows:.0f} tokens envoyés et "
+                         f"{values['answer_tokens'] / rows:.0f} reçus par ligne, durée moyenne {average:.2f}s")
+        return "\n".join(lines)
@@ -0,0 +1,285 @@
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from brand_common.metrics import NORMAL, say
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0, rng=random):
+    """Délai avant la tentative suivante : back-off exponentiel avec « full jitter ».
+
+    Le délai est tiré uniformément dans [0, min(cap, base * 2**attempt)] :
+    des workers qui échouent ensemble ne réessaient pas au même instant.
+    """
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RateLimiter:
+    """Limiteur à seau de jetons : requêtes par seconde et requêtes simultanées.
+
+    Sans `state_file`, le seau est partagé par les threads du processus. Avec
+    `state_file`, il est stocké dans une base SQLite : plusieurs processus
+    (ou plusieurs scripts lancés en parallèle) se partagent alors le même
+    débit. La limite de requêtes simultanées reste propre au processus.
+    """
+
+    def __init__(self, rate=None, burst=None, max_concurrent=None, state_file=None, name="perplexica"):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate or 1.0)
+        self.max_concurrent = max_concurrent
+        self.state_file = state_file
+        self.name = name
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.semaphore = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self.stats = {'requests': 0, 'throttled': 0, 'wait_time': 0.0}
+        self.connection = None
+        if state_file is not None:
+            self.connection = sqlite3.connect(state_file, timeout=30, check_same_thread=False,
+                                              isolation_level=None)
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limiter (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL,
+                    updated REAL
+                )
+            """)
+
+    def _consume(self, tokens, updated, now):
+        # Les jetons peuvent devenir négatifs : chaque appelant réserve sa place
+        # dans la file et attend le temps nécessaire pour la rembourser
+        tokens = min(self.burst, tokens + (now - updated) * self.rate) - 1
+        return tokens, max(0.0, -tokens / self.rate)
+
+    def reserve(self):
+        """Réserve un jeton et retourne le temps à attendre avant d'envoyer la requête."""
+        if not self.rate:
+            wait = 0.0
+        elif self.connection is None:
+            with self.lock:
+                now = time.time()
+                self.tokens, wait = self._consume(self.tokens, self.updated, now)
+                self.updated = now
+        else:
+            with self.lock:
+                # BEGIN IMMEDIATE sérialise les processus sur le verrou d'écriture SQLite
+                self.connection.execute("BEGIN IMMEDIATE")
+                try:
+                    now = time.time()
+                    row = self.connection.execute(
+                        "SELECT tokens, updated FROM rate_limiter WHERE name = ?", (self.name,)
+                    ).fetchone()
+                    tokens, updated = row if row is not None else (self.burst, now)
+                    tokens, wait = self._consume(tokens, updated, now)
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO rate_limiter (name, tokens, updated) VALUES (?, ?, ?)",
+                        (self.name, tokens, now)
+                    )
+                    self.connection.execute("COMMIT")
+                except Exception:
+                    self.connection.execute("ROLLBACK")
+                    raise
+        with self.lock:
+            self.stats['requests'] += 1
+            if wait > 0:
+                self.stats['throttled'] += 1
+                self.stats['wait_time'] += wait
+        return wait
+
+    @contextmanager
+    def slot(self):
+        """Contexte bloquant autour d'un appel : place libre puis jeton disponible."""
+        if self.semaphore is not None:
+            self.semaphore.acquire()
+        try:
+            wait = self.reserve()
+            if wait > 0:
+                time.sleep(wait)
+            yield
+        finally:
+            if self.semaphore is not None:
+                self.semaphore.release()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class CircuitBreaker:
+    """Disjoncteur : suspend les envois quand le taux d'erreur s'envole.
+
+    Fermé, il laisse tout passer et suit les `window` dernières requêtes. Au-delà
+    de `error_threshold` d'erreurs (sur au moins `min_requests`), il s'ouvre
+    pendant `cooldown` secondes. Il laisse ensuite passer une seule requête de
+    test : un succès le referme, un échec le rouvre pour une durée doublée.
+    Chaque envoi autorisé reçoit un ticket, la génération courante, rendu
+    avec son issue : une requête partie avant la dernière ouverture ou
+    fermeture (génération périmée) ne compte plus, et seule l'issue de la
+    requête de test décide de la sortie de l'état demi-ouvert.
+    Chaque ouverture est signalée à l'instrumentation (PipelineMetrics) passée
+    à `record` : message selon la verbosité et événement du journal JSON Lines.
+    """
+
+    def __init__(self, window=20, error_threshold=0.5, min_requests=10, cooldown=30.0,
+                 max_cooldown=300.0, probe_interval=0.5):
+        self.window = window
+        self.error_threshold = error_threshold
+        self.min_requests = min_requests
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_interval = probe_interval
+        self.lock = threading.Lock()
+        self.outcomes = deque(maxlen=window)
+        self.state = 'closed'
+        self.cooldown = cooldown
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        # Incrémentée à chaque ouverture, fermeture et requête de test
+        self.generation = 0
+        self.stats = {'opened': 0, 'paused_time': 0.0}
+
+    def wait_time(self):
+        """(temps à attendre, ticket) : l'envoi est autorisé si le temps est nul.
+
+        Le ticket est à rendre à `record` (ou `release`) avec l'issue de la requête.
+        """
+        with self.lock:
+            if self.state == 'closed':
+                return 0.0, self.generation
+            now = time.monotonic()
+            if self.state == 'open':
+                if now < self.open_until:
+                    return self.open_until - now, None
+                self.state = 'half-open'
+            # Demi-ouvert : une seule requête de test à la fois, avec son propre ticket
+            if self.probe_in_flight:
+                return self.probe_interval, None
+            self.probe_in_flight = True
+            self.generation += 1
+            return 0.0, self.generation
+
+    def wait(self):
+        """Bloque tant que le disjoncteur n'autorise pas l'envoi ; retourne le ticket de l'envoi."""
+        while True:
+            delay, ticket = self.wait_time()
+            if delay <= 0:
+                return ticket
+            with self.lock:
+                self.stats['paused_time'] += delay
+            time.sleep(delay)
+
+    def _open(self, now):
+        self.state = 'open'
+        self.open_until = now + self.cooldown
+        self.generation += 1
+        self.stats['opened'] += 1
+        return self.cooldown
+
+    def release(self, ticket):
+        """Rend le ticket d'une requête abandonnée sans issue (copie perdante d'une requête de couverture).
+
+        S'il s'agissait de la requête de test, une autre requête pourra la remplacer.
+        """
+        with self.lock:
+            if self.state == 'half-open' and ticket == self.generation:
+                self.probe_in_flight = False
+
+    def record(self, error, metrics=None, ticket=None):
+        """Enregistre l'issue d'une requête autorisée par wait_time/wait.
+
+        `ticket` est celui de l'autorisation (None = génération courante).
+        `metrics` (PipelineMetrics) reçoit l'ouverture éventuelle du disjoncteur.
+        """
+        cooldown = self._update(error, ticket)
+        if cooldown is not None:
+            message = f"Disjoncteur ouvert: envois suspendus pendant {cooldown:.0f}s"
+            if metrics is not None:
+                metrics.event('circuit_breaker', NORMAL, message, cooldown=cooldown)
+            else:
+                say(NORMAL, message)
+
+    def _update(self, error, ticket=None):
+        """Met à jour l'état ; retourne la durée de suspension si le disjoncteur vient de s'ouvrir."""
+        with self.lock:
+            now = time.monotonic()
+            if ticket is not None and ticket != self.generation:
+                # Requête autorisée avant la dernière ouverture ou fermeture
+                return None
+            if self.state == 'half-open':
+                if not self.probe_in_flight:
+                    return None
+                self.probe_in_flight = False
+                if error:
+                    self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                    return self._open(now)
+                self.state = 'closed'
+                self.generation += 1
+                self.cooldown = self.base_cooldown
+                self.outcomes.clear()
+                return None
+            if self.state != 'closed':
+                return None
+            self.outcomes.append(error)
+            if len(self.outcomes) >= self.min_requests and \
+                    sum(self.outcomes) / len(self.outcomes) >= self.error_threshold:
+                self.outcomes.clear()
+                return self._open(now)
+            return None
+
+
+class HedgePolicy:
+    """Requêtes de couverture (« hedged requests ») contre la latence de queue.
+
+    Une fois `min_samples` réponses observées, une requête toujours sans
+    réponse après le percentile `percentile` des `window` dernières durées
+    est envoyée une deuxième fois ; la première réponse valide est gardée.
+    `max_ratio` borne la part de requêtes doublées : si tout Perplexica
+    ralentit, doubler chaque requête ne ferait qu'aggraver la charge.
+    """
+
+    def __init__(self, percentile=95, min_samples=20, window=200, max_ratio=0.1, min_delay=0.05):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.min_delay = min_delay
+        self.lock = threading.Lock()
+        self.durations = deque(maxlen=window)
+        self.stats = {'requests': 0, 'hedged': 0, 'won': 0}
+
+    def record(self, elapsed):
+        """Enregistre la durée d'une requête réussie."""
+        with self.lock:
+            self.durations.append(elapsed)
+
+    def delay(self):
+        """Délai avant d'envoyer la copie d'une nouvelle requête, ou None (pas assez de mesures)."""
+        with self.lock:
+            self.stats['requests'] += 1
+            if len(self.durations) < self.min_samples:
+                return None
+            durations = sorted(self.durations)
+        rank = max(0, min(len(durations) - 1, int(len(durations) * self.percentile / 100)))
+        return max(self.min_delay, durations[rank])
+
+    def try_hedge(self):
+        """Réserve une copie si le budget `max_ratio` le permet."""
+        with self.lock:
+            if self.stats['hedged'] + 1 > self.max_ratio * self.stats['requests']:
+                return False
+            self.stats['hedged'] += 1
+            return True
+
+    def record_win(self):
+        """La réponse gardée est celle de la copie."""
+        with self.lock:
+            self.stats['won'] += 1
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+        return f"{stats['hedged']} requêtes doublées après le p{self.percentile:g} (réponse de la copie gardée {stats['won']} fois)"
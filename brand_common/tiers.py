@@ -0,0 +1,129 @@
+import json
+import threading
+
+
+class Tier:
+    """Palier de vérification : modèle et modes Perplexica, règle de promotion et coût.
+
+    Une ligne passe au palier suivant si la confiance obtenue est inférieure
+    à `promote_below`, ou si `promote_if_manual` est actif et que le résultat
+    demanderait une vérification manuelle. Les règles du dernier palier sont
+    ignorées. `cost_per_request` est un coût estimé par appel (unité libre).
+    """
+
+    def __init__(self, name, chat_model="gpt-4o-mini", optimization_mode="speed", focus_mode="webSearch",
+                 promote_below=None, promote_if_manual=False, cost_per_request=0.0):
+        self.name = name
+        self.chat_model = chat_model
+        self.optimization_mode = optimization_mode
+        self.focus_mode = focus_mode
+        self.promote_below = promote_below
+        self.promote_if_manual = promote_if_manual
+        self.cost_per_request = cost_per_request
+
+    def should_promote(self, result, needs_manual):
+        """True si le résultat de ce palier doit être confirmé par le palier suivant."""
+        if not result:
+            return True
+        if self.promote_below is not None and result.get('confidence', 0) < self.promote_below:
+            return True
+        return self.promote_if_manual and bool(needs_manual)
+
+    def post_options(self):
+        """Arguments de PerplexicaClient.post propres au palier."""
+        return {'chat_model': self.chat_model, 'optimization_mode': self.optimization_mode,
+                'focus_mode': self.focus_mode}
+
+    def __repr__(self):
+        return f"Tier({self.name!r}, {self.chat_model}/{self.optimization_mode})"
+
+
+def cache_variant(tiers, index):
+    """Variante de la clé de cache d'un palier (vide pour le premier, comme sans paliers)."""
+    return '' if index == 0 else tiers[index].name
+
+
+def load_tiers(path):
+    """Charge une liste de paliers d'un fichier JSON (liste d'objets aux champs de Tier)."""
+    with open(path, encoding='utf-8') as f:
+        specs = json.load(f)
+    if not isinstance(specs, list) or not specs or not all(isinstance(spec, dict) for spec in specs):
+        raise ValueError(f"{path}: une liste non vide de paliers est attendue")
+    tiers = []
+    for position, spec in enumerate(specs):
+        spec = dict(spec)
+        name = spec.pop('name', f"palier-{position + 1}")
+        try:
+            tiers.append(Tier(name, **spec))
+        except TypeError as e:
+            raise ValueError(f"{path}: palier {name} invalide ({e})")
+    return tiers
+
+
+class TierStats:
+    """Appels, durée, coût estimé et lignes terminées par palier (partagé entre threads)."""
+
+    def __init__(self, tiers):
+        self.tiers = tiers
+        self.lock = threading.Lock()
+        self.stats = {tier.name: {'calls': 0, 'time': 0.0, 'finished': 0} for tier in tiers}
+
+    def record_call(self, tier, elapsed):
+        with self.lock:
+            stats = self.stats[tier.name]
+            stats['calls'] += 1
+            stats['time'] += elapsed
+
+    def record_finish(self, tier):
+        with self.lock:
+            self.stats[tier.name]['finished'] += 1
+
+    def summary(self):
+        with self.lock:
+            stats = {name: dict(values) for name, values in self.stats.items()}
+        finished = sum(values['finished'] for values in stats.values())
+        lines = ["Paliers de vérification:"]
+        total_cost = 0.0
+        for tier in self.tiers:
+            values = stats[tier.name]
+            average = values['time'] / values['calls'] if values['calls'] else 0.0
+            cost = values['calls'] * tier.cost_per_request
+            total_cost += cost
+            share = values['finished'] / finished * 100 if finished else 0.0
+            lines.append(f"- {tier.name} ({tier.chat_model}/{tier.optimization_mode}): {values['calls']} appels, "
+                         f"durée moyenne {average:.2f}s, coût estimé {cost:.4f}, "
+                         f"{values['finished']} lignes terminées ({share:.0f}%)")
+        lines.append(f"Coût estimé total: {total_cost:.4f}")
+        return "\n".join(lines)
+
+
+class PromotionPredictor:
+    """Prédit les lignes qui seront promues au palier suivant (vérification spéculative).
+
+    Suit, pendant l'exécution, la part de lignes promues par clé (holding,
+    catégorie...). Une ligne est jugée incertaine si l'une de ses clés a au
+    moins `min_samples` observations et une part de promotions d'au moins
+    `threshold`.
+    """
+
+    def __init__(self, threshold=0.5, min_samples=3):
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+        # clé -> [lignes promues, lignes observées]
+        self.counts = {}
+
+    def record(self, keys, promoted):
+        with self.lock:
+            for key in keys:
+                counts = self.counts.setdefault(key, [0, 0])
+                counts[0] += int(bool(promoted))
+                counts[1] += 1
+
+    def predicts(self, keys):
+        with self.lock:
+            for key in keys:
+                promoted, total = self.counts.get(key, (0, 0))
+                if total >= self.min_samples and promoted / total >= self.threshold:
+                    return True
+        return False
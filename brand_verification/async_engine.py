@@ -0,0 +1,423 @@
+import asyncio
+import functools
+import time
+
+import aiohttp
+
+from brand_common.batching import make_batches
+from brand_common.checkpoint import row_key
+from brand_common.client import StreamCollector
+from brand_common.metrics import NORMAL, QUIET, VERBOSE
+from brand_common.reader import CATALOG_COLUMNS, open_writer, read_catalog_chunks, read_table, write_table
+from brand_common.response import VERIFICATION_SCHEMA
+from brand_common.throttle import backoff_delay
+
+
+class AsyncVerificationEngine:
+    """Moteur asyncio qui garde plusieurs requêtes Perplexica en vol.
+
+    Réutilise le prompt, le parsing, le scoring et le format de sortie de
+    BrandVerification, ainsi que ses étapes de vérification (paliers, graphe
+    de propriété, requêtes groupées, portefeuilles ; voir run_steps) : seules
+    les requêtes HTTP et les attentes entre tentatives deviennent non
+    bloquantes.
+    """
+
+    def __init__(self, verifier, concurrency=8):
+        self.verifier = verifier
+        self.concurrency = concurrency
+
+    async def post(self, session, semaphore, query, timeout=None, schema=None, tier=None, template=None):
+        """Envoie une question avec le payload précalculé du client partagé et retourne le JSON.
+
+        En mode `stream_responses` du client, la réponse est lue en flux
+        comme dans PerplexicaClient.post_stream. `tier` (premier palier par
+        défaut) fixe le modèle et les modes de la requête, `template` les
+        instructions système et le suivi des tokens. Avec la
+        HedgePolicy du client, une requête trop lente est doublée comme dans
+        PerplexicaClient.post_hedged ; la requête perdante est annulée.
+        """
+        hedge = self.verifier.client.hedge
+        send = functools.partial(self.send, session, query, timeout, schema, tier, template)
+        # Le sémaphore borne le nombre de requêtes en vol, pas les attentes ; la copie
+        # d'une requête de couverture partage la place de l'originale
+        async with semaphore:
+            delay = hedge.delay() if hedge is not None else None
+            if delay is None:
+                return await send()
+            return await self.send_hedged(send, delay)
+
+    async def send_hedged(self, send, delay):
+        """Appelle `send`, le relance une fois après `delay` secondes et garde la première réponse valide."""
+        hedge = self.verifier.client.hedge
+        pending = {asyncio.ensure_future(send())}
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        copy = None
+        if not done and hedge.try_hedge():
+            copy = asyncio.ensure_future(send())
+            pending.add(copy)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                if task is copy:
+                    hedge.record_win()
+                for other in pending:
+                    other.cancel()
+                return task.result()
+        raise error
+
+    async def send(self, session, query, timeout=None, schema=None, tier=None, template=None):
+        """Un envoi de la question (voir post), sans requête de couverture."""
+        client = self.verifier.client
+        tier = tier or self.verifier.tiers[0]
+        body, headers = client.prepare_body(query, tier.chat_model, client.stream_responses,
+                                            tier.optimization_mode, tier.focus_mode,
+                                            template.system if template is not None else None)
+        # Sans timeout explicite, celui de la session s'applique
+        options = {'timeout': timeout} if timeout is not None else {}
+        # Pauses du disjoncteur et du limiteur de débit, sans bloquer la boucle
+        ticket = None
+        if client.breaker is not None:
+            delay, ticket = client.breaker.wait_time()
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay, ticket = client.breaker.wait_time()
+        if client.limiter is not None:
+            delay = client.limiter.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        start = time.perf_counter()
+        collector = StreamCollector(schema, client.stop_early) if client.stream_responses else None
+        error = True
+        cancelled = False
+        try:
+            async with session.post(client.url, data=body, headers=headers, **options) as response:
+                response.raise_for_status()
+                if collector is None:
+                    result = await response.json(content_type=None)
+                else:
+                    async for line in response.content:
+                        if collector.feed_line(line):
+                            # Coupe la génération : la connexion n'est pas réutilisée
+                            response.close()
+                            break
+                    result = collector.result()
+            error = False
+        except asyncio.CancelledError:
+            # Copie perdante d'une requête de couverture : ni erreur, ni mesure de durée
+            error = False
+            cancelled = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            client.record(elapsed, error, len(body), sample=not cancelled, ticket=ticket)
+        self.verifier.tier_stats.record_call(tier, elapsed)
+        if template is not None:
+            self.verifier.metrics.record_tokens(
+                self.verifier.prompt_stats.record_request(template, query, result, elapsed))
+        if collector is not None:
+            client.record_stream(collector)
+        return result
+
+    async def run_steps(self, steps, send):
+        """Version asynchrone de BrandVerification.run_steps : `send` est une coroutine."""
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    reply = await send(*request)
+                except Exception as e:
+                    request = steps.throw(e)
+                else:
+                    request = steps.send(reply)
+        except StopIteration as done:
+            return done.value
+
+    def send_request(self, session, semaphore):
+        """Version asynchrone de BrandVerification.send_request, pour run_steps."""
+        verifier = self.verifier
+
+        async def send(query, template, timeout, tier_index=0, schema=None):
+            return await self.post(session, semaphore, query, aiohttp.ClientTimeout(total=timeout), schema=schema,
+                                   tier=verifier.tiers[tier_index], template=template)
+        return send
+
+    async def verify_brand(self, session, semaphore, brand_name, company_name, row=None):
+        """Version asynchrone de BrandVerification.verify_brand (graphe de propriété et paliers compris)."""
+        async def verify(tier_index, template, fields):
+            return await self.verify_brand_with_tier(session, semaphore, brand_name, company_name, row, tier_index,
+                                                     template, **fields)
+        return await self.run_steps(self.verifier.verification_steps(brand_name, company_name), verify)
+
+    async def verify_brand_with_tier(self, session, semaphore, brand_name, company_name, row=None, tier_index=0,
+                                     template=None, **fields):
+        """Version asynchrone de BrandVerification.verify_brand_with_tier."""
+        verifier = self.verifier
+        cached, template, query = verifier.tier_query(brand_name, company_name, row, tier_index, template, **fields)
+        if cached is not None:
+            return cached
+        send = self.send_request(session, semaphore)
+
+        attempt = 1
+        while attempt <= verifier.max_attempts:
+            try:
+                result = await send(query, template, verifier.request_timeout, tier_index, VERIFICATION_SCHEMA)
+                content = verifier.tier_result(brand_name, company_name, tier_index, template, result)
+                if content is not None:
+                    return content
+
+                verifier.metrics.say(VERBOSE, f"Réponse invalide de l'API pour {brand_name} "
+                                              f"(tentative {attempt}/{verifier.max_attempts})")
+
+            except Exception as e:
+                verifier.metrics.say(VERBOSE, f"Erreur lors de la vérification de {brand_name} "
+                                              f"(tentative {attempt}/{verifier.max_attempts}): {str(e)}")
+
+            attempt += 1
+            if attempt <= verifier.max_attempts:
+                verifier.client.record_retry()
+                await asyncio.sleep(backoff_delay(attempt - 2, verifier.retry_delay, verifier.max_retry_delay))
+
+        return None
+
+    async def verify_batch(self, session, semaphore, holding, brand_names, rows):
+        """Version asynchrone de BrandVerification.verify_brands_batch."""
+        return await self.run_steps(self.verifier.batch_steps(brand_names, holding, rows),
+                                    self.send_request(session, semaphore))
+
+    async def fetch_portfolio(self, session, semaphore, holding, brand_names=()):
+        """Version asynchrone de BrandVerification.fetch_portfolio."""
+        return await self.run_steps(self.verifier.portfolio_steps(holding, brand_names),
+                                    self.send_request(session, semaphore))
+
+    async def resolve_portfolios(self, session, semaphore, rows, record):
+        """Version asynchrone de BrandVerification.prefetch_portfolios ; retourne les paires non résolues.
+
+        Les portefeuilles des holdings retenues sont demandés en parallèle.
+        """
+        verifier = self.verifier
+        candidates = [args for args in rows if verifier.known_chain(args[1], args[2]) is None]
+        selected = verifier.portfolios.select((args[1], args[2]) for args in candidates)
+        await asyncio.gather(*(self.fetch_portfolio(session, semaphore, holding, brand_names)
+                               for holding, brand_names in selected.items()
+                               if not verifier.portfolios.known(holding)))
+        by_pair = {(args[1], args[2]): args for args in candidates}
+        resolved = set()
+        for holding, brand_names in selected.items():
+            for brand, content in verifier.portfolio_results(holding, brand_names).items():
+                brand_key, _, _, _, keys = by_pair[(holding, brand)]
+                record(brand_key, holding, brand, keys, verifier.build_row_result(content))
+                resolved.add(brand_key)
+        return [args for args in rows if args[0] not in resolved]
+
+    async def verify_row(self, session, semaphore, holding, brand, row):
+        """Vérifie une paire (holding, marque) et retourne les valeurs de colonnes."""
+        verifier = self.verifier
+        with verifier.metrics.unit('row', holding=holding, brand=brand) as unit:
+            try:
+                result = await self.verify_brand(session, semaphore, brand, holding, row)
+                if result:
+                    row_result = verifier.build_row_result(result)
+                else:
+                    verifier.metrics.say(NORMAL, f"\nÉchec de la vérification de {brand} pour {holding}")
+                    row_result = verifier.build_failure_row_result(
+                        'Échec',
+                        'Échec de la vérification - Pas de réponse de l\'API',
+                        'Échec de la vérification'
+                    )
+            except Exception as e:
+                verifier.metrics.say(NORMAL, f"\nErreur lors de la vérification de {brand}: {str(e)}")
+                row_result = verifier.build_failure_row_result('Erreur', str(e), f'Erreur: {str(e)}')
+            unit.status = row_result['Statut_Vérification']
+            unit.error = row_result['Erreur_Vérification'] or None
+        return row_result
+
+    async def verify_all(self, rows, journal=None):
+        """Vérifie toutes les paires uniques.
+
+        rows est une liste (clé, holding, marque, ligne, clés des lignes du journal) ;
+        chaque résultat est journalisé pour toutes les lignes concernées.
+        """
+        limiter = self.verifier.client.limiter
+        concurrency = self.concurrency
+        if limiter is not None and limiter.max_concurrent:
+            concurrency = min(concurrency, limiter.max_concurrent)
+        semaphore = asyncio.Semaphore(concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.verifier.request_timeout)
+        # Pool de connexions keep-alive partagé par toutes les requêtes
+        # (copies des requêtes de couverture comprises)
+        limit = self.concurrency * 2 if self.verifier.client.hedge is not None else self.concurrency
+        connector = aiohttp.TCPConnector(limit=limit, keepalive_timeout=60)
+
+        total = len(rows)
+        completed = 0
+        results = {}
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=self.verifier.client.headers) as session:
+            def record(brand_key, holding, brand, keys, row_result):
+                nonlocal completed
+                results[brand_key] = row_result
+                if journal is not None:
+                    for key in keys:
+                        journal.append(key, row_result)
+                completed += 1
+                self.verifier.metrics.say(VERBOSE, f"Progression: {completed}/{total} - {brand} pour {holding}: "
+                                                   f"{row_result['Statut_Vérification']}")
+
+            async def run(brand_key, holding, brand, row, keys):
+                record(brand_key, holding, brand, keys,
+                       await self.verify_row(session, semaphore, holding, brand, row))
+
+            async def run_batch(holding, batch_rows):
+                # Un appel groupé par lot, puis repli marque par marque pour les non résolues
+                contents = await self.verify_batch(session, semaphore, holding,
+                                                   [args[2] for args in batch_rows],
+                                                   {args[2]: args[3] for args in batch_rows})
+                fallback = []
+                for brand_key, _, brand, row, keys in batch_rows:
+                    if brand in contents:
+                        record(brand_key, holding, brand, keys, self.verifier.build_row_result(contents[brand]))
+                    else:
+                        fallback.append(run(brand_key, holding, brand, row, keys))
+                await asyncio.gather(*fallback)
+
+            if self.verifier.portfolios is not None:
+                rows = await self.resolve_portfolios(session, semaphore, rows, record)
+
+            if self.verifier.batch_size > 1:
+                # Les paires d'une chaîne connue du graphe de propriété restent individuelles
+                by_pair = {(args[1], args[2]): args for args in rows
+                           if self.verifier.known_chain(args[1], args[2]) is None}
+                tasks = [run(*args) for args in rows if (args[1], args[2]) not in by_pair]
+                for holding, brand_names in make_batches(by_pair.keys(), self.verifier.batch_size,
+                                                         self.verifier.template_name):
+                    batch_rows = [by_pair[(holding, brand)] for brand in brand_names]
+                    if len(batch_rows) > 1:
+                        tasks.append(run_batch(holding, batch_rows))
+                    else:
+                        tasks.append(run(*batch_rows[0]))
+                await asyncio.gather(*tasks)
+            else:
+                await asyncio.gather(*(run(*args) for args in rows))
+
+        return results
+
+    def verify_rows(self, indexed_rows, completed, journal):
+        """Vérifie des lignes (index, ligne) et retourne leurs résultats dans l'ordre.
+
+        Une seule vérification par paire (holding, marque), orthographes
+        rapprochées comprises (voir BrandVerification.pair_key), en sautant les
+        lignes déjà terminées dans le journal et, en mode delta, les paires
+        reprises du fichier précédent.
+        """
+        indexed_rows = list(indexed_rows)
+        unique_rows = {}
+        for index, row in indexed_rows:
+            key = row_key(index, row['Holding Name'], row['Brand Name'])
+            if key in completed:
+                continue
+            # Mode delta : paire reprise du fichier de résultats précédent
+            previous = self.verifier.previous
+            if previous is not None and previous.carries(row['Holding Name'], row['Brand Name']):
+                continue
+            brand_key = self.verifier.pair_key(row['Holding Name'], row['Brand Name'])
+            if brand_key not in unique_rows:
+                unique_rows[brand_key] = (brand_key, row['Holding Name'], row['Brand Name'], row, [])
+            unique_rows[brand_key][4].append(key)
+
+        results = asyncio.run(self.verify_all(list(unique_rows.values()), journal)) if unique_rows else {}
+
+        row_results = []
+        for index, row in indexed_rows:
+            key = row_key(index, row['Holding Name'], row['Brand Name'])
+            if key in completed:
+                row_results.append(completed[key])
+                continue
+            carried = self.verifier.carried_result(row['Holding Name'], row['Brand Name'])
+            row_results.append(carried if carried is not None
+                               else results[self.verifier.pair_key(row['Holding Name'], row['Brand Name'])])
+        return row_results
+
+    def process_all_brands(self, input_file, output_file, resume=False, journal_file=None):
+        try:
+            # Lire le fichier source en préservant toutes les colonnes
+            df = read_table(input_file)
+            total_brands = len(df)
+            self.verifier.metrics.say(NORMAL, f"\n{'='*50}\nDébut de la vérification asynchrone de {total_brands} "
+                                              f"marques ({self.concurrency} requêtes simultanées)\n{'='*50}\n")
+
+            self.verifier.add_result_columns(df)
+
+            journal, completed = self.verifier.open_journal(output_file, resume, journal_file)
+
+            try:
+                row_results = self.verify_rows(df.iterrows(), completed, journal)
+            finally:
+                journal.close()
+
+            # Écrire les résultats dans l'ordre d'origine des lignes
+            for index, row_result in zip(df.index, row_results):
+                for col, value in row_result.items():
+                    df.at[index, col] = value
+
+            write_table(df, output_file)
+
+            self.verifier.metrics.say(NORMAL, f"\n{'='*50}\nVérification terminée!\n"
+                                              f"Résultats sauvegardés dans {output_file}\n{'='*50}\n")
+
+            self.verifier.print_summary(df)
+
+        except Exception as e:
+            self.verifier.metrics.say(QUIET, f"\nErreur lors du traitement des marques: {e}")
+            raise e
+        finally:
+            self.verifier.metrics.close()
+
+    def process_all_brands_streaming(self, input_file, output_file, chunksize=5000,
+                                     columns=CATALOG_COLUMNS, resume=False, journal_file=None):
+        """Version asynchrone de BrandVerification.process_all_brands_streaming."""
+        verifier = self.verifier
+        try:
+            verifier.metrics.say(NORMAL, f"\n{'='*50}\nDébut de la vérification asynchrone en flux de {input_file} "
+                                         f"(blocs de {chunksize} lignes, {self.concurrency} requêtes simultanées)"
+                                         f"\n{'='*50}\n")
+
+            journal, completed = verifier.open_journal(output_file, resume, journal_file)
+            writer = open_writer(output_file)
+            counts = {}
+            total_rows = 0
+
+            try:
+                for chunk in read_catalog_chunks(input_file, chunksize, columns):
+                    row_results = self.verify_rows(zip(chunk.index, chunk.to_dict('records')), completed, journal)
+
+                    verifier.add_result_columns(chunk)
+                    if row_results:
+                        for col in row_results[0]:
+                            chunk[col] = [row_result.get(col) for row_result in row_results]
+                    writer.write(chunk)
+
+                    total_rows += len(chunk)
+                    for row_result in row_results:
+                        status = row_result['Statut_Vérification']
+                        counts[status] = counts.get(status, 0) + 1
+                    verifier.metrics.say(NORMAL, f"Bloc terminé: {total_rows} lignes écrites dans {output_file}")
+            finally:
+                journal.close()
+                writer.close()
+
+            self.verifier.metrics.say(NORMAL, f"\n{'='*50}\nVérification terminée!\n"
+                                              f"Résultats sauvegardés dans {output_file}\n{'='*50}\n")
+
+            verifier.print_counts_summary(total_rows, counts)
+
+        except Exception as e:
+            self.verifier.metrics.say(QUIET, f"\nErreur lors du traitement des marques: {e}")
+            raise e
+        finally:
+            self.verifier.metrics.close()
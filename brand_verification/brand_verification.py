@@ -1,20 +1,159 @@
 import pandas as pd
-import requests
-import json
 from typing import Dict, List, Tuple
 import time
 import re
 import csv
+import argparse
+import functools
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from brand_common.cache import VerificationCache
+from brand_common.client import PerplexicaClient
+from brand_common.checkpoint import CheckpointJournal, row_key
+from brand_common.dedup import BrandIndex
+from brand_common.delta import DATE_COLUMN, PreviousResults, verification_date
+from brand_common.matcher import NEGATIVE_PHRASES, configure_patterns, get_matcher
+from brand_common.metrics import DEBUG, NORMAL, QUIET, VERBOSE, PipelineMetrics
+from brand_common.ownership import CONFIRMATION, OwnershipGraph
+from brand_common.portfolio import PortfolioIndex
+from brand_common.response import PORTFOLIO_SCHEMA, VERIFICATION_SCHEMA, parse_answer
+from brand_common.reader import CATALOG_COLUMNS, open_writer, read_catalog_chunks, read_table, write_table
+from brand_common.scoring import STANDARD_WEIGHTS, source_counts, standard_score
+from brand_common.templates import PromptStats, assign_template, configure_prompts, get_template
+from brand_common.tiers import Tier, TierStats, cache_variant, load_tiers
+from brand_common.throttle import CircuitBreaker, HedgePolicy, RateLimiter, backoff_delay
+from brand_common.batching import extract_batch_items, make_batches, source_mentions
+
+# Template de prompt par défaut (brand_common/prompts/templates.json), enregistré
+# dans la clé de cache et dans la colonne Version_Prompt
+PROMPT_VERSION = "verification-en-v1"
+
+SYSTEM_INSTRUCTIONS = get_template(PROMPT_VERSION).system
+
+# Question courte de confirmation d'une chaîne connue du graphe de propriété
+CONFIRMATION_TEMPLATE = "confirmation-en-v1"
+
+# Portefeuille de marques officiel d'une holding (préchargement par holding)
+PORTFOLIO_TEMPLATE = "portfolio-en-v1"
+
+# Colonnes de sortie optionnelles (--source-counts) des compteurs de sources utilisés
+# par le score de confiance, placées avant Version_Prompt
+SOURCE_COUNT_COLUMNS = {
+    'Sources_Officielles': 'official',
+    'Sources_Récentes': 'recent',
+    'Nb_Sources': 'quantity',
+    'Chaîne_Propriété': 'chain'
+}
+
+# Colonnes de résultat ajoutées au fichier d'origine
+RESULT_COLUMNS = [
+    'Propriété_Directe', 'Score_Confiance', 'Type_Relation', 'Zones_Géographiques',
+    'Détails_Relation', 'Explication', 'Sources', 'À_Vérifier', 'Statut_Vérification',
+    'Erreur_Vérification', 'Version_Prompt', DATE_COLUMN
+]
 
 class BrandVerification:
-    def __init__(self):
-        self.perplexica_url = "http://localhost:3000/api/search"
+    def __init__(self, cache=None, client=None):
+        self.chat_model = "gpt-4o-mini"
+        # Pondérations du score de confiance (voir brand_common/scoring.py)
+        self.score_weights = dict(STANDARD_WEIGHTS)
+        # Client HTTP partagé (pool de connexions keep-alive, payload précalculé)
+        self.client = client or PerplexicaClient(
+            chat_model=self.chat_model,
+            system_instructions=SYSTEM_INSTRUCTIONS,
+            optimization_mode="speed",
+            breaker=CircuitBreaker()
+        )
+        # Durées par étape, compteurs et messages selon la verbosité (voir brand_common/metrics.py)
+        self.set_metrics(PipelineMetrics('verification'))
+        # Templates de prompt (voir brand_common/templates.py) ; plusieurs pour un test A/B
+        self.set_prompt_templates([PROMPT_VERSION])
+        # Cache persistant optionnel (VerificationCache)
+        self.cache = cache
+        self.max_attempts = 3
+        self.retry_delay = 2
+        self.max_retry_delay = 30
+        self.request_timeout = 60
+        # Écriture du journal par lots: toutes les N lignes ou toutes les N secondes
+        self.flush_rows = 1
+        self.flush_interval = None
+        # Nombre de marques d'une même holding par requête (1 = pas de regroupement)
+        self.batch_size = 1
+        self.batch_timeout = 180
+        # Colonnes des compteurs de sources (SOURCE_COUNT_COLUMNS) dans le fichier de sortie,
+        # nécessaires à rescore_results.py ; désactivées par défaut pour garder le format d'origine
+        self.write_source_counts = False
+        # Mode delta : résultats de l'exécution précédente (PreviousResults)
+        self.previous = None
+        # Orthographes d'une même paire (holding, marque) vérifiées une seule fois
+        # (voir brand_common/dedup.py) ; None = paires identiques au caractère près
+        self.dedup = BrandIndex()
+        # Graphe de propriété (OwnershipGraph) : chaînes connues résolues sans appel
+        # ou confirmées par une question courte ; None = désactivé
+        self.ownership = None
+        self.confirmation_template = CONFIRMATION_TEMPLATE
+        # Portefeuilles de marques officiels par holding (PortfolioIndex) : une requête par
+        # holding d'au moins `min_brands` marques à vérifier ; None = désactivé
+        self.portfolios = None
+        self.portfolio_template = PORTFOLIO_TEMPLATE
+        self.portfolio_timeout = 180
+        # Paliers de vérification (voir brand_common/tiers.py) : par défaut un seul,
+        # le modèle et le mode du client
+        self.set_tiers([Tier('standard', self.chat_model, "speed", "webSearch")])
 
-    def create_prompt(self, brand_name: str, company_name: str, row: dict) -> str:
-        """
-        Create a prompt for the API to verify brand ownership.
-        The prompt is designed to get factual, verifiable information.
-        """
+    def result_columns(self):
+        """Colonnes de résultat écrites, compteurs de sources compris s'ils sont activés."""
+        if not self.write_source_counts:
+            return list(RESULT_COLUMNS)
+        position = RESULT_COLUMNS.index('Version_Prompt')
+        return RESULT_COLUMNS[:position] + list(SOURCE_COUNT_COLUMNS) + RESULT_COLUMNS[position:]
+
+    def source_count_values(self, counts=None):
+        """Valeurs des colonnes de compteurs de sources (aucune si elles sont désactivées)."""
+        if not self.write_source_counts:
+            return {}
+        counts = counts or {}
+        return {column: counts.get(key) for column, key in SOURCE_COUNT_COLUMNS.items()}
+
+    def set_tiers(self, tiers):
+        """Remplace les paliers de vérification et remet leurs compteurs à zéro."""
+        self.tiers = tiers
+        self.tier_stats = TierStats(tiers)
+
+    def set_metrics(self, metrics):
+        """Remplace l'instrumentation (verbosité, journal JSON Lines, fichier Prometheus), client compris."""
+        self.metrics = metrics
+        self.client.metrics = metrics
+
+    def set_prompt_templates(self, names):
+        """Remplace les templates de prompt ; avec plusieurs, chaque paire reçoit toujours le même."""
+        self.prompt_templates = [get_template(name) for name in names]
+        self.prompt_stats = PromptStats(self.prompt_templates)
+
+    def pair_key(self, holding, brand):
+        """Clé de `verified_brands` : commune aux orthographes rapprochées d'une même paire."""
+        if self.dedup is None:
+            return f"{holding}_{brand}"
+        return self.dedup.key(holding, brand)
+
+    def template_for(self, company_name, brand_name):
+        """Template de prompt d'une paire (holding, marque)."""
+        return assign_template(self.prompt_templates, company_name, brand_name)
+
+    def template_name(self, company_name, brand_name):
+        """Nom du template d'une paire, enregistré dans la clé de cache."""
+        return self.template_for(company_name, brand_name).name
+
+    def promotes(self, index, result):
+        """True si le résultat du palier `index` doit passer au palier suivant."""
+        if index + 1 >= len(self.tiers):
+            return False
+        return self.tiers[index].should_promote(result, self.should_verify_manually(result))
+
+    def build_context(self, row: dict) -> List[str]:
+        """Extrait les informations de contexte (catégories, unité business) d'une ligne."""
         # Extraction du contexte
         product_category = row.get('Class Key - Description', '')
         sub_category = row.get('Group Class Key - Description', '')
@@ -36,416 +175,786 @@ class BrandVerification:
         if business_unit:
             context_info.append(f"Business unit: {business_unit}")
         
-        context_str = "\n".join(context_info)
-        
-        return f"""Please provide factual information about the brand '{brand_name}' and its relationship with '{company_name}'.
-Context information:
-{context_str}
-
-Focus on verifiable facts and include specific details about:
-
-1. Direct and indirect ownership:
-- Is {brand_name} directly owned by {company_name}?
-- If not, is it owned by a subsidiary or brand owned by {company_name}?
-- What is the complete ownership chain (e.g., Brand → Subsidiary → {company_name})?
-- When did each ownership relationship begin?
-- If the brand is owned by another company, verify if that company is owned by {company_name}
-- IMPORTANT: If the brand belongs to another brand that itself belongs to {company_name}, clearly state this in the explanation and set belongs_to to true
-- VERY IMPORTANT: Specifically search for intermediate brands. For example, if {brand_name} belongs to brand X which belongs to {company_name}, this means {brand_name} indirectly belongs to {company_name} and belongs_to should be true
-
-2. Recent changes:
-- Have there been any recent ownership changes (last 2 years)?
-- If the brand has been sold or transferred, when did this occur?
-- What is the current status of the brand?
-- If the brand is not owned by {company_name}, does {company_name} have distribution rights?
-- In which geographical areas does {company_name} have distribution rights?
-- What type of relationship exists (direct ownership, distribution agreement, license, etc.)?
-
-3. Market presence:
-- In which geographical areas is the brand active?
-- What is the main product category of the brand?
-
-4. Historical context:
-- When was the brand acquired or created?
-- Have there been any recent changes in ownership or distribution rights?
-
-Please provide specific sources for your information, such as:
-- Official company websites
-- Trademark registries
-- Annual reports
-- Press releases
-- Official announcements
-- Recent press articles (last 2 years)
-
-If you cannot find verifiable information about the relationship between {brand_name} and {company_name}, please state this clearly.
-
-Format your response in JSON with the following fields:
-{{
-    "belongs_to": true/false,
-    "explanation": "Explanation in French",
-    "sources": ["list of sources"],
-    "zones_geographiques": "List of geographical areas where the brand is active",
-    "type_relation": "Type of relationship (direct ownership, distribution, license, etc.)",
-    "details_relation": "Details about the relationship (dates, conditions, etc.)"
-}}
-
-IMPORTANT: All explanations must be in French."""
+        return context_info
+
+    def create_prompt(self, brand_name: str, company_name: str, row: dict, template=None, **fields) -> str:
+        """
+        Create a prompt for the API to verify brand ownership.
+        The prompt is designed to get factual, verifiable information.
+        """
+        template = template or self.template_for(company_name, brand_name)
+        context_str = "\n".join(self.build_context(row))
+        return template.render(brand=brand_name, holding=company_name, context=context_str, **fields)
 
     def calculate_confidence_score(self, result, sources):
-        """Calculate confidence score based on source quality and quantity."""
-        # Vérification des sources
-        official_sources = 0
-        recent_sources = 0
-        ownership_chain_verified = False
-        
-        # Vérifier les sources dans le contenu
-        if isinstance(result, dict) and 'sources' in result:
-            for source in result['sources']:
-                if isinstance(source, str):
-                    if any(domain in source.lower() for domain in [
-                        '.com', '.org', '.gov', '.edu',
-                        'annualreport', 'financial', 'press-release',
-                        'investor', 'corporate', 'official',
-                        'generalmills', 'sec.gov', 'businesswire',
-                        'autoritedelaconcurrence', 'inpi.fr',
-                        'marques.inpi.fr', 'data.inpi.fr',
-                        'henkel.com', 'henkel.fr',
-                        'marques.ic.gc.ca', 'tmdn.org',
-                        'euipo.europa.eu', 'wipo.int'
-                    ]):
-                        official_sources += 1
-                    if '2023' in source or '2024' in source or '2025' in source:
-                        recent_sources += 1
+        """Calculate confidence score based on source quality and quantity.
+
+        Les compteurs de sources sont conservés dans `result['source_counts']`
+        et repris dans le CSV avec --source-counts : rescore_results.py
+        recalcule les scores hors ligne à partir de ces colonnes.
+        """
+        with self.metrics.stage('scoring'):
+            counts = source_counts(result.get('sources', []), sources)
+            result['source_counts'] = counts
+            score = standard_score(result.get('belongs_to', False), result.get('explanation', ''),
+                                   counts, self.score_weights)
+        if self.metrics.shows(VERBOSE):
+            self.metrics.say(VERBOSE, f"Score de confiance: {score:.1f}% ({counts['official']}/{counts['quantity']} "
+                                      f"sources officielles, {counts['recent']} récentes, chaîne de propriété: "
+                                      f"{'Oui' if counts['chain'] else 'Non'})")
+        return score
+
+    def build_query(self, brand_name, company_name, row=None, template=None, **fields):
+        """Construit la question envoyée à Perplexica pour une marque (`fields` : champs propres au template)."""
+        # Convertir row en dict si c'est une Series pandas
+        if isinstance(row, pd.Series):
+            row = row.to_dict()
+        return self.create_prompt(brand_name, company_name, row or {}, template, **fields)
+
+    def create_batch_prompt(self, company_name: str, brand_names: List[str], rows: Dict[str, dict],
+                            template=None) -> str:
+        """
+        Create a single prompt verifying several brands of the same company.
+        The answer is a JSON array with one object per brand.
+        """
+        template = template or self.template_for(company_name, brand_names[0]).batch
+        brand_lines = []
+        for i, brand_name in enumerate(brand_names, 1):
+            row = rows.get(brand_name)
+            context = "; ".join(self.build_context(row if row is not None else {}))
+            brand_lines.append(f"{i}. '{brand_name}'" + (f" ({context})" if context else ""))
+        return template.render(holding=company_name, brands="\n".join(brand_lines))
+
+    def build_batch_query(self, company_name, brand_names, rows=None, template=None):
+        """Construit la question d'une requête groupée pour plusieurs marques d'une holding."""
+        return self.create_batch_prompt(company_name, brand_names, rows or {}, template)
+
+    def parse_batch_response(self, result, brand_names):
+        """Découpe et score une réponse groupée ; retourne {marque: résultat}.
+
+        Les marques absentes ou invalides dans la réponse sont omises et
+        seront vérifiées individuellement.
+        """
+        if not result or 'message' not in result:
+            return {}
+        with self.metrics.stage('parse'):
+            items = extract_batch_items(result['message'], brand_names)
+        if items is None:
+            self.metrics.say(VERBOSE, "Réponse groupée invalide, vérification marque par marque")
+            return {}
         
-        # Vérifier les sources de l'API
-        for source in sources:
-            if isinstance(source, dict):
-                metadata = source.get('metadata', {})
-                url = metadata.get('url', '').lower()
-                title = metadata.get('title', '').lower()
-                content = metadata.get('content', '').lower()
+        api_sources = result.get('sources', [])
+        contents = {}
+        for brand_name, content in items.items():
+            content = VERIFICATION_SCHEMA.validate(content)
+            if content is None:
+                continue
+            # Sources de l'API qui concernent cette marque, puis sources du contenu
+            sources = [source for source in api_sources if source_mentions(source, brand_name)]
+            sources.extend(content.get('sources', []))
+            content['confidence'] = self.calculate_confidence_score(content, sources)
+            if content['confidence'] > 0 or content['belongs_to']:
+                contents[brand_name] = content
+        return contents
+
+    def run_steps(self, steps, send):
+        """Exécute des étapes de vérification (générateur) en envoyant chacune de leurs requêtes.
+
+        Les étapes (verification_steps, batch_steps, portfolio_steps) portent
+        la logique commune aux moteurs séquentiel et asyncio : chaque requête
+        produite est passée à `send`, dont le résultat (ou l'exception) est
+        renvoyé au générateur. Retourne la valeur finale des étapes.
+        """
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    reply = send(*request)
+                except Exception as e:
+                    request = steps.throw(e)
+                else:
+                    request = steps.send(reply)
+        except StopIteration as done:
+            return done.value
+
+    def send_request(self, query, template, timeout, tier_index=0, schema=None):
+        """Envoie une question avec le modèle et les modes d'un palier ; retourne le JSON de la réponse."""
+        tier = self.tiers[tier_index]
+        response = self.client.post(
+            query,
+            timeout=timeout,
+            schema=schema,
+            system_instructions=template.system,
+            **tier.post_options()
+        )
+        self.tier_stats.record_call(tier, response.elapsed_time)
+        result = response.json()
+        self.metrics.record_tokens(self.prompt_stats.record_request(template, query, result, response.elapsed_time))
+        self.metrics.say(DEBUG, "Perplexica API response:", result)
+        return result
+
+    def batch_steps(self, brand_names, company_name, rows=None):
+        """Étapes d'une requête groupée (voir run_steps) : produit (question, template, timeout).
+
+        Retourne {marque: résultat} pour les marques résolues, en cache ou
+        par la réponse groupée.
+        """
+        # Les marques d'un lot partagent le même template (voir prefetch_batches)
+        template = self.template_for(company_name, brand_names[0]).batch
+        if template is None:
+            self.metrics.say(VERBOSE, f"Pas de template groupé pour {self.template_for(company_name, brand_names[0]).name}, "
+                                      "vérification marque par marque")
+            return {}
+        with self.metrics.unit('batch', holding=company_name, brands=len(brand_names)) as unit:
+            contents = {}
+            pending = []
+            for brand_name in brand_names:
+                cached = (self.get_cached_result(brand_name, company_name)
+                          or self.get_cached_result(brand_name, company_name, template.name))
+                if cached is not None:
+                    contents[brand_name] = cached
+                else:
+                    pending.append(brand_name)
+            
+            if pending:
+                self.metrics.say(VERBOSE, f"\nVérification groupée de {len(pending)} marques pour {company_name}...")
+                try:
+                    # Les requêtes groupées passent par le premier palier
+                    with self.metrics.stage('prompt'):
+                        query = self.build_batch_query(company_name, pending, rows, template)
+                    result = yield query, template, self.batch_timeout
+                    parsed = self.parse_batch_response(result, pending)
+                except Exception as e:
+                    self.metrics.say(VERBOSE, f"Erreur lors de la vérification groupée pour {company_name}: {str(e)}")
+                    unit.error = str(e)
+                    parsed = {}
                 
-                # Vérification des sources officielles
-                if any(domain in url for domain in [
-                    '.com', '.org', '.gov', '.edu',
-                    'annualreport', 'financial', 'press-release',
-                    'investor', 'corporate', 'official',
-                    'generalmills', 'sec.gov', 'businesswire',
-                    'autoritedelaconcurrence', 'inpi.fr',
-                    'marques.inpi.fr', 'data.inpi.fr',
-                    'henkel.com', 'henkel.fr',
-                    'marques.ic.gc.ca', 'tmdn.org',
-                    'euipo.europa.eu', 'wipo.int'
-                ]):
-                    official_sources += 1
+                for brand_name, content in parsed.items():
+                    content['prompt_version'] = template.name
+                    self.store_result(brand_name, company_name, content, template.name)
+                    self.record_ownership(company_name, brand_name, content)
+                    contents[brand_name] = content
+                self.metrics.say(VERBOSE, f"{len(parsed)}/{len(pending)} marques de {company_name} "
+                                          "résolues par la requête groupée")
+            
+            self.metrics.count('batched_rows', len(contents))
+            unit.status = 'Succès' if contents else 'Échec'
+        return contents
+
+    def verify_brands_batch(self, brand_names, company_name, rows=None):
+        """Vérifie plusieurs marques d'une holding en un seul appel Perplexica.
+
+        Retourne {marque: résultat} pour les marques résolues ; en cas de
+        réponse malformée ou d'erreur, les marques manquantes sont laissées
+        à la vérification individuelle.
+        """
+        return self.run_steps(self.batch_steps(brand_names, company_name, rows), self.send_request)
+
+    def carried_result(self, holding, brand):
+        """Résultat repris du fichier précédent en mode delta, ou None."""
+        if self.previous is None:
+            return None
+        return self.previous.get(holding, brand)
+
+    def pending_pairs(self, records, verified_brands, completed):
+        """Paires (holding, marque) restant à vérifier, une par clé de paire, et leurs lignes.
+
+        `records` est une liste (index, ligne). Les lignes terminées, les
+        paires déjà résolues ou reprises en mode delta et celles dont la
+        chaîne est connue du graphe de propriété (résolues ou confirmées par
+        process_row) sont écartées. Retourne (paires, {holding: {marque: ligne}}).
+        """
+        rows = {}
+        pairs = []
+        queued = set()
+        for index, row in records:
+            holding, brand = row['Holding Name'], row['Brand Name']
+            brand_key = self.pair_key(holding, brand)
+            if row_key(index, holding, brand) in completed or brand_key in verified_brands or brand_key in queued:
+                continue
+            if self.previous is not None and self.previous.carries(holding, brand):
+                continue
+            if self.known_chain(holding, brand) is not None:
+                continue
+            queued.add(brand_key)
+            rows.setdefault(holding, {}).setdefault(brand, row)
+            pairs.append((holding, brand))
+        return pairs, rows
+
+    def prefetch_batches(self, records, verified_brands, completed):
+        """Vérifie par lots les paires (holding, marque) restantes avant la boucle par ligne.
+
+        Les résultats alimentent `verified_brands` ; process_row ne rappelle
+        l'API que pour les marques non résolues.
+        """
+        pairs, rows = self.pending_pairs(records, verified_brands, completed)
+        for holding, brand_names in make_batches(pairs, self.batch_size, self.template_name):
+            if len(brand_names) < 2:
+                continue
+            contents = self.verify_brands_batch(brand_names, holding, rows[holding])
+            for brand_name, content in contents.items():
+                verified_brands[self.pair_key(holding, brand_name)] = self.build_row_result(content)
+
+    def parse_portfolio_response(self, result):
+        """Portefeuille validé (PORTFOLIO_SCHEMA) d'une réponse, sources de l'API comprises ; None s'il est vide."""
+        if not result or 'message' not in result:
+            return None
+        with self.metrics.stage('parse'):
+            content = parse_answer(result['message'], PORTFOLIO_SCHEMA)
+        if content is None or not content['brands']:
+            self.metrics.say(VERBOSE, "Portefeuille de marques invalide ou vide")
+            return None
+        content['sources'] = result.get('sources', []) + content.get('sources', [])
+        return content
+
+    def get_cached_portfolio(self, holding, template, brand_names=()):
+        """Portefeuille d'une holding en cache (marque vide, premier palier), ou None.
+
+        None aussi si une des marques `brand_names` à rapprocher est revérifiée
+        en mode delta : le portefeuille est alors redemandé.
+        """
+        if self.cache is None or any(self.needs_refresh(holding, brand) for brand in brand_names):
+            return None
+        content = self.cache.get(holding, '', template.name, self.tiers[0].chat_model, cache_variant(self.tiers, 0))
+        self.metrics.count('cache_misses' if content is None else 'cache_hits')
+        return content
+
+    def store_portfolio(self, holding, template, content):
+        """Enregistre un portefeuille valide dans le cache."""
+        if content is not None and self.cache is not None:
+            self.cache.put(holding, '', template.name, self.tiers[0].chat_model, content, cache_variant(self.tiers, 0))
+
+    def portfolio_steps(self, holding, brand_names=()):
+        """Étapes de la demande de portefeuille d'une holding (voir run_steps) ; retourne le Portfolio, ou None."""
+        template = get_template(self.portfolio_template)
+        with self.metrics.unit('portfolio', holding=holding) as unit:
+            content = self.get_cached_portfolio(holding, template, brand_names)
+            if content is None:
+                self.metrics.say(VERBOSE, f"\nDemande du portefeuille de marques de {holding}...")
+                try:
+                    with self.metrics.stage('prompt'):
+                        query = template.render(holding=holding)
+                    result = yield query, template, self.portfolio_timeout
+                    content = self.parse_portfolio_response(result)
+                except Exception as e:
+                    self.metrics.say(VERBOSE, f"Erreur lors de la demande du portefeuille de {holding}: {str(e)}")
+                    unit.error = str(e)
+                self.store_portfolio(holding, template, content)
+            portfolio = self.portfolios.add(holding, content, template.name)
+            unit.status = 'Succès' if portfolio is not None else 'Échec'
+        return portfolio
+
+    def fetch_portfolio(self, holding, brand_names=()):
+        """Demande le portefeuille de marques officiel d'une holding (ou le relit en cache) et l'indexe.
+
+        Une seule tentative : en cas d'échec, les marques de la holding sont
+        vérifiées une par une. `brand_names` sont les marques à rapprocher
+        (voir get_cached_portfolio). Retourne le Portfolio, ou None.
+        """
+        return self.run_steps(self.portfolio_steps(holding, brand_names), self.send_request)
+
+    def portfolio_result(self, holding, brand_name):
+        """Résultat scoré d'une marque trouvée sans ambiguïté dans le portefeuille de sa holding, ou None."""
+        content, sources = self.portfolios.match(holding, brand_name)
+        if content is None:
+            return None
+        content['confidence'] = self.calculate_confidence_score(content, sources + content['sources'])
+        self.record_ownership(holding, brand_name, content)
+        return content
+
+    def portfolio_results(self, holding, brand_names):
+        """Résultats des marques d'une holding trouvées dans son portefeuille déjà demandé : {marque: résultat}."""
+        contents = {}
+        for brand_name in brand_names:
+            content = self.portfolio_result(holding, brand_name)
+            if content is not None:
+                contents[brand_name] = content
+        self.metrics.count('batched_rows', len(contents))
+        self.metrics.say(VERBOSE, f"{len(contents)}/{len(brand_names)} marques de {holding} résolues par son "
+                                  "portefeuille de marques")
+        return contents
+
+    def prefetch_portfolios(self, records, verified_brands, completed):
+        """Résout les marques restantes des grandes holdings par leur portefeuille de marques officiel.
+
+        Une requête par holding retenue (voir PortfolioIndex.select) au lieu
+        d'une par marque ; les marques trouvées alimentent `verified_brands`,
+        les marques absentes ou ambiguës restent à la vérification marque
+        par marque (requêtes groupées comprises).
+        """
+        pairs, _ = self.pending_pairs(records, verified_brands, completed)
+        for holding, brand_names in self.portfolios.select(pairs).items():
+            if not self.portfolios.known(holding):
+                self.fetch_portfolio(holding, brand_names)
+            for brand_name, content in self.portfolio_results(holding, brand_names).items():
+                verified_brands[self.pair_key(holding, brand_name)] = self.build_row_result(content)
+
+    def parse_response(self, result):
+        """Extrait et score le JSON d'une réponse Perplexica, ou None si invalide."""
+        if result and 'message' in result:
+            # Extraire le JSON de la réponse (blocs de code, texte autour, apostrophes,
+            # virgules finales tolérés) et le valider contre le schéma attendu
+            with self.metrics.stage('parse'):
+                content = parse_answer(result['message'], VERIFICATION_SCHEMA)
+            if content is None:
+                self.metrics.say(VERBOSE, "Réponse JSON invalide ou incomplète")
+                return None
+            # Calculate confidence score
+            sources = result.get('sources', [])
+            # Ajouter les sources du contenu si elles existent
+            if 'sources' in content:
+                sources.extend(content['sources'])
+            content['confidence'] = self.calculate_confidence_score(content, sources)
+            # Si la réponse est positive ou score > 0, on retourne
+            if content['confidence'] > 0 or content['belongs_to']:
+                return content
+        return None
+
+    def default_result(self):
+        """Résultat retourné lorsque toutes les tentatives ont échoué."""
+        return {
+            'belongs_to': False,
+            'confidence': 0,
+            'explanation': "Échec de la vérification - Pas de réponse de l'API",
+            'sources': [],
+            'type_relation': "Non déterminé",
+            'zones_geographiques': "Non applicable",
+            'details_relation': "Vérification impossible"
+        }
+
+    def needs_refresh(self, holding, brand):
+        """True si la paire est revérifiée en mode delta (trop ancienne ou peu sûre) : ni cache, ni graphe."""
+        return self.previous is not None and self.previous.needs_refresh(holding, brand)
+
+    def get_cached_result(self, brand_name, company_name, prompt_version=None, tier_index=0):
+        """Retourne le résultat en cache pour cette marque et ce palier, s'il existe."""
+        if self.cache is None:
+            return None
+        if self.needs_refresh(company_name, brand_name):
+            return None
+        prompt_version = prompt_version or self.template_name(company_name, brand_name)
+        cached = self.cache.get(company_name, brand_name, prompt_version,
+                                self.tiers[tier_index].chat_model, cache_variant(self.tiers, tier_index))
+        self.metrics.count('cache_misses' if cached is None else 'cache_hits')
+        if cached is not None:
+            self.metrics.say(VERBOSE, f"\nRésultat en cache pour {brand_name} ({company_name})")
+            # Résultats mis en cache avant la colonne Version_Prompt
+            cached.setdefault('prompt_version', prompt_version)
+        return cached
+
+    def store_result(self, brand_name, company_name, content, prompt_version=None, tier_index=0):
+        """Enregistre un résultat valide dans le cache."""
+        if self.cache is not None:
+            self.cache.put(company_name, brand_name, prompt_version or self.template_name(company_name, brand_name),
+                           self.tiers[tier_index].chat_model, content, cache_variant(self.tiers, tier_index))
+
+    def known_chain(self, holding, brand):
+        """Chaîne marque → holding connue du graphe de propriété et assez sûre, ou None."""
+        if self.ownership is None or self.needs_refresh(holding, brand):
+            return None
+        return self.ownership.known_chain(holding, brand)
+
+    def chain_result(self, chain):
+        """Résultat d'une ligne résolue par une chaîne connue, sans appel à l'API."""
+        self.ownership.count('resolved')
+        self.metrics.say(VERBOSE, f"\nChaîne de propriété connue: {chain.describe()} ({chain.confidence:.0f}%)")
+        return chain.result()
+
+    def confirms(self, company_name, brand_name, content):
+        """Enregistre la réponse à une question de confirmation ; True si la chaîne est confirmée."""
+        if content is not None and content['belongs_to']:
+            self.ownership.record_result(company_name, brand_name, content, CONFIRMATION)
+            self.ownership.count('confirmed')
+            return True
+        self.metrics.say(VERBOSE, f"\nChaîne non confirmée pour {brand_name}, vérification complète")
+        self.ownership.count('rejected')
+        return False
+
+    def record_ownership(self, company_name, brand_name, result):
+        """Ajoute (ou retire) le lien marque → holding d'un résultat de vérification au graphe de propriété."""
+        if self.ownership is not None:
+            self.ownership.record_result(company_name, brand_name, result)
+
+    def verification_steps(self, brand_name, company_name):
+        """Étapes de la vérification d'une marque (voir run_steps) : produit (palier, template, champs).
+
+        Chaque étape demande une vérification au palier donné (voir
+        verify_brand_with_tier) et reçoit son résultat, ou None. Retourne le
+        résultat gardé.
+        """
+        chain = self.known_chain(company_name, brand_name)
+        if chain is not None:
+            if self.ownership.resolves(chain):
+                return self.chain_result(chain)
+            content = yield 0, get_template(self.confirmation_template), {'chain': chain.describe()}
+            if self.confirms(company_name, brand_name, content):
+                return content
+        
+        result = None
+        for index, tier in enumerate(self.tiers):
+            if index:
+                self.metrics.say(VERBOSE, f"\nRésultat incertain pour {brand_name}, passage au palier {tier.name}")
+            content = yield index, None, {}
+            if content is not None:
+                # La ligne se termine au palier qui a produit le résultat gardé
+                result, result_tier = content, tier
+            if not self.promotes(index, result):
+                break
+        if result is None:
+            # Si tout échoue, retourner un résultat par défaut
+            return self.default_result()
+        self.tier_stats.record_finish(result_tier)
+        self.record_ownership(company_name, brand_name, result)
+        return result
+
+    def verify_brand(self, brand_name, company_name, row=None):
+        """Vérifie si une marque appartient à une entreprise.
+
+        Une chaîne connue du graphe de propriété résout la ligne sans appel
+        au-dessus de `resolve_confidence`, sinon une question courte la
+        confirme. Les paliers sont ensuite essayés dans l'ordre : une ligne
+        n'est promue au palier suivant que si son résultat est jugé
+        incertain, et le résultat valide du palier le plus élevé remplace
+        les précédents.
+        """
+        def verify(tier_index, template, fields):
+            return self.verify_brand_with_tier(brand_name, company_name, row, tier_index, template, **fields)
+        return self.run_steps(self.verification_steps(brand_name, company_name), verify)
+
+    def tier_query(self, brand_name, company_name, row=None, tier_index=0, template=None, **fields):
+        """Résultat en cache d'une vérification à un palier, ou question à envoyer : (résultat, template, question)."""
+        cached = self.get_cached_result(brand_name, company_name, template.name if template else None, tier_index)
+        if cached is not None:
+            return cached, template, None
+        template = template or self.template_for(company_name, brand_name)
+        with self.metrics.stage('prompt'):
+            query = self.build_query(brand_name, company_name, row, template, **fields)
+        self.metrics.say(DEBUG, f"\nVerifying {brand_name} for {company_name}...")
+        return None, template, query
+
+    def tier_result(self, brand_name, company_name, tier_index, template, result):
+        """Résultat validé (et mis en cache) d'une réponse à un palier, ou None si elle est invalide."""
+        content = self.parse_response(result)
+        if content is not None:
+            content['prompt_version'] = template.name
+            self.store_result(brand_name, company_name, content, template.name, tier_index)
+        return content
+
+    def verify_brand_with_tier(self, brand_name, company_name, row=None, tier_index=0, template=None, **fields):
+        """Vérifie une marque avec le modèle et les modes d'un palier ; None si tout échoue.
+
+        `template` remplace le template de la paire (question de confirmation
+        par exemple), `fields` complète sa question.
+        """
+        cached, template, query = self.tier_query(brand_name, company_name, row, tier_index, template, **fields)
+        if cached is not None:
+            return cached
+        
+        attempt = 1
+        while attempt <= self.max_attempts:
+            try:
+                result = self.send_request(query, template, self.request_timeout, tier_index, VERIFICATION_SCHEMA)
+                content = self.tier_result(brand_name, company_name, tier_index, template, result)
+                if content is not None:
+                    return content
                 
-                # Vérification des sources récentes (moins de 2 ans)
-                if '2023' in title or '2024' in title or '2025' in title:
-                    recent_sources += 1
+                self.metrics.say(VERBOSE, f"Réponse invalide de l'API pour {brand_name} "
+                                          f"(tentative {attempt}/{self.max_attempts})")
                 
-                # Vérification de la chaîne de propriété
-                if 'subsidiary' in content or 'owned by' in content or 'acquisition' in content:
-                    ownership_chain_verified = True
-        
-        # Règle 1: Source officielle directe = 100%
-        if result.get('belongs_to', False) and official_sources > 0:
-            return 100
+            except Exception as e:
+                self.metrics.say(VERBOSE, f"Erreur lors de la vérification de {brand_name} "
+                                          f"(tentative {attempt}/{self.max_attempts}): {str(e)}")
+            
+            attempt += 1
+            if attempt <= self.max_attempts:
+                self.client.record_retry()
+                # Back-off exponentiel avec jitter : les échecs simultanés ne réessaient pas ensemble
+                time.sleep(backoff_delay(attempt - 2, self.retry_delay, self.max_retry_delay))
+
+        return None
+
+    def build_row_result(self, result):
+        """Convertit un résultat de vérification en valeurs de colonnes de sortie."""
+        # Format sources
+        sources = self.format_sources(result.get('sources', []))
         
-        # Règle 2: Calcul du score pour les autres cas
-        source_quantity = len(sources) + len(result.get('sources', []))
-        source_quality = (official_sources / max(source_quantity, 1)) * 100
-        recency_score = (recent_sources / max(source_quantity, 1)) * 100
+        # Determine if manual verification is needed
+        needs_verification = self.should_verify_manually(result)
         
-        # Score de base selon la propriété
-        base_score = 80 if result.get('belongs_to', False) else 20
+        # Compteurs de sources (absents des résultats en cache antérieurs)
+        counts = result.get('source_counts') or {}
+        prompt_version = result.get('prompt_version', '')
+        if prompt_version:
+            self.prompt_stats.record_row(prompt_version)
         
-        # Calcul du score final avec pondération
-        final_score = (
-            base_score * 0.4 +  # Score de base (40%)
-            source_quality * 0.4 +  # Qualité des sources (40%)
-            recency_score * 0.2  # Actualité des sources (20%)
-        )
+        return {
+            'Propriété_Directe': result['belongs_to'],
+            'Score_Confiance': result['confidence'],
+            'Type_Relation': result.get('type_relation', 'Propriété directe'),
+            'Zones_Géographiques': result.get('zones_geographiques', ''),
+            'Détails_Relation': result.get('details_relation', ''),
+            'Explication': result['explanation'],
+            'Sources': sources,
+            'À_Vérifier': needs_verification,
+            'Statut_Vérification': 'Succès',
+            'Erreur_Vérification': '',
+            **self.source_count_values(counts),
+            'Version_Prompt': prompt_version,
+            DATE_COLUMN: verification_date()
+        }
+
+    def build_failure_row_result(self, status, error, explanation):
+        """Valeurs de colonnes pour une vérification en échec ou en erreur."""
+        return {
+            'Propriété_Directe': False,
+            'Score_Confiance': 0,
+            'Type_Relation': 'Propriété directe',
+            'Zones_Géographiques': '',
+            'Détails_Relation': '',
+            'Explication': explanation,
+            'Sources': '',
+            'À_Vérifier': True,
+            'Statut_Vérification': status,
+            'Erreur_Vérification': error,
+            **self.source_count_values(),
+            'Version_Prompt': '',
+            DATE_COLUMN: verification_date()
+        }
+
+    def add_result_columns(self, df):
+        """Ajoute les colonnes de résultat avec leurs valeurs par défaut."""
+        # Créer les nouvelles colonnes avec des valeurs par défaut
+        new_columns = {
+            'Propriété_Directe': False,
+            'Score_Confiance': 0.0,  # float: les scores calculés ne sont pas entiers
+            'Type_Relation': 'Propriété directe',
+            'Zones_Géographiques': '',
+            'Détails_Relation': '',
+            'Explication': '',
+            'Sources': '',
+            'À_Vérifier': True,
+            'Statut_Vérification': 'Non vérifié',
+            'Erreur_Vérification': '',
+            # Vides tant que la ligne n'est pas vérifiée
+            **self.source_count_values(),
+            'Version_Prompt': '',
+            DATE_COLUMN: None
+        }
         
-        # Bonus pour les informations très fiables
-        if official_sources >= 2:
-            final_score = min(100, final_score * 1.2)
+        # Ajouter les nouvelles colonnes au DataFrame
+        for col_name, default_value in new_columns.items():
+            df[col_name] = default_value
+
+    def print_summary(self, df):
+        """Affiche un résumé des résultats."""
+        self.print_counts_summary(len(df), df['Statut_Vérification'].value_counts().to_dict())
+
+    def print_counts_summary(self, total_verifies, counts):
+        """Affiche un résumé à partir du nombre de lignes par statut."""
+        succes = counts.get('Succès', 0)
+        echecs = counts.get('Échec', 0)
+        erreurs = counts.get('Erreur', 0)
         
-        # Bonus pour la vérification de la chaîne de propriété
-        if ownership_chain_verified:
-            final_score = min(100, final_score * 1.15)
+        say = functools.partial(self.metrics.say, NORMAL)
+        say("\nRésumé des résultats:")
+        say(f"Total des marques vérifiées: {total_verifies}")
+        say(f"Vérifications réussies: {succes}")
+        say(f"Échecs de vérification: {echecs}")
+        say(f"Erreurs: {erreurs}")
+        say(self.client.summary())
+        say(self.tier_stats.summary())
+        say(self.prompt_stats.summary())
+        if self.cache is not None:
+            say(self.cache.summary())
+        if self.previous is not None:
+            say(self.previous.summary())
+        if self.dedup is not None:
+            say(self.dedup.summary())
+        if self.ownership is not None:
+            say(self.ownership.summary())
+        if self.portfolios is not None:
+            say(self.portfolios.summary())
+        say(self.metrics.summary())
+
+    def open_journal(self, output_file, resume=False, journal_file=None):
+        """Ouvre le journal de reprise et retourne (journal, lignes déjà terminées)."""
+        journal = CheckpointJournal(journal_file or f"{output_file}.journal.jsonl",
+                                    flush_rows=self.flush_rows, flush_interval=self.flush_interval)
+        completed = journal.load() if resume else {}
+        if resume:
+            self.metrics.say(NORMAL, f"Reprise: {len(completed)} lignes déjà terminées dans {journal.path}")
+            if journal.skipped_lines:
+                self.metrics.say(NORMAL, f"{journal.skipped_lines} lignes incomplètes ignorées dans le journal")
+        journal.open(resume=resume)
+        return journal, completed
+
+    def process_row(self, index, row, total_brands, verified_brands, completed, journal):
+        """Vérifie une ligne du catalogue et retourne ses valeurs de colonnes.
+
+        Réutilise le journal (reprise) puis les marques déjà vérifiées pendant
+        l'exécution avant d'interroger l'API ; le résultat est journalisé.
+        """
+        holding = row['Holding Name']
+        brand = row['Brand Name']
+        brand_key = self.pair_key(holding, brand)
+        key = row_key(index, holding, brand)
         
-        # Malus pour les informations potentiellement obsolètes
-        if recent_sources == 0 and 'sold' in result.get('explanation', '').lower():
-            final_score = max(0, final_score * 0.7)
+        # Ligne terminée lors d'une exécution précédente
+        if key in completed:
+            verified_brands.setdefault(brand_key, completed[key])
+            return completed[key]
         
-        print(f"\nDétail du calcul du score de confiance:")
-        print(f"- Score de base: {base_score}%")
-        print(f"- Qualité des sources: {source_quality}% ({official_sources}/{source_quantity} sources officielles)")
-        print(f"- Actualité des sources: {recency_score}% ({recent_sources}/{source_quantity} sources récentes)")
-        print(f"- Chaîne de propriété vérifiée: {'Oui' if ownership_chain_verified else 'Non'}")
-        print(f"- Score final: {final_score}%")
+        # Mode delta : ligne reprise du fichier de résultats précédent ; elle n'est
+        # pas journalisée, une reprise relit le même fichier
+        carried = self.carried_result(holding, brand)
+        if carried is not None:
+            return carried
         
-        return min(100, max(0, final_score))
-
-    def verify_brand(self, brand_name, company_name, row=None):
-        """Vérifie si une marque appartient à une entreprise."""
-        print(f"\nVerifying {brand_name} for {company_name}...")
-        print("Sending request to Perplexica API for", brand_name, "...\n")
+        # Vérifier si la marque a déjà été traitée
+        if brand_key in verified_brands:
+            self.metrics.say(VERBOSE, f"\n{'-'*50}\nMarque déjà vérifiée: {brand} pour {holding}\n"
+                                      f"Utilisation du résultat précédent\n{'-'*50}\n")
+            result = verified_brands[brand_key]
+            journal.append(key, result)
+            return result
         
-        # Convertir row en dict si c'est une Series pandas
-        if isinstance(row, pd.Series):
-            row = row.to_dict()
+        progress = f"Progression: {index + 1}/{total_brands}" if total_brands else f"Progression: ligne {index + 1}"
+        self.metrics.say(VERBOSE, f"\n{'-'*50}\n{progress}\nVérification de {brand} pour {holding}\n{'-'*50}")
         
-        max_attempts = 3
-        attempt = 1
-        while attempt <= max_attempts:
-            print(f"Tentative {attempt}/{max_attempts}")
+        with self.metrics.unit('row', holding=holding, brand=brand) as unit:
             try:
-                payload = {
-                    "chatModel": {
-                        "provider": "openai",
-                        "name": "gpt-4o-mini"
-                    },
-                    "embeddingModel": {
-                        "provider": "openai",
-                        "name": "text-embedding-3-large"
-                    },
-                    "optimizationMode": "speed",
-                    "focusMode": "webSearch",
-                    "query": self.create_prompt(brand_name, company_name, row or {}),
-                    "history": [],
-                    "systemInstructions": """Tu es un expert en vérification de propriété de marque. Ta tâche est de déterminer si une marque appartient à une entreprise spécifique.
-Suis ces directives strictes:
-1. Utilise UNIQUEMENT des sources officielles et fiables
-2. N'utilise JAMAIS Wikipedia ou autre contenu collaboratif
-3. Vérifie d'abord les sites web officiels des entreprises
-4. Recherche les annonces d'acquisition
-5. Vérifie via plusieurs sources fiables
-6. Vérifie la propriété indirecte via les filiales ou sociétés mères
-7. Réponds TOUJOURS en français
-8. Inclus les zones géographiques et les détails de la relation
-Retourne une réponse JSON avec les champs requis.""",
-                    "stream": False
-                }
-                
-                response = requests.post(
-                    self.perplexica_url,
-                    json=payload,
-                    timeout=60
-                )
-                response.raise_for_status()
-                result = response.json()
-                print("Perplexica API response:", result)
-                
-                if result and 'message' in result:
-                    try:
-                        # Extraire le JSON de la réponse
-                        message = result['message']
-                        json_start = message.find('{')
-                        json_end = message.rfind('}') + 1
-                        if json_start != -1 and json_end != -1:
-                            json_str = message[json_start:json_end]
-                            content = json.loads(json_str)
-                            if isinstance(content, dict) and 'belongs_to' in content:
-                                # Calculate confidence score
-                                sources = result.get('sources', [])
-                                # Ajouter les sources du contenu si elles existent
-                                if 'sources' in content:
-                                    sources.extend(content['sources'])
-                                content['confidence'] = self.calculate_confidence_score(content, sources)
-                                # Si la réponse est positive ou score > 0, on retourne
-                                if content['confidence'] > 0 or content['belongs_to']:
-                                    return content
-                    except json.JSONDecodeError as e:
-                        print(f"Erreur de parsing JSON: {str(e)}")
-                
-                print("Réponse invalide de l'API")
-                attempt += 1
-                time.sleep(2)
+                # Vérification de la marque
+                result = self.verify_brand(brand, holding, row)
                 
+                if result:
+                    self.metrics.say(VERBOSE, f"\nRésultat de la vérification:\n"
+                                              f"- Appartient à {holding}: {result['belongs_to']}\n"
+                                              f"- Confiance: {result['confidence']}%")
+                    
+                    row_result = self.build_row_result(result)
+                else:
+                    self.metrics.say(NORMAL, f"\nÉchec de la vérification de {brand} pour {holding}")
+                    row_result = self.build_failure_row_result(
+                        'Échec',
+                        'Échec de la vérification - Pas de réponse de l\'API',
+                        'Échec de la vérification'
+                    )
+            
             except Exception as e:
-                print(f"Erreur lors de la vérification: {str(e)}")
-                attempt += 1
-                time.sleep(2)
-
-        # Si tout échoue, retourner un résultat par défaut
-        return {
-            'belongs_to': False,
-            'confidence': 0,
-            'explanation': "Échec de la vérification - Pas de réponse de l'API",
-            'sources': [],
-            'type_relation': "Non déterminé",
-            'zones_geographiques': "Non applicable",
-            'details_relation': "Vérification impossible"
-        }
+                self.metrics.say(NORMAL, f"\nErreur lors de la vérification de {brand}: {str(e)}")
+                row_result = self.build_failure_row_result('Erreur', str(e), f'Erreur: {str(e)}')
+            unit.status = row_result['Statut_Vérification']
+            unit.error = row_result['Erreur_Vérification'] or None
+        
+        journal.append(key, row_result)
+        
+        # Stocker le résultat dans le dictionnaire des marques vérifiées
+        verified_brands[brand_key] = row_result
+        
+        self.metrics.say(VERBOSE, f"\nRésultat enregistré pour {brand}\n{'-'*50}\n")
+        return row_result
 
-    def process_all_brands(self, input_file, output_file):
+    def process_all_brands(self, input_file, output_file, resume=False, journal_file=None):
         try:
             # Lire le fichier source en préservant toutes les colonnes
-            df = pd.read_csv(input_file)
+            df = read_table(input_file)
             total_brands = len(df)
-            print(f"\n{'='*50}")
-            print(f"Début de la vérification de {total_brands} marques")
-            print(f"{'='*50}\n")
+            self.metrics.say(NORMAL, f"\n{'='*50}\nDébut de la vérification de {total_brands} marques\n{'='*50}\n")
             
             # Dictionnaire pour stocker les résultats déjà vérifiés
             verified_brands = {}
             
-            # Créer les nouvelles colonnes avec des valeurs par défaut
-            new_columns = {
-                'Propriété_Directe': False,
-                'Score_Confiance': 0,
-                'Type_Relation': 'Propriété directe',
-                'Zones_Géographiques': '',
-                'Détails_Relation': '',
-                'Explication': '',
-                'Sources': '',
-                'À_Vérifier': True,
-                'Statut_Vérification': 'Non vérifié',
-                'Erreur_Vérification': ''
-            }
+            self.add_result_columns(df)
             
-            # Ajouter les nouvelles colonnes au DataFrame
-            for col_name, default_value in new_columns.items():
-                df[col_name] = default_value
+            # Journal des lignes terminées, relu en cas de reprise
+            journal, completed = self.open_journal(output_file, resume, journal_file)
             
-            for index, row in df.iterrows():
-                holding = row['Holding Name']
-                brand = row['Brand Name']
-                
-                # Vérifier si la marque a déjà été traitée
-                brand_key = f"{holding}_{brand}"
-                if brand_key in verified_brands:
-                    print(f"\n{'-'*50}")
-                    print(f"Marque déjà vérifiée: {brand} pour {holding}")
-                    print(f"Utilisation du résultat précédent")
-                    print(f"{'-'*50}\n")
-                    result = verified_brands[brand_key]
-                    
-                    # Mettre à jour les colonnes avec le résultat précédent
-                    df.at[index, 'Propriété_Directe'] = result['Propriété_Directe']
-                    df.at[index, 'Score_Confiance'] = result['Score_Confiance']
-                    df.at[index, 'Type_Relation'] = result['Type_Relation']
-                    df.at[index, 'Zones_Géographiques'] = result['Zones_Géographiques']
-                    df.at[index, 'Détails_Relation'] = result['Détails_Relation']
-                    df.at[index, 'Explication'] = result['Explication']
-                    df.at[index, 'Sources'] = result['Sources']
-                    df.at[index, 'À_Vérifier'] = result['À_Vérifier']
-                    df.at[index, 'Statut_Vérification'] = result['Statut_Vérification']
-                    df.at[index, 'Erreur_Vérification'] = result['Erreur_Vérification']
-                    
-                    # Sauvegarder après chaque mise à jour
-                    df.to_csv(output_file, index=False)
-                    continue
-                
-                print(f"\n{'-'*50}")
-                print(f"Progression: {index + 1}/{total_brands}")
-                print(f"Vérification de {brand} pour {holding}")
-                print(f"{'-'*50}")
+            try:
+                if self.portfolios is not None:
+                    self.prefetch_portfolios(df.iterrows(), verified_brands, completed)
+                if self.batch_size > 1:
+                    self.prefetch_batches(df.iterrows(), verified_brands, completed)
                 
-                try:
-                    # Vérification de la marque
-                    result = self.verify_brand(brand, holding, row)
+                for index, row in df.iterrows():
+                    row_result = self.process_row(index, row, total_brands, verified_brands, completed, journal)
                     
-                    if result:
-                        print(f"\nRésultat de la vérification:")
-                        print(f"- Appartient à {holding}: {result['belongs_to']}")
-                        print(f"- Confiance: {result['confidence']}%")
-                        
-                        # Format sources
-                        sources = self.format_sources(result.get('sources', []))
-                        
-                        # Determine if manual verification is needed
-                        needs_verification = self.should_verify_manually(result)
-                        
-                        # Mettre à jour les colonnes avec le résultat
-                        df.at[index, 'Propriété_Directe'] = result['belongs_to']
-                        df.at[index, 'Score_Confiance'] = result['confidence']
-                        df.at[index, 'Type_Relation'] = result.get('type_relation', 'Propriété directe')
-                        df.at[index, 'Zones_Géographiques'] = result.get('zones_geographiques', '')
-                        df.at[index, 'Détails_Relation'] = result.get('details_relation', '')
-                        df.at[index, 'Explication'] = result['explanation']
-                        df.at[index, 'Sources'] = sources
-                        df.at[index, 'À_Vérifier'] = needs_verification
-                        df.at[index, 'Statut_Vérification'] = 'Succès'
-                        df.at[index, 'Erreur_Vérification'] = ''
-                        
-                        # Stocker le résultat dans le dictionnaire des marques vérifiées
-                        verified_brands[brand_key] = {
-                            'Propriété_Directe': result['belongs_to'],
-                            'Score_Confiance': result['confidence'],
-                            'Type_Relation': result.get('type_relation', 'Propriété directe'),
-                            'Zones_Géographiques': result.get('zones_geographiques', ''),
-                            'Détails_Relation': result.get('details_relation', ''),
-                            'Explication': result['explanation'],
-                            'Sources': sources,
-                            'À_Vérifier': needs_verification,
-                            'Statut_Vérification': 'Succès',
-                            'Erreur_Vérification': ''
-                        }
-                    else:
-                        print("\nÉchec de la vérification")
-                        # Mettre à jour les colonnes avec les valeurs par défaut
-                        df.at[index, 'Statut_Vérification'] = 'Échec'
-                        df.at[index, 'Erreur_Vérification'] = 'Échec de la vérification - Pas de réponse de l\'API'
-                        
-                        # Stocker le résultat dans le dictionnaire des marques vérifiées
-                        verified_brands[brand_key] = {
-                            'Propriété_Directe': False,
-                            'Score_Confiance': 0,
-                            'Type_Relation': 'Propriété directe',
-                            'Zones_Géographiques': '',
-                            'Détails_Relation': '',
-                            'Explication': 'Échec de la vérification',
-                            'Sources': '',
-                            'À_Vérifier': True,
-                            'Statut_Vérification': 'Échec',
-                            'Erreur_Vérification': 'Échec de la vérification - Pas de réponse de l\'API'
-                        }
-                
-                except Exception as e:
-                    print(f"\nErreur lors de la vérification de {brand}: {str(e)}")
-                    df.at[index, 'Statut_Vérification'] = 'Erreur'
-                    df.at[index, 'Erreur_Vérification'] = str(e)
-                    verified_brands[brand_key] = {
-                        'Propriété_Directe': False,
-                        'Score_Confiance': 0,
-                        'Type_Relation': 'Propriété directe',
-                        'Zones_Géographiques': '',
-                        'Détails_Relation': '',
-                        'Explication': f'Erreur: {str(e)}',
-                        'Sources': '',
-                        'À_Vérifier': True,
-                        'Statut_Vérification': 'Erreur',
-                        'Erreur_Vérification': str(e)
-                    }
-                
-                print(f"\nRésultat enregistré pour {brand}")
-                print(f"{'-'*50}\n")
-                
-                # Sauvegarder après chaque vérification
-                df.to_csv(output_file, index=False)
+                    # Mettre à jour les colonnes avec le résultat
+                    for col, value in row_result.items():
+                        df.at[index, col] = value
+            finally:
+                journal.close()
+            
+            # Les lignes sont journalisées au fil de l'eau ; le CSV final,
+            # dans l'ordre d'origine, n'est écrit qu'une seule fois
+            write_table(df, output_file)
             
-            print(f"\n{'='*50}")
-            print(f"Vérification terminée!")
-            print(f"Résultats sauvegardés dans {output_file}")
-            print(f"{'='*50}\n")
+            self.metrics.say(NORMAL, f"\n{'='*50}\nVérification terminée!\n"
+                                     f"Résultats sauvegardés dans {output_file}\n{'='*50}\n")
             
             # Afficher un résumé des résultats
-            total_verifies = len(df)
-            succes = len(df[df['Statut_Vérification'] == 'Succès'])
-            echecs = len(df[df['Statut_Vérification'] == 'Échec'])
-            erreurs = len(df[df['Statut_Vérification'] == 'Erreur'])
+            self.print_summary(df)
             
-            print("\nRésumé des résultats:")
-            print(f"Total des marques vérifiées: {total_verifies}")
-            print(f"Vérifications réussies: {succes}")
-            print(f"Échecs de vérification: {echecs}")
-            print(f"Erreurs: {erreurs}")
+        except Exception as e:
+            self.metrics.say(QUIET, f"\nErreur lors du traitement des marques: {e}")
+            raise e
+        finally:
+            self.metrics.close()
+
+    def process_all_brands_streaming(self, input_file, output_file, chunksize=5000,
+                                     columns=CATALOG_COLUMNS, resume=False, journal_file=None):
+        """Vérifie un catalogue volumineux bloc par bloc, à mémoire bornée.
+
+        Seules `columns` sont lues (None = toutes) ; chaque bloc vérifié est
+        ajouté au fichier de sortie (CSV ou Parquet). Les doublons sont dédupliqués dans le bloc,
+        et entre blocs par le cache persistant s'il est activé.
+        """
+        try:
+            self.metrics.say(NORMAL, f"\n{'='*50}\nDébut de la vérification en flux de {input_file} "
+                                     f"(blocs de {chunksize} lignes)\n{'='*50}\n")
+            
+            journal, completed = self.open_journal(output_file, resume, journal_file)
+            writer = open_writer(output_file)
+            counts = {}
+            total_rows = 0
+            
+            try:
+                for chunk in read_catalog_chunks(input_file, chunksize, columns):
+                    verified_brands = {}
+                    records = list(zip(chunk.index, chunk.to_dict('records')))
+                    if self.portfolios is not None:
+                        self.prefetch_portfolios(records, verified_brands, completed)
+                    if self.batch_size > 1:
+                        self.prefetch_batches(records, verified_brands, completed)
+                    row_results = [
+                        self.process_row(index, row, None, verified_brands, completed, journal)
+                        for index, row in records
+                    ]
+                    
+                    self.add_result_columns(chunk)
+                    if row_results:
+                        for col in row_results[0]:
+                            chunk[col] = [row_result.get(col) for row_result in row_results]
+                    writer.write(chunk)
+                    
+                    total_rows += len(chunk)
+                    for row_result in row_results:
+                        status = row_result['Statut_Vérification']
+                        counts[status] = counts.get(status, 0) + 1
+                    self.metrics.say(NORMAL, f"Bloc terminé: {total_rows} lignes écrites dans {output_file}")
+            finally:
+                journal.close()
+                writer.close()
+            
+            self.metrics.say(NORMAL, f"\n{'='*50}\nVérification terminée!\n"
+                                     f"Résultats sauvegardés dans {output_file}\n{'='*50}\n")
+            
+            self.print_counts_summary(total_rows, counts)
             
         except Exception as e:
-            print(f"\nErreur lors du traitement des marques: {e}")
+            self.metrics.say(QUIET, f"\nErreur lors du traitement des marques: {e}")
             raise e
+        finally:
+            self.metrics.close()
 
     def format_sources(self, sources):
         """Format sources into a readable string."""
@@ -471,51 +980,178 @@ Retourne une réponse JSON avec les champs requis.""",
         # Vérifier si la confiance est < 100%
         if result.get('confidence', 0) < 100:
             return True
-        # Vérifier si l'explication contient des phrases négatives
-        negative_phrases = [
-            "no information indicating",
-            "could not find",
-            "no evidence",
-            "not found",
-            "pas d'information",
-            "aucune preuve",
-            "impossible de trouver",
-            "no clear indication",
-            "unable to confirm",
-            "cannot verify",
-            "no confirmation",
-            "no documentation",
-            "no official source",
-            "no reliable source",
-            "no definitive answer",
-            "no conclusive evidence",
-            "no direct evidence",
-            "no explicit confirmation",
-            "no clear ownership",
-            "no clear relationship",
-            "no clear connection",
-            "no clear association",
-            "no clear link",
-            "no clear tie",
-            "no clear bond",
-            "no clear affiliation",
-            "no clear partnership",
-            "no clear alliance",
-            "no clear agreement",
-            "no clear contract",
-            "no clear deal",
-            "no clear arrangement",
-            "no clear understanding"
-        ]
-        explanation = result.get('explanation', '').lower()
-        return any(phrase in explanation for phrase in negative_phrases)
+        # Vérifier si l'explication contient des phrases négatives (liste de brand_common/patterns.json)
+        return get_matcher(NEGATIVE_PHRASES).search(result.get('explanation', ''))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Vérification de la propriété des marques via Perplexica")
+    parser.add_argument("--input", default="Carrefour Geniathon  - Tableau origine .csv",
+                        help="Fichier d'origine (CSV, ou Parquet si l'extension est .parquet)")
+    parser.add_argument("--output", default="brand_verification_results.csv",
+                        help="Fichier de résultats : CSV, ou Parquet typé (booléens, score en float32, "
+                             "sources en liste de {title, url}) si l'extension est .parquet")
+    parser.add_argument("--engine", choices=["sync", "async"], default="sync",
+                        help="Moteur de vérification: séquentiel (sync) ou asyncio (async)")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Nombre de requêtes Perplexica simultanées (moteur async)")
+    parser.add_argument("--cache-file", default="verification_cache.sqlite",
+                        help="Fichier SQLite du cache de vérification")
+    parser.add_argument("--cache-ttl-days", type=float, default=30,
+                        help="Durée de vie des entrées du cache, en jours")
+    parser.add_argument("--cache-max-entries", type=int, default=100000,
+                        help="Nombre maximal d'entrées du cache (éviction LRU)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Désactive le cache persistant")
+    parser.add_argument("--resume", action="store_true",
+                        help="Reprend une exécution interrompue à partir du journal")
+    parser.add_argument("--journal", default=None,
+                        help="Journal des lignes terminées (défaut: <output>.journal.jsonl)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Lit le fichier d'origine par blocs et écrit les résultats au fil de l'eau")
+    parser.add_argument("--chunksize", type=int, default=5000,
+                        help="Nombre de lignes par bloc en mode --stream")
+    parser.add_argument("--stream-all-columns", action="store_true",
+                        help="En mode --stream, conserve toutes les colonnes du fichier d'origine")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Nombre de marques d'une même holding vérifiées par requête (1 = désactivé)")
+    parser.add_argument("--perplexica-url", default="http://localhost:3000/api/search",
+                        help="URL de l'API de recherche Perplexica")
+    parser.add_argument("--max-connections", type=int, default=10,
+                        help="Nombre maximal de connexions HTTP gardées ouvertes vers Perplexica")
+    parser.add_argument("--gzip-requests", action="store_true",
+                        help="Compresse en gzip le corps des requêtes (le serveur doit le supporter)")
+    parser.add_argument("--max-rps", type=float, default=None,
+                        help="Nombre maximal de requêtes Perplexica par seconde (défaut: illimité)")
+    parser.add_argument("--max-concurrent", type=int, default=None,
+                        help="Nombre maximal de requêtes Perplexica simultanées, propre au processus "
+                             "(défaut: illimité)")
+    parser.add_argument("--rate-limit-file", default=None,
+                        help="Fichier SQLite pour partager la limite de débit entre processus")
+    parser.add_argument("--no-circuit-breaker", action="store_true",
+                        help="Désactive la suspension des envois quand le taux d'erreur s'envole")
+    parser.add_argument("--stream-responses", action="store_true",
+                        help="Lit les réponses de Perplexica en flux et mesure le délai jusqu'au verdict")
+    parser.add_argument("--stop-at-verdict", action="store_true",
+                        help="Avec --stream-responses, coupe la génération dès que les champs requis "
+                             "(belongs_to, explanation...) sont complets")
+    parser.add_argument("--hedge-percentile", type=float, default=None,
+                        help="Double une requête restée sans réponse au-delà de ce percentile des durées "
+                             "observées (ex: 95) et garde la première réponse valide (défaut: désactivé)")
+    parser.add_argument("--tiers-file", default=None,
+                        help="Fichier JSON des paliers de vérification (modèle, modes, règles de promotion, "
+                             "coût par requête), défaut: un seul palier gpt-4o-mini en mode speed")
+    parser.add_argument("--prompt-templates", nargs="+", default=None, metavar="TEMPLATE",
+                        help="Templates de prompt du registre (défaut: verification-en-v1) ; avec plusieurs, "
+                             "test A/B : chaque paire (holding, marque) reçoit toujours le même template")
+    parser.add_argument("--prompts-file", default=None,
+                        help="Registre JSON des templates de prompt, défaut: brand_common/prompts/templates.json")
+    parser.add_argument("--source-counts", action="store_true",
+                        help="Ajoute les compteurs de sources du score (Sources_Officielles, Sources_Récentes, "
+                             "Nb_Sources, Chaîne_Propriété) au fichier de résultats, pour que rescore_results.py "
+                             "recalcule exactement les scores")
+    parser.add_argument("--patterns-file", default=None,
+                        help="Fichier JSON des listes de motifs (domaines officiels, phrases négatives), "
+                             "défaut: brand_common/patterns.json")
+    parser.add_argument("--flush-rows", type=int, default=1,
+                        help="Écrire le journal toutes les N lignes terminées")
+    parser.add_argument("--flush-interval", type=float, default=None,
+                        help="Écrire le journal au moins toutes les N secondes")
+    parser.add_argument("--delta-from", default=None,
+                        help="Mode delta: fichier de résultats précédent (CSV ou Parquet), seules les paires "
+                             "nouvelles, en échec, peu sûres ou trop anciennes sont revérifiées")
+    parser.add_argument("--delta-min-confidence", type=float, default=50,
+                        help="Mode delta: score de confiance minimal pour reprendre un résultat")
+    parser.add_argument("--delta-max-age-days", type=float, default=None,
+                        help="Mode delta: âge maximal d'un résultat repris, en jours (défaut: illimité)")
+    parser.add_argument("--dedup-threshold", type=float, default=1.0,
+                        help="Similarité (0-1) à partir de laquelle deux orthographes d'une marque de la même "
+                             "holding sont vérifiées une seule fois (0.9 par exemple) ; 1 = accents, casse, "
+                             "ponctuation et ordre des mots seulement (défaut)")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Ne regroupe que les paires (holding, marque) identiques au caractère près")
+    parser.add_argument("--ownership-graph", default=None,
+                        help="Fichier SQLite du graphe de propriété (marque → filiale → holding), enrichi par "
+                             "chaque vérification ; une chaîne connue évite la vérification complète")
+    parser.add_argument("--graph-resolve-confidence", type=float, default=90,
+                        help="Confiance minimale d'une chaîne connue pour résoudre la ligne sans appel à l'API")
+    parser.add_argument("--graph-confirm-confidence", type=float, default=70,
+                        help="Confiance minimale d'une chaîne connue pour la confirmer par une question courte "
+                             "au lieu de la vérification complète")
+    parser.add_argument("--portfolio-prefetch", action="store_true",
+                        help="Demande une fois le portefeuille de marques officiel de chaque grande holding et "
+                             "résout sans autre appel les marques qui y figurent")
+    parser.add_argument("--portfolio-min-brands", type=int, default=50,
+                        help="Nombre minimal de marques à vérifier d'une holding pour demander son portefeuille")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="Détail par ligne (-v), réponses brutes de l'API (-vv)")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="N'affiche que les erreurs fatales")
+    parser.add_argument("--log-file", default=None,
+                        help="Journal JSON Lines des mesures par ligne (durée par étape, requêtes, "
+                             "nouvelles tentatives, cache, tokens)")
+    parser.add_argument("--metrics-file", default=None,
+                        help="Fichier texte au format Prometheus des cumuls, réécrit pendant le traitement")
+    return parser.parse_args()
 
 def main():
-    verifier = BrandVerification()
-    verifier.process_all_brands(
-        "Carrefour Geniathon  - Tableau origine .csv",
-        "brand_verification_results.csv"
+    args = parse_args()
+    if args.patterns_file:
+        configure_patterns(args.patterns_file)
+    if args.prompts_file:
+        configure_prompts(args.prompts_file)
+    cache = None
+    if not args.no_cache:
+        cache = VerificationCache(args.cache_file, ttl=args.cache_ttl_days * 24 * 3600,
+                                  max_entries=args.cache_max_entries)
+    client = PerplexicaClient(
+        url=args.perplexica_url,
+        system_instructions=SYSTEM_INSTRUCTIONS,
+        optimization_mode="speed",
+        max_connections=max(args.max_connections, args.concurrency if args.engine == "async" else 1),
+        compress_requests=args.gzip_requests,
+        limiter=RateLimiter(args.max_rps, max_concurrent=args.max_concurrent, state_file=args.rate_limit_file)
+        if args.max_rps or args.max_concurrent else None,
+        breaker=None if args.no_circuit_breaker else CircuitBreaker(),
+        stream_responses=args.stream_responses,
+        stop_early=args.stop_at_verdict,
+        hedge=HedgePolicy(args.hedge_percentile) if args.hedge_percentile else None
     )
+    verifier = BrandVerification(cache=cache, client=client)
+    verifier.set_metrics(PipelineMetrics('verification', QUIET if args.quiet else NORMAL + args.verbose,
+                                         args.log_file, args.metrics_file))
+    verifier.flush_rows = args.flush_rows
+    verifier.flush_interval = args.flush_interval
+    verifier.batch_size = args.batch_size
+    verifier.write_source_counts = args.source_counts
+    verifier.dedup = None if args.no_dedup else BrandIndex(args.dedup_threshold)
+    if args.ownership_graph:
+        verifier.ownership = OwnershipGraph(args.ownership_graph, args.graph_resolve_confidence,
+                                            args.graph_confirm_confidence)
+        verifier.metrics.say(NORMAL, f"Graphe de propriété: {len(verifier.ownership)} liens connus")
+    if args.portfolio_prefetch:
+        verifier.portfolios = PortfolioIndex(args.portfolio_min_brands, args.dedup_threshold)
+    if args.tiers_file:
+        verifier.set_tiers(load_tiers(args.tiers_file))
+    if args.prompt_templates:
+        verifier.set_prompt_templates(args.prompt_templates)
+    if args.delta_from:
+        verifier.previous = PreviousResults(args.delta_from, verifier.result_columns(),
+                                            args.delta_min_confidence, args.delta_max_age_days)
+        verifier.metrics.say(NORMAL, verifier.previous.summary())
+    columns = None if args.stream_all_columns else CATALOG_COLUMNS
+    if args.engine == "async":
+        from async_engine import AsyncVerificationEngine
+        engine = AsyncVerificationEngine(verifier, concurrency=args.concurrency)
+        if args.stream:
+            engine.process_all_brands_streaming(args.input, args.output, args.chunksize, columns,
+                                                args.resume, args.journal)
+        else:
+            engine.process_all_brands(args.input, args.output, args.resume, args.journal)
+    elif args.stream:
+        verifier.process_all_brands_streaming(args.input, args.output, args.chunksize, columns,
+                                              args.resume, args.journal)
+    else:
+        verifier.process_all_brands(args.input, args.output, args.resume, args.journal)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""Construit ou complète le graphe de propriété à partir de fichiers de résultats existants.
+
+Les lignes confirmées (Propriété_Directe vraie) d'un fichier de résultats
+(CSV ou Parquet) de brand_verification.py ou de
+brand_verification_multiprocessing.py donnent
+les liens marque → holding, avec leur Score_Confiance ; le fichier
+sub_brands.csv de brand_analysis.py donne les liens sous-marque → marque
+parente → holding, avec une confiance fixe. Le graphe s'utilise ensuite
+avec `--ownership-graph` : une chaîne connue et assez sûre évite la
+vérification complète.
+
+Exemple :
+    python brand_verification/build_ownership_graph.py --results brand_verification_results.csv \
+        --sub-brands sub_brands.csv --show "MAGNUM DOUBLE"
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from brand_common.ownership import OwnershipGraph
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Construit le graphe de propriété à partir de résultats existants")
+    parser.add_argument("--graph", default="ownership_graph.sqlite",
+                        help="Fichier SQLite du graphe de propriété (créé s'il n'existe pas)")
+    parser.add_argument("--results", nargs="+", default=[],
+                        help="Résultats de vérification, CSV ou Parquet (liens marque → holding)")
+    parser.add_argument("--sub-brands", nargs="+", default=[],
+                        help="Fichiers sub_brands.csv de brand_analysis.py (liens sous-marque → marque → holding)")
+    parser.add_argument("--sub-brand-confidence", type=float, default=80,
+                        help="Confiance donnée aux liens de sous-marques, réponses non vérifiées")
+    parser.add_argument("--show", nargs="+", default=[], metavar="MARQUE",
+                        help="Affiche les sociétés et marques dont dépend chaque marque, directement ou non")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    graph = OwnershipGraph(args.graph)
+    try:
+        for path in args.results:
+            print(f"{path}: {graph.load_results(path)} liens marque → holding")
+        for path in args.sub_brands:
+            print(f"{path}: {graph.load_sub_brands(path, args.sub_brand_confidence)} liens de sous-marques")
+        for brand in args.show:
+            ancestors = graph.ancestors(brand)
+            print(f"\n{brand}:" if ancestors else f"\n{brand}: aucune chaîne connue")
+            for name, confidence in sorted(ancestors.items(), key=lambda item: -item[1]):
+                print(f"- {graph.path(brand, name).describe()} ({confidence:.0f}%)")
+        print(graph.summary())
+    finally:
+        graph.close()
+
+
+if __name__ == '__main__':
+    main()
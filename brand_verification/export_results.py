@@ -0,0 +1,49 @@
+"""Convertit un fichier de résultats entre CSV et Parquet, éventuellement filtré.
+
+Le format de chaque fichier est donné par son extension (.csv ou .parquet).
+`--to-verify` ne garde que les lignes À_Vérifier == True, pour la revue
+manuelle : en Parquet, le filtre est évalué à la lecture et seules les
+colonnes demandées sont décodées.
+
+Exemples :
+    python brand_verification/export_results.py --input resultats.parquet --output resultats.csv
+    python brand_verification/export_results.py --input resultats.parquet --output a_verifier.csv \
+        --to-verify --columns "Holding Name" "Brand Name" Score_Confiance Explication Sources
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from brand_common.columnar import SOURCES_COLUMN, is_parquet, source_strings
+from brand_common.reader import read_table, write_table
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Conversion CSV / Parquet d'un fichier de résultats")
+    parser.add_argument("--input", default="brand_verification_results.parquet",
+                        help="Fichier de résultats à lire (CSV ou Parquet)")
+    parser.add_argument("--output", default="brand_verification_results.csv",
+                        help="Fichier à écrire (CSV ou Parquet)")
+    parser.add_argument("--to-verify", action="store_true",
+                        help="Ne garder que les lignes à vérifier manuellement (À_Vérifier == True)")
+    parser.add_argument("--columns", nargs="+", default=None,
+                        help="Colonnes à garder (défaut: toutes)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    start = time.perf_counter()
+    df = read_table(args.input, args.columns, {'À_Vérifier': True} if args.to_verify else None)
+    # Sources relues d'un Parquet : texte "titre - url | ..." dans un CSV, comme brand_verification.py
+    if SOURCES_COLUMN in df.columns and not is_parquet(args.output):
+        df[SOURCES_COLUMN] = [" | ".join(source_strings(value)) for value in df[SOURCES_COLUMN]]
+    write_table(df, args.output)
+    elapsed = time.perf_counter() - start
+    print(f"{len(df)} lignes écrites dans {args.output} en {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
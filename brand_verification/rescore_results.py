@@ -0,0 +1,150 @@
+"""Recalcule hors ligne les scores de confiance d'un fichier de résultats (CSV ou Parquet).
+
+Utilise les compteurs de sources enregistrés par brand_verification.py
+--source-counts (Sources_Officielles, Sources_Récentes, Nb_Sources,
+Chaîne_Propriété) : aucun appel à Perplexica, quelques secondes pour des
+centaines de milliers de lignes. Pratique pour ajuster les pondérations de
+brand_common/scoring.py. Les lignes sans compteurs (fichiers écrits sans
+--source-counts) ne peuvent pas être recalculées exactement : elles sont
+laissées inchangées, sauf avec --from-sources.
+
+Exemple :
+    python brand_verification/rescore_results.py --weights poids.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from brand_common.columnar import source_strings
+from brand_common.matcher import NEGATIVE_PHRASES, configure_patterns, get_matcher
+from brand_common.reader import read_table, write_table
+from brand_common.scoring import STANDARD_WEIGHTS, FEATURE_COLUMNS, source_counts_frame, sources_frame, standard_score_frame
+from brand_verification import SOURCE_COUNT_COLUMNS
+
+
+def load_weights(path):
+    """Pondérations par défaut, surchargées par celles du fichier JSON éventuel."""
+    weights = dict(STANDARD_WEIGHTS)
+    if path:
+        with open(path, encoding='utf-8') as f:
+            overrides = json.load(f)
+        unknown = set(overrides) - set(weights)
+        if unknown:
+            raise ValueError(f"Pondérations inconnues: {', '.join(sorted(unknown))}")
+        weights.update(overrides)
+    return weights
+
+
+def has_source_counts(df):
+    """Lignes dont les compteurs de sources ont été écrits (brand_verification.py --source-counts)."""
+    if 'Nb_Sources' not in df.columns:
+        return pd.Series(False, index=df.index)
+    return df['Nb_Sources'].notna()
+
+
+def scoring_frame(df):
+    """Colonnes d'entrée du score vectorisé, à partir des colonnes du CSV."""
+    frame = pd.DataFrame({
+        'belongs_to': df['Propriété_Directe'].astype(str) == 'True',
+        'explanation': df['Explication'],
+    }, index=df.index)
+    for column, key in SOURCE_COUNT_COLUMNS.items():
+        frame[key] = df[column] if column in df.columns else None
+
+    # Lignes sans compteurs (--from-sources) : seules les sources citées dans la
+    # colonne Sources sont connues, les sources Perplexica sont perdues
+    missing = frame['quantity'].isna()
+    if missing.any():
+        sources = df.loc[missing, 'Sources']
+        counts = source_counts_frame(
+            sources_frame((index, source_strings(value), ()) for index, value in sources.items()),
+            sources.index
+        )
+        frame.loc[missing, FEATURE_COLUMNS] = counts[FEATURE_COLUMNS]
+
+    frame['chain'] = frame['chain'].astype(str) == 'True'
+    for key in ('official', 'recent', 'quantity'):
+        frame[key] = frame[key].astype(float)
+    return frame
+
+
+def rescore(df, weights, from_sources=False):
+    """Recalcule Score_Confiance et À_Vérifier pour les lignes vérifiées avec succès.
+
+    Seules les lignes qui ont leurs compteurs de sources sont recalculées :
+    avec les pondérations par défaut, leurs scores sont reproduits à
+    l'identique. Avec `from_sources`, les autres lignes sont recalculées à
+    partir de la colonne Sources seule (approximation : les sources
+    Perplexica sont perdues). Retourne les anciens scores, les nouveaux et
+    le nombre de lignes vérifiées sans compteurs.
+    """
+    verified = df['Statut_Vérification'] == 'Succès'
+    uncounted = verified & ~has_source_counts(df)
+    rows = verified if from_sources else verified & ~uncounted
+    frame = scoring_frame(df[rows])
+    scores = standard_score_frame(frame, weights)
+
+    # Même règle que BrandVerification.should_verify_manually, vectorisée
+    negative = frame['explanation'].fillna('').astype(str).str.lower().str.contains(
+        get_matcher(NEGATIVE_PHRASES).pattern, regex=True)
+    needs_verification = (scores < 100) | negative
+
+    previous = df.loc[rows, 'Score_Confiance'].astype(float)
+    df['Score_Confiance'] = df['Score_Confiance'].astype(float)
+    df.loc[rows, 'Score_Confiance'] = scores
+    df.loc[rows, 'À_Vérifier'] = needs_verification
+    return previous, scores, int(uncounted.sum())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recalcul hors ligne des scores de confiance")
+    parser.add_argument("--input", default="brand_verification_results.csv",
+                        help="Résultats de brand_verification.py (CSV, ou Parquet si l'extension est .parquet)")
+    parser.add_argument("--output", default="brand_verification_rescored.csv",
+                        help="Résultats avec les scores recalculés (CSV, ou Parquet si l'extension est .parquet)")
+    parser.add_argument("--weights", default=None,
+                        help="Fichier JSON de pondérations (clés de STANDARD_WEIGHTS) à surcharger")
+    parser.add_argument("--from-sources", action="store_true",
+                        help="Recalcule aussi les lignes sans compteurs de sources à partir de la colonne Sources "
+                             "seule (approximation : les sources Perplexica ne sont pas dans le fichier)")
+    parser.add_argument("--patterns-file", default=None,
+                        help="Fichier JSON des listes de motifs (domaines officiels, phrases négatives), "
+                             "défaut: brand_common/patterns.json")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.patterns_file:
+        configure_patterns(args.patterns_file)
+    weights = load_weights(args.weights)
+
+    start = time.perf_counter()
+    df = read_table(args.input)
+    if not args.from_sources and not has_source_counts(df).any():
+        sys.exit(f"Erreur: {args.input} n'a pas de compteurs de sources ; relancez brand_verification.py avec "
+                 f"--source-counts, ou utilisez --from-sources pour une approximation à partir de la colonne Sources")
+    previous, scores, uncounted = rescore(df, weights, args.from_sources)
+    write_table(df, args.output)
+    elapsed = time.perf_counter() - start
+
+    if uncounted and args.from_sources:
+        print(f"Attention: {uncounted} lignes sans compteurs de sources recalculées à partir de la colonne "
+              f"Sources seule, leurs scores ne sont pas comparables aux scores d'origine")
+    elif uncounted:
+        print(f"Attention: {uncounted} lignes sans compteurs de sources laissées inchangées "
+              f"(--from-sources pour les recalculer à partir de la colonne Sources)")
+    changed = int((previous.round(6) != scores.round(6)).sum())
+    print(f"{len(scores)} scores recalculés en {elapsed:.2f}s ({changed} modifiés)")
+    if len(scores):
+        print(f"Score moyen: {previous.mean():.1f}% -> {scores.mean():.1f}%")
+    print(f"Résultats sauvegardés dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,291 +4,480 @@ import json
 from typing import Dict, List, Tuple
 import time
 import re
-import multiprocessing
-from multiprocessing import Pool, Manager
 import os
+import sys
+import argparse
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import nullcontext
 from tqdm import tqdm
 
+from io_scheduler import AdaptiveScheduler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from brand_common.cache import VerificationCache, normalize_key_part
+from brand_common.client import PerplexicaClient
+from brand_common.checkpoint import CheckpointJournal, row_key
+from brand_common.dedup import BrandIndex
+from brand_common.matcher import NEGATIVE_PHRASES, configure_patterns, get_matcher
+from brand_common.metrics import DEBUG, NORMAL, QUIET, VERBOSE, PipelineMetrics, say, stage
+from brand_common.ownership import CONFIRMATION, OwnershipGraph
+from brand_common.portfolio import PortfolioIndex
+from brand_common.response import MULTI_VERIFICATION_SCHEMA, PORTFOLIO_SCHEMA, parse_answer
+from brand_common.reader import CATALOG_COLUMNS, open_writer, read_catalog_chunks, read_table, write_table
+from brand_common.scoring import multi_score, source_counts
+from brand_common.throttle import CircuitBreaker, HedgePolicy, RateLimiter, backoff_delay
+from brand_common.templates import PromptStats, answer_tokens, assign_template, configure_prompts, get_template
+from brand_common.tiers import PromotionPredictor, Tier, TierStats, cache_variant, load_tiers
+from brand_common.batching import extract_batch_items, make_batches, source_mentions
+
+# Template de prompt par défaut (brand_common/prompts/templates.json), enregistré
+# dans la clé de cache et dans la colonne Version_Prompt
+PROMPT_VERSION = "verification-fr-v1"
+
+# Colonnes ajoutées à la fin du fichier d'origine, dans cet ordre
+RESULT_COLUMNS = [
+    'Propriété_Directe',
+    'Score_Confiance',
+    'Type_Relation',
+    'Zones_Géographiques',
+    'Date_Changement',
+    'Détails_Relation',
+    'Explication',
+    'Sources',
+    'À_Vérifier',
+    'Version_Prompt'
+]
+
+SYSTEM_INSTRUCTIONS = get_template(PROMPT_VERSION).system
+
+# Question courte de confirmation d'une chaîne connue du graphe de propriété
+CONFIRMATION_TEMPLATE = "confirmation-fr-v1"
+
+# Portefeuille de marques officiel d'une holding (préchargement par holding)
+PORTFOLIO_TEMPLATE = "portfolio-fr-v1"
+
 class BrandVerificationMulti:
-    def __init__(self):
-        self.perplexica_url = "http://localhost:3000/api/search"
-        self.num_processes = multiprocessing.cpu_count()  # Nombre de processus = nombre de CPU
+    def __init__(self, concurrency=16, cpu_workers=0, cache=None, client=None, speculative=False):
+        self.chat_model = "gpt-4o-mini"
+        # Vérification spéculative : pour les lignes prédites incertaines, le 2ème palier
+        # est lancé en même temps que le 1er ; chaque ligne peut alors avoir deux requêtes en vol
+        self.speculative = speculative
+        # Client HTTP partagé par tous les threads : une connexion keep-alive par requête en vol
+        self.client = client or PerplexicaClient(
+            chat_model=self.chat_model,
+            system_instructions=SYSTEM_INSTRUCTIONS,
+            optimization_mode="accuracy",
+            max_connections=self.max_requests_in_flight(concurrency, speculative),
+            breaker=CircuitBreaker()
+        )
+        # Durées par étape, compteurs et messages selon la verbosité (voir brand_common/metrics.py)
+        self.set_metrics(PipelineMetrics('verification_multi'))
+        # Templates de prompt (voir brand_common/templates.py) ; plusieurs pour un test A/B
+        self.set_prompt_templates([PROMPT_VERSION])
+        # Cache persistant optionnel (VerificationCache), partagé avec brand_verification
+        self.cache = cache
+        # Le travail attend surtout le réseau : la concurrence n'est pas liée au nombre de CPU
+        self.concurrency = concurrency
+        # Pool de processus optionnel pour la partie CPU (parsing JSON, scoring)
+        self.cpu_workers = cpu_workers
+        self.max_retries = 5  # Augmenté de 3 à 5
+        self.retry_delay = 15  # Augmenté de 10 à 15 secondes
+        self.max_retry_delay = 120
+        self.search_timeout = 120  # Augmenté de 60 à 120 secondes
+        # Nombre de marques d'une même holding par requête (1 = pas de regroupement)
+        self.batch_size = 1
+        # 1ères vérifications obtenues par requêtes groupées ou par le portefeuille
+        # de la holding, par (holding, marque)
+        self.prefetched = {}
+        # Orthographes d'une même paire (holding, marque) vérifiées une seule fois
+        # (voir brand_common/dedup.py) ; None = paires identiques au caractère près
+        self.dedup = BrandIndex()
+        # Graphe de propriété (OwnershipGraph) : chaînes connues résolues sans appel
+        # ou confirmées par une question courte ; None = désactivé
+        self.ownership = None
+        self.confirmation_template = CONFIRMATION_TEMPLATE
+        # Portefeuilles de marques officiels par holding (PortfolioIndex) : une requête par
+        # holding d'au moins `min_brands` marques à vérifier ; None = désactivé
+        self.portfolios = None
+        self.portfolio_template = PORTFOLIO_TEMPLATE
+        # Créés par process_all_brands pour la durée d'un traitement
+        self.scheduler = None
+        self.cpu_pool = None
+        # Paliers de vérification (voir brand_common/tiers.py) : par défaut deux passes
+        # du même modèle, la 2ème seulement si la confiance est < 70%
+        self.set_tiers([
+            Tier('first-pass', self.chat_model, "accuracy", "webSearch", promote_below=70),
+            Tier('second-pass', self.chat_model, "accuracy", "webSearch"),
+        ])
+        self.predictor = PromotionPredictor()
+        # Catégorie (Class Key) par (holding, marque), utilisée par la prédiction
+        self.categories = {}
+        self.speculation_pool = None
+        self.speculation_lock = threading.Lock()
+        self.speculation_stats = {'launched': 0, 'used': 0, 'wasted': 0}
 
-    def create_prompt(self, holding, brand):
-        return f"""Analysez si la marque '{brand}' appartient à la société '{holding}' ou à l'une de ses filiales.
-        Cette vérification est critique et nécessite une grande précision.
-        
-        RÈGLES DE VÉRIFICATION STRICTES :
-        1. Vérification de la marque :
-           - Recherchez la marque '{brand}' et ses variations courantes (majuscules/minuscules, accents)
-           - Incluez les variations connues (ex: "Le Chat" = "LE CHAT")
-           - Vérifiez aussi les noms commerciaux associés
-        
-        2. Critères d'évaluation :
-           - Propriété directe : la marque est détenue par {holding} ou une de ses filiales
-           - Licence exclusive : droits d'exploitation exclusifs accordés par {holding}
-           - Licence partielle : droits d'exploitation non exclusifs
-           - Droits d'exploitation régionaux : droits limités à certaines zones géographiques
-        
-        3. Niveau de confiance :
-           - 100% : Documentation officielle incontestable (registres de marques, rapports annuels)
-           - 80-99% : Sources officielles multiples concordantes
-           - 60-79% : Source officielle unique fiable
-           - <60% : Sources non officielles ou informations partielles
-        
-        Contexte d'analyse :
-        - Marque à vérifier : '{brand}'
-        - Société holding : {holding}
-        
-        Protocole de vérification :
-        1. Consultation des registres officiels de marques
-        2. Analyse des rapports annuels et documents financiers de {holding}
-        3. Vérification des communiqués de presse et annonces d'acquisition
-        4. Consultation des sites web officiels et portefeuilles de marques
-        5. Analyse des documents de structure d'entreprise
-        6. Vérification des sources d'autorité de la concurrence
-        7. Consultation des bases de données de propriété intellectuelle
-        
-        Sources de référence prioritaires :
-        - Registres officiels de marques et bases de données de propriété intellectuelle
-        - Rapports annuels et états financiers des entreprises
-        - Communiqués de presse officiels et annonces d'acquisition
-        - Sites web corporatifs et portefeuilles de marques officiels
-        - Documents de structure d'entreprise et organigrammes
-        - Sources d'information commerciale accréditées
-        - Autorités de la concurrence et organismes de régulation
-        - Bases de données de brevets et marques déposées
-        
-        Sources à exclure :
-        - Contenu généré par les utilisateurs (Wikipedia, forums, etc.)
-        - Blogs et sites non officiels
-        - Réseaux sociaux et contenus non vérifiés
-        - Articles de presse sans sources officielles
-        
-        En cas d'absence d'information :
-        - belongs_to: false
-        - confidence: 0
-        - explanation: "Aucune information vérifiable trouvée concernant la marque '{brand}'"
-        - type_relation: "Aucune relation documentée"
-        
-        Format de réponse attendu (JSON) :
-        {{
-            "belongs_to": boolean,
-            "confidence": number (0-100),
-            "explanation": string (en français),
-            "sources": array de sources fiables utilisées,
-            "type_relation": string ("Propriété directe", "Licence exclusive", "Licence partielle", "Droits d'exploitation régionaux", "Aucune relation"),
-            "zones_geographiques": string (zones concernées),
-            "date_changement": string (date du dernier changement de propriété/licence),
-            "details_relation": string (détails sur la nature de la relation)
-        }}"""
-
-    def calculate_confidence_score(self, result, sources):
+    @staticmethod
+    def max_requests_in_flight(concurrency, speculative=False):
+        """Requêtes simultanées pour `concurrency` lignes en cours (deux par ligne en mode spéculatif)."""
+        return concurrency * 2 if speculative else concurrency
+
+    def set_tiers(self, tiers):
+        """Remplace les paliers de vérification et remet leurs compteurs à zéro."""
+        self.tiers = tiers
+        self.tier_stats = TierStats(tiers)
+
+    def set_metrics(self, metrics):
+        """Remplace l'instrumentation (verbosité, journal JSON Lines, fichier Prometheus), client compris."""
+        # La barre tqdm affiche déjà la progression
+        metrics.progress_interval = None
+        self.metrics = metrics
+        self.client.metrics = metrics
+
+    def set_prompt_templates(self, names):
+        """Remplace les templates de prompt ; avec plusieurs, chaque paire reçoit toujours le même."""
+        self.prompt_templates = [get_template(name) for name in names]
+        self.prompt_stats = PromptStats(self.prompt_templates)
+
+    def pair_key(self, holding, brand):
+        """Clé commune aux orthographes rapprochées d'une même paire (holding, marque)."""
+        if self.dedup is None:
+            return f"{holding}_{brand}"
+        return self.dedup.key(holding, brand)
+
+    def template_for(self, holding, brand):
+        """Template de prompt d'une paire (holding, marque)."""
+        return assign_template(self.prompt_templates, holding, brand)
+
+    def template_name(self, holding, brand):
+        """Nom du template d'une paire, enregistré dans la clé de cache."""
+        return self.template_for(holding, brand).name
+
+    def prediction_keys(self, holding, brand):
+        """Clés suivies par le PromotionPredictor pour une ligne : holding et catégorie."""
+        keys = [('holding', normalize_key_part(holding))]
+        category = self.categories.get((holding, brand))
+        if isinstance(category, str) and category:
+            keys.append(('category', category))
+        return keys
+
+    def predicts_promotion(self, holding, brand):
+        """Prédit si la 1ère vérification sera promue au palier suivant.
+
+        Historique du cache (la paire a déjà été promue lors d'une exécution
+        précédente), puis part de lignes promues pour la même holding ou la
+        même catégorie pendant l'exécution.
+        """
+        if len(self.tiers) < 2:
+            return False
+        if self.cache is not None and self.cache.seen(holding, brand, self.template_name(holding, brand),
+                                                      self.tiers[1].chat_model, cache_variant(self.tiers, 1)):
+            return True
+        return self.predictor.predicts(self.prediction_keys(holding, brand))
+
+    def count_speculation(self, outcome):
+        with self.speculation_lock:
+            self.speculation_stats[outcome] += 1
+
+    def create_prompt(self, holding, brand, template=None, **fields):
+        template = template or self.template_for(holding, brand)
+        return template.render(brand=brand, holding=holding, **fields)
+
+    @staticmethod
+    def calculate_confidence_score(result, sources):
         """Calculate confidence score based on source quality and quantity."""
-        base_score = result.get('confidence', 0)
-        
-        # Facteurs de pondération
-        source_quality = 0
-        source_quantity = len(sources)
-        official_sources = 0
-        recent_sources = 0
-        
-        for source in sources:
-            if isinstance(source, dict):
-                metadata = source.get('metadata', {})
-                url = metadata.get('url', '').lower()
-                title = metadata.get('title', '').lower()
-                
-                # Vérification des sources officielles
-                if any(domain in url for domain in [
-                    '.com', '.org', '.gov', '.edu',
-                    'annualreport', 'financial', 'press-release',
-                    'investor', 'corporate', 'official',
-                    'generalmills', 'sec.gov', 'businesswire',
-                    'autoritedelaconcurrence', 'inpi.fr',  # Ajout des sources françaises
-                    'marques.inpi.fr', 'data.inpi.fr',
-                    'henkel.com', 'henkel.fr',
-                    'marques.ic.gc.ca', 'tmdn.org',
-                    'euipo.europa.eu', 'wipo.int'
-                ]):
-                    official_sources += 1
-                
-                # Vérification des sources récentes (moins de 2 ans)
-                if '2023' in title or '2024' in title or '2025' in title:
-                    recent_sources += 1
-        
-        # Calcul des scores
-        source_quality = (official_sources / max(source_quantity, 1)) * 100
-        recency_score = (recent_sources / max(source_quantity, 1)) * 100
-        
-        # Nouvelle pondération plus favorable
-        final_score = (
-            base_score * 0.5 +  # Score de base (50%)
-            source_quality * 0.3 +  # Qualité des sources (30%)
-            recency_score * 0.2  # Actualité des sources (20%)
-        )
-        
-        # Bonus pour les informations très fiables
-        if official_sources >= 2 and source_quality >= 80:
-            final_score = min(100, final_score * 1.2)  # +20% de bonus
-        
-        # Bonus pour les informations historiques bien établies
-        if 'acquisition' in result.get('explanation', '').lower() and official_sources >= 2:
-            final_score = min(100, final_score * 1.1)  # +10% de bonus
+        # Score de base = confiance annoncée par le modèle ; seules les sources Perplexica comptent
+        return multi_score(result.get('confidence', 0), result.get('explanation', ''),
+                           source_counts((), sources))
+
+    @staticmethod
+    def parse_response(body):
+        """Décode le corps brut d'une réponse Perplexica et calcule le score.
+
+        Partie CPU de la vérification : peut être exécutée dans un pool de
+        processus. Retourne le résultat (None si la réponse est inexploitable)
+        et les tokens estimés du message, pour que la réponse ne soit décodée
+        qu'une fois.
+        """
+        with stage('parse'):
+            result = json.loads(body)
+            tokens = answer_tokens(result)
             
-        # Bonus pour les informations confirmées par plusieurs sources officielles
-        if official_sources >= 3:
-            final_score = min(100, final_score * 1.15)  # +15% de bonus
+            # Extraire le JSON du message (blocs de code, texte autour, apostrophes,
+            # virgules finales tolérés) et valider les champs requis
+            content = parse_answer(result.get('message', '{}'), MULTI_VERIFICATION_SCHEMA)
+        if content is None:
+            say(VERBOSE, f"Invalid or incomplete JSON response: {str(result.get('message'))[:200]}")
+            return None, tokens
         
-        return min(100, max(0, final_score))  # S'assurer que le score est entre 0 et 100
+        # Calculate confidence score
+        sources = result.get('sources', [])
+        with stage('scoring'):
+            content['confidence'] = BrandVerificationMulti.calculate_confidence_score(content, sources)
+        
+        return content, tokens
+
+    def verify_with_perplexica(self, holding, brand, tier_index=0, template=None, **fields):
+        """Vérifie une marque via Perplexica avec le modèle et les modes d'un palier.
 
-    def verify_with_perplexica(self, holding, brand):
-        print(f"\nVerifying {brand} for {holding}...")
-        print(f"Sending request to Perplexica API for {brand}...")
+        Le nom du palier distingue dans le cache les passes successives d'une
+        même marque (la 2ème vérification ne doit pas relire la 1ère).
+        `template` remplace le template de la paire (question de confirmation
+        par exemple), `fields` complète sa question.
+        """
+        tier = self.tiers[tier_index]
+        variant = cache_variant(self.tiers, tier_index)
+        template = template or self.template_for(holding, brand)
+        if self.cache is not None:
+            cached = self.cache.get(holding, brand, template.name, tier.chat_model, variant)
+            self.metrics.count('cache_misses' if cached is None else 'cache_hits')
+            if cached is not None:
+                self.metrics.say(VERBOSE, f"\nRésultat en cache pour {brand} ({holding})")
+                return cached
         
-        payload = {
-            "chatModel": {
-                "provider": "openai",
-                "name": "gpt-4o-mini"
-            },
-            "embeddingModel": {
-                "provider": "openai",
-                "name": "text-embedding-3-large"
-            },
-            "optimizationMode": "accuracy",
-            "focusMode": "webSearch",
-            "query": self.create_prompt(holding, brand),
-            "history": [],
-            "systemInstructions": """You are a brand ownership verification expert. Your task is to determine if a brand belongs to a specific company.
-            Follow these strict guidelines:
-            1. Vérification de la marque :
-               - Vérifiez la marque exacte fournie et ses variations courantes
-               - Incluez les variations connues (ex: "Le Chat" = "LE CHAT")
-               - Vérifiez aussi les noms commerciaux associés
-               - Recherchez dans les bases de données de marques déposées
-            
-            2. Sources de référence :
-               - Utilisez UNIQUEMENT des sources officielles et vérifiables
-               - Priorisez les registres de marques et documents légaux
-               - Consultez les rapports annuels et documents financiers
-               - Vérifiez les communiqués de presse officiels
-               - Consultez les autorités de la concurrence
-               - Vérifiez les sites officiels des entreprises
-            
-            3. Critères d'évaluation :
-               - Propriété directe : marque détenue par la société ou ses filiales
-               - Licence exclusive : droits d'exploitation exclusifs
-               - Licence partielle : droits d'exploitation non exclusifs
-               - Droits régionaux : droits limités à certaines zones
-            
-            4. Niveau de confiance :
-               - 100% : Documentation officielle incontestable
-               - 80-99% : Sources officielles multiples concordantes
-               - 60-79% : Source officielle unique fiable
-               - <60% : Sources non officielles ou informations partielles
-            
-            5. Sources à exclure :
-               - Wikipedia et contenus générés par les utilisateurs
-               - Blogs et sites non officiels
-               - Réseaux sociaux et contenus non vérifiés
-               - Articles sans sources officielles
-            
-            6. En cas d'absence d'information :
-               - Faites une recherche approfondie avant de conclure
-               - Vérifiez les sources officielles de l'entreprise
-               - Consultez les bases de données de marques
-               - Vérifiez les sites web corporatifs
-               - Consultez les rapports annuels
-               - Ne concluez à l'absence d'information qu'après une recherche exhaustive
-            
-            Return a JSON response with:
-            - belongs_to: boolean
-            - confidence: number (0-100)
-            - explanation: string
-            - sources: array of reliable sources used
-            - type_relation: string
-            - zones_geographiques: string
-            - date_changement: string
-            - details_relation: string""",
-            "stream": False
-        }
+        self.metrics.say(DEBUG, f"\nVerifying {brand} for {holding}...\nSending request to Perplexica API for {brand}...")
         
-        max_retries = 5  # Augmenté de 3 à 5
-        retry_delay = 15  # Augmenté de 10 à 15 secondes
-        search_timeout = 120  # Augmenté de 60 à 120 secondes
+        with self.metrics.stage('prompt'):
+            query = self.create_prompt(holding, brand, template, **fields)
         
-        for attempt in range(max_retries):
+        for attempt in range(self.max_retries):
             try:
-                response = requests.post(
-                    self.perplexica_url,
-                    json=payload,
-                    timeout=search_timeout
-                )
-                response.raise_for_status()
-                
-                result = response.json()
+                # Le scheduler borne les requêtes en vol et ralentit en cas d'erreurs
+                slot = self.scheduler.slot() if self.scheduler is not None else nullcontext()
+                with slot:
+                    response = self.client.post(query, timeout=self.search_timeout,
+                                                schema=MULTI_VERIFICATION_SCHEMA, system_instructions=template.system,
+                                                **tier.post_options())
+                    body = response.text
+                self.tier_stats.record_call(tier, response.elapsed_time)
+                self.metrics.say(DEBUG, "Perplexica API response:", body)
                 
-                # Parse the message content which contains the JSON response
-                message_content = result.get('message', '{}')
-                if isinstance(message_content, str):
-                    # Remove any markdown code block indicators and clean the string
-                    message_content = message_content.replace('```json', '').replace('```', '').strip()
-                    
-                    # Try to find JSON content within the string
-                    try:
-                        # First try direct JSON parsing
-                        content = json.loads(message_content)
-                    except json.JSONDecodeError:
-                        # If that fails, try to extract JSON from the string
-                        try:
-                            # Look for JSON-like structure
-                            json_start = message_content.find('{')
-                            json_end = message_content.rfind('}') + 1
-                            if json_start >= 0 and json_end > json_start:
-                                json_str = message_content[json_start:json_end]
-                                content = json.loads(json_str)
-                            else:
-                                raise json.JSONDecodeError("No JSON structure found", message_content, 0)
-                        except json.JSONDecodeError as e:
-                            print(f"Error parsing JSON response: {e}")
-                            if attempt < max_retries - 1:
-                                print(f"Retrying in {retry_delay} seconds...")
-                                time.sleep(retry_delay)
-                                continue
-                            return None
+                if self.cpu_pool is not None:
+                    # Dans le pool de processus, le score est mesuré avec le parsing
+                    with self.metrics.stage('parse'):
+                        content, tokens = self.cpu_pool.submit(BrandVerificationMulti.parse_response, body).result()
                 else:
-                    content = message_content
-                
-                # Validate required fields
-                required_fields = ['belongs_to', 'explanation', 'confidence']
-                if not all(field in content for field in required_fields):
-                    print(f"Missing required fields in response: {content}")
-                    if attempt < max_retries - 1:
-                        print(f"Retrying in {retry_delay} seconds...")
-                        time.sleep(retry_delay)
-                        continue
-                    return None
+                    content, tokens = self.parse_response(body)
+                self.metrics.record_tokens(
+                    self.prompt_stats.record_request(template, query, None, response.elapsed_time, tokens))
                 
-                # Calculate confidence score
-                sources = result.get('sources', [])
-                content['confidence'] = self.calculate_confidence_score(content, sources)
-                
-                return content
+                if content is not None:
+                    content['prompt_version'] = template.name
+                    if self.cache is not None:
+                        self.cache.put(holding, brand, template.name, tier.chat_model, content, variant)
+                    return content
                 
             except requests.exceptions.RequestException as e:
-                print(f"Error making request to Perplexica API: {e}")
-                if attempt < max_retries - 1:
-                    print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                else:
-                    return None
+                self.metrics.say(VERBOSE, f"Error making request to Perplexica API: {e}")
             except Exception as e:
-                print(f"Unexpected error: {e}")
-                if attempt < max_retries - 1:
-                    print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
+                self.metrics.say(VERBOSE, f"Unexpected error: {e}")
+            
+            if attempt < self.max_retries - 1:
+                self.client.record_retry()
+                # Back-off exponentiel avec jitter : les threads en échec ne réessaient pas ensemble
+                delay = backoff_delay(attempt, self.retry_delay, self.max_retry_delay)
+                self.metrics.say(VERBOSE, f"Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
+        
+        return None
+
+    def create_batch_prompt(self, holding, brands, template=None):
+        """Prompt unique vérifiant plusieurs marques d'une même holding (réponse en tableau JSON)."""
+        template = template or self.template_for(holding, brands[0]).batch
+        brands_str = "\n".join(f"        {i}. '{brand}'" for i, brand in enumerate(brands, 1))
+        return template.render(holding=holding, brands=brands_str)
+
+    @staticmethod
+    def parse_batch_response(body, brands):
+        """Découpe et score une réponse groupée ; retourne {marque: résultat} et les tokens estimés du message.
+
+        Les marques absentes ou incomplètes sont omises et seront vérifiées
+        individuellement.
+        """
+        with stage('parse'):
+            result = json.loads(body)
+            tokens = answer_tokens(result)
+            items = extract_batch_items(result.get('message', ''), brands)
+        if items is None:
+            say(VERBOSE, "Réponse groupée invalide, vérification marque par marque")
+            return {}, tokens
+        
+        api_sources = result.get('sources', [])
+        contents = {}
+        for brand, content in items.items():
+            content = MULTI_VERIFICATION_SCHEMA.validate(content)
+            if content is None:
+                continue
+            sources = [source for source in api_sources if source_mentions(source, brand)]
+            content['confidence'] = BrandVerificationMulti.calculate_confidence_score(content, sources)
+            contents[brand] = content
+        return contents, tokens
+
+    def verify_batch_with_perplexica(self, holding, brands):
+        """Vérifie plusieurs marques d'une holding en un seul appel.
+
+        Retourne {marque: résultat} pour les marques résolues ; les autres
+        (réponse malformée, erreur) passent par verify_with_perplexica.
+        """
+        # Les requêtes groupées remplacent la 1ère vérification : premier palier
+        tier = self.tiers[0]
+        # Les marques d'un lot partagent le même template (voir prefetch_batches)
+        template = self.template_for(holding, brands[0]).batch
+        if template is None:
+            return {}
+        variant = cache_variant(self.tiers, 0)
+        with self.metrics.unit('batch', holding=holding, brands=len(brands)) as unit:
+            contents = {}
+            pending = []
+            for brand in brands:
+                cached = None
+                if self.cache is not None:
+                    cached = (self.cache.get(holding, brand, self.template_name(holding, brand), tier.chat_model,
+                                             variant)
+                              or self.cache.get(holding, brand, template.name, tier.chat_model, variant))
+                    self.metrics.count('cache_misses' if cached is None else 'cache_hits')
+                if cached is not None:
+                    contents[brand] = cached
                 else:
-                    return None
+                    pending.append(brand)
+            
+            if pending:
+                self.metrics.say(VERBOSE, f"\nVérification groupée de {len(pending)} marques pour {holding}...")
+                try:
+                    slot = self.scheduler.slot() if self.scheduler is not None else nullcontext()
+                    with slot:
+                        with self.metrics.stage('prompt'):
+                            query = self.create_batch_prompt(holding, pending, template)
+                        response = self.client.post(query, timeout=self.search_timeout,
+                                                    system_instructions=template.system, **tier.post_options())
+                        body = response.text
+                    self.tier_stats.record_call(tier, response.elapsed_time)
+                    if self.cpu_pool is not None:
+                        with self.metrics.stage('parse'):
+                            parsed, tokens = self.cpu_pool.submit(BrandVerificationMulti.parse_batch_response,
+                                                                  body, pending).result()
+                    else:
+                        parsed, tokens = self.parse_batch_response(body, pending)
+                    self.metrics.record_tokens(
+                        self.prompt_stats.record_request(template, query, None, response.elapsed_time, tokens))
+                except Exception as e:
+                    self.metrics.say(VERBOSE, f"Erreur lors de la vérification groupée pour {holding}: {e}")
+                    unit.error = str(e)
+                    parsed = {}
+                
+                for brand, content in parsed.items():
+                    content['prompt_version'] = template.name
+                    if self.cache is not None:
+                        self.cache.put(holding, brand, template.name, tier.chat_model, content, variant)
+                    contents[brand] = content
+                self.metrics.say(VERBOSE, f"{len(parsed)}/{len(pending)} marques de {holding} "
+                                          "résolues par la requête groupée")
+            
+            # Les lignes du lot passent ensuite par process_brand : elles y sont comptées
+            unit.status = 'Succès' if contents else 'Échec'
+        return contents
+
+    def pending_pairs(self, indexed_rows, completed):
+        """Paires (holding, marque) restant à vérifier, une par clé de paire (1ère orthographe rencontrée).
+
+        Les lignes terminées, les paires déjà préchargées et celles dont la
+        chaîne est connue du graphe de propriété (résolues ou confirmées par
+        process_brand) sont écartées.
+        """
+        pairs = {}
+        for i, row in indexed_rows:
+            holding, brand = row['Holding Name'], row['Brand Name']
+            if row_key(i, holding, brand) not in completed and self.known_chain(holding, brand) is None:
+                pairs.setdefault(self.pair_key(holding, brand), (holding, brand))
+        return [pair for pair in pairs.values() if pair not in self.prefetched]
+
+    def prefetch_batches(self, executor, indexed_rows, completed):
+        """Obtient par lots la 1ère vérification des paires (holding, marque) restantes.
+
+        Les résultats sont conservés dans self.prefetched et utilisés par
+        process_brand à la place du 1er appel individuel.
+        """
+        pairs = self.pending_pairs(indexed_rows, completed)
+        batches = [batch for batch in make_batches(pairs, self.batch_size, self.template_name) if len(batch[1]) > 1]
+        for (holding, _), contents in zip(batches, executor.map(lambda batch: self.verify_batch_with_perplexica(*batch), batches)):
+            for brand, content in contents.items():
+                self.prefetched[(holding, brand)] = content
+
+    @staticmethod
+    def parse_portfolio_response(body):
+        """Portefeuille validé (PORTFOLIO_SCHEMA) d'une réponse brute et tokens estimés du message.
+
+        Les sources de l'API sont ajoutées au portefeuille ; None s'il est vide.
+        """
+        with stage('parse'):
+            result = json.loads(body)
+            tokens = answer_tokens(result)
+            content = parse_answer(result.get('message', '{}'), PORTFOLIO_SCHEMA)
+        if content is None or not content['brands']:
+            say(VERBOSE, "Portefeuille de marques invalide ou vide")
+            return None, tokens
+        content['sources'] = result.get('sources', []) + content.get('sources', [])
+        return content, tokens
+
+    def fetch_portfolio(self, holding):
+        """Demande le portefeuille de marques officiel d'une holding (ou le relit en cache) et l'indexe.
+
+        Une seule tentative : en cas d'échec, les marques de la holding sont
+        vérifiées une par une. Retourne le Portfolio, ou None.
+        """
+        tier = self.tiers[0]
+        variant = cache_variant(self.tiers, 0)
+        template = get_template(self.portfolio_template)
+        with self.metrics.unit('portfolio', holding=holding) as unit:
+            content = None
+            if self.cache is not None:
+                content = self.cache.get(holding, '', template.name, tier.chat_model, variant)
+                self.metrics.count('cache_misses' if content is None else 'cache_hits')
+            if content is None:
+                self.metrics.say(VERBOSE, f"\nDemande du portefeuille de marques de {holding}...")
+                try:
+                    slot = self.scheduler.slot() if self.scheduler is not None else nullcontext()
+                    with slot:
+                        with self.metrics.stage('prompt'):
+                            query = template.render(holding=holding)
+                        response = self.client.post(query, timeout=self.search_timeout,
+                                                    system_instructions=template.system, **tier.post_options())
+                        body = response.text
+                    self.tier_stats.record_call(tier, response.elapsed_time)
+                    content, tokens = self.parse_portfolio_response(body)
+                    self.metrics.record_tokens(
+                        self.prompt_stats.record_request(template, query, None, response.elapsed_time, tokens))
+                except Exception as e:
+                    self.metrics.say(VERBOSE, f"Erreur lors de la demande du portefeuille de {holding}: {e}")
+                    unit.error = str(e)
+                if content is not None and self.cache is not None:
+                    self.cache.put(holding, '', template.name, tier.chat_model, content, variant)
+            portfolio = self.portfolios.add(holding, content, template.name)
+            unit.status = 'Succès' if portfolio is not None else 'Échec'
+        return portfolio
+
+    def prefetch_portfolios(self, executor, indexed_rows, completed):
+        """Obtient par le portefeuille officiel de leur holding la 1ère vérification des marques des grandes holdings.
+
+        Une requête par holding retenue (voir PortfolioIndex.select), en
+        parallèle ; les marques trouvées sans ambiguïté rejoignent
+        self.prefetched (la 2ème vérification reste soumise à la règle de
+        promotion), les autres passent par les requêtes groupées ou
+        individuelles.
+        """
+        pairs = self.pending_pairs(indexed_rows, completed)
+        selected = self.portfolios.select(pairs)
+        list(executor.map(self.fetch_portfolio, [holding for holding in selected
+                                                 if not self.portfolios.known(holding)]))
+        for holding, brands in selected.items():
+            for brand in brands:
+                content, sources = self.portfolios.match(holding, brand)
+                if content is not None:
+                    # Comme pour les autres réponses, seules les sources Perplexica comptent
+                    content['confidence'] = self.calculate_confidence_score(
+                        content, [source for source in sources if isinstance(source, dict)])
+                    self.prefetched[(holding, brand)] = content
 
     def calculate_final_confidence(self, first_result, second_result):
         """Calculate final confidence using weighted average (40/60) between two verifications."""
@@ -343,182 +532,456 @@ class BrandVerificationMulti:
         # Vérifier si la confiance est < 100%
         if result.get('confidence', 0) < 100:
             return True
-        # Vérifier si l'explication contient des phrases négatives
-        negative_phrases = [
-            "no information indicating",
-            "could not find",
-            "no evidence",
-            "not found",
-            "pas d'information",
-            "aucune preuve",
-            "impossible de trouver",
-            "no clear indication",
-            "unable to confirm",
-            "cannot verify",
-            "no confirmation",
-            "no documentation",
-            "no official source",
-            "no reliable source",
-            "no definitive answer",
-            "no conclusive evidence",
-            "no direct evidence",
-            "no explicit confirmation",
-            "no clear ownership",
-            "no clear relationship",
-            "no clear connection",
-            "no clear association",
-            "no clear link",
-            "no clear tie",
-            "no clear bond",
-            "no clear affiliation",
-            "no clear partnership",
-            "no clear alliance",
-            "no clear agreement",
-            "no clear contract",
-            "no clear deal",
-            "no clear arrangement",
-            "no clear understanding"
-        ]
-        explanation = result.get('explanation', '').lower()
-        return any(phrase in explanation for phrase in negative_phrases)
+        # Vérifier si l'explication contient des phrases négatives (liste de brand_common/patterns.json)
+        return get_matcher(NEGATIVE_PHRASES).search(result.get('explanation', ''))
+
+    def known_chain(self, holding, brand):
+        """Chaîne marque → holding connue du graphe de propriété et assez sûre, ou None."""
+        if self.ownership is None:
+            return None
+        return self.ownership.known_chain(holding, brand)
+
+    def verify_from_graph(self, holding, brand, chain):
+        """1ère vérification d'une paire dont la chaîne est connue ; None si la chaîne n'est pas confirmée.
+
+        Au-dessus de `resolve_confidence`, la chaîne suffit (aucun appel) ;
+        sinon une question courte la confirme.
+        """
+        if self.ownership.resolves(chain):
+            self.ownership.count('resolved')
+            self.metrics.say(VERBOSE, f"\nChaîne de propriété connue: {chain.describe()} ({chain.confidence:.0f}%)")
+            return chain.result()
+        content = self.verify_with_perplexica(holding, brand, 0, get_template(self.confirmation_template),
+                                              chain=chain.describe())
+        if content is not None and content['belongs_to']:
+            self.ownership.record_result(holding, brand, content, CONFIRMATION)
+            self.ownership.count('confirmed')
+            return content
+        self.metrics.say(VERBOSE, f"\nChaîne non confirmée pour {brand}, vérification complète")
+        self.ownership.count('rejected')
+        return None
 
     def process_brand(self, args):
         """Process a single brand verification."""
         holding, brand, index, total = args
-        print(f"\n{'-'*50}")
-        print(f"Progression: {index + 1}/{total}")
-        print(f"Vérification de {brand} pour {holding}")
-        print(f"{'-'*50}")
+        with self.metrics.unit('row', holding=holding, brand=brand) as unit:
+            progress = f"Progression: {index + 1}/{total}" if total else f"Progression: ligne {index + 1}"
+            self.metrics.say(VERBOSE, f"\n{'-'*50}\n{progress}\nVérification de {brand} pour {holding}\n{'-'*50}")
         
-        # First verification
-        print("\n1ère vérification en cours...")
-        first_result = self.verify_with_perplexica(holding, brand)
+            # First verification (éventuellement déjà obtenue par une requête groupée)
+            self.metrics.say(VERBOSE, "\n1ère vérification en cours...")
+            first_result = self.prefetched.get((holding, brand))
+            # Chaîne connue du graphe de propriété : résolue ou confirmée sans la vérification complète
+            chain = self.known_chain(holding, brand) if first_result is None else None
+            if chain is not None:
+                first_result = self.verify_from_graph(holding, brand, chain)
+            from_graph = chain is not None and first_result is not None
+            speculative = None
+            if first_result is None and self.speculation_pool is not None and self.predicts_promotion(holding, brand):
+                # Ligne prédite incertaine : le 2ème palier part sans attendre le 1er
+                # Dans le contexte de la ligne : ses mesures lui restent attribuées
+                speculative = self.speculation_pool.submit(contextvars.copy_context().run,
+                                                           self.verify_with_perplexica, holding, brand, 1)
+                self.count_speculation('launched')
+            if first_result is None:
+                first_result = self.verify_with_perplexica(holding, brand)
+            if first_result and len(self.tiers) > 1:
+                self.predictor.record(self.prediction_keys(holding, brand),
+                                      self.tiers[0].should_promote(first_result, self.should_verify_manually(first_result)))
         
-        if first_result:
-            print(f"\nRésultat 1ère vérification:")
-            print(f"- Appartient à {holding}: {first_result['belongs_to']}")
-            print(f"- Confiance: {first_result['confidence']}%")
+            if first_result:
+                self.metrics.say(VERBOSE, f"\nRésultat 1ère vérification:\n- Appartient à {holding}: "
+                                          f"{first_result['belongs_to']}\n- Confiance: {first_result['confidence']}%")
             
-            # Si score < 70%, on fait une deuxième vérification
-            if first_result['confidence'] < 70:
-                print(f"\nConfiance < 70%, lancement 2ème vérification...")
-                second_result = self.verify_with_perplexica(holding, brand)
-                final_result = self.calculate_final_confidence(first_result, second_result)
-                print(f"\nRésultat final après 2ème vérification:")
-                print(f"- Appartient à {holding}: {final_result['belongs_to']}")
-                print(f"- Confiance finale: {final_result['confidence']:.1f}%")
-            else:
-                # Si score ≥ 70%, on garde le premier résultat
+                # Template de la 1ère vérification (requête groupée ou individuelle) ;
+                # les résultats en cache antérieurs à la colonne Version_Prompt n'en ont pas
+                prompt_version = first_result.get('prompt_version') or self.template_name(holding, brand)
+                self.prompt_stats.record_row(prompt_version)
+            
+                # Promotion au palier suivant tant que le résultat reste incertain
+                # (par défaut : 2ème vérification si score < 70%), fusion pondérée 40/60
                 final_result = first_result
-                print("\nConfiance ≥ 70%, pas de 2ème vérification nécessaire")
-                print(f"- Confiance finale: {final_result['confidence']:.1f}%")
+                tier_index = 0
+                while (tier_index + 1 < len(self.tiers)
+                       and self.tiers[tier_index].should_promote(final_result, self.should_verify_manually(final_result))):
+                    tier_index += 1
+                    self.metrics.say(VERBOSE, f"\nConfiance {final_result['confidence']:.1f}%, "
+                                              f"passage au palier {self.tiers[tier_index].name}...")
+                    if tier_index == 1 and speculative is not None:
+                        next_result = speculative.result()
+                        speculative = None
+                        self.count_speculation('used')
+                    else:
+                        next_result = self.verify_with_perplexica(holding, brand, tier_index)
+                    final_result = self.calculate_final_confidence(final_result, next_result)
+                    self.metrics.say(VERBOSE, f"\nRésultat après le palier {self.tiers[tier_index].name}:\n"
+                                              f"- Appartient à {holding}: {final_result['belongs_to']}")
+                self.tier_stats.record_finish(self.tiers[tier_index])
+                self.metrics.say(VERBOSE, f"- Confiance finale: {final_result['confidence']:.1f}%")
+                if self.ownership is not None and not from_graph:
+                    self.ownership.record_result(holding, brand, final_result)
+                if speculative is not None:
+                    # Promotion finalement inutile : le résultat spéculatif reste en cache
+                    self.count_speculation('wasted')
             
-            # Determine if manual verification is needed
-            needs_verification = self.should_verify_manually(final_result)
+                # Determine if manual verification is needed
+                needs_verification = self.should_verify_manually(final_result)
             
-            return {
-                'Propriété_Directe': final_result['belongs_to'],
-                'Score_Confiance': final_result['confidence'],
-                'Type_Relation': final_result.get('type_relation', 'Propriété directe'),
-                'Zones_Géographiques': final_result.get('zones_geographiques', ''),
-                'Date_Changement': final_result.get('date_changement', ''),
-                'Détails_Relation': final_result.get('details_relation', ''),
-                'Explication': final_result['explanation'],
-                'Sources': final_result.get('sources', []),
-                'À_Vérifier': needs_verification
-            }
-        else:
-            print("\nÉchec de la vérification")
-            return {
-                'Propriété_Directe': False,
-                'Score_Confiance': 0,
-                'Type_Relation': 'Propriété directe',
-                'Zones_Géographiques': '',
-                'Date_Changement': '',
-                'Détails_Relation': '',
-                'Explication': 'Échec de la vérification',
-                'Sources': [],
-                'À_Vérifier': True
-            }
+                return {
+                    'Propriété_Directe': final_result['belongs_to'],
+                    'Score_Confiance': final_result['confidence'],
+                    'Type_Relation': final_result.get('type_relation', 'Propriété directe'),
+                    'Zones_Géographiques': final_result.get('zones_geographiques', ''),
+                    'Date_Changement': final_result.get('date_changement', ''),
+                    'Détails_Relation': final_result.get('details_relation', ''),
+                    'Explication': final_result['explanation'],
+                    'Sources': final_result.get('sources', []),
+                    'À_Vérifier': needs_verification,
+                    'Version_Prompt': prompt_version
+                }
+            else:
+                if speculative is not None:
+                    self.count_speculation('wasted')
+                self.metrics.say(NORMAL, f"\nÉchec de la vérification de {brand} pour {holding}")
+                unit.status = 'Échec'
+                return {
+                    'Propriété_Directe': False,
+                    'Score_Confiance': 0,
+                    'Type_Relation': 'Propriété directe',
+                    'Zones_Géographiques': '',
+                    'Date_Changement': '',
+                    'Détails_Relation': '',
+                    'Explication': 'Échec de la vérification',
+                    'Sources': [],
+                    'À_Vérifier': True,
+                    'Version_Prompt': ''
+                }
+
+    def process_brand_journaled(self, group, journal):
+        """Traite la 1ère ligne d'un groupe de même paire puis journalise toutes ses lignes."""
+        result = self.process_brand(group[0])
+        for holding, brand, index, total in group:
+            journal.append(row_key(index, holding, brand), result)
+        return result
+
+    def open_journal(self, output_file, resume=False, journal_file=None):
+        """Ouvre le journal de reprise et retourne (journal, lignes déjà terminées)."""
+        journal = CheckpointJournal(journal_file or f"{output_file}.journal.jsonl")
+        completed = journal.load() if resume else {}
+        if resume:
+            self.metrics.say(NORMAL, f"Reprise: {len(completed)} lignes déjà terminées dans {journal.path}")
+            if journal.skipped_lines:
+                self.metrics.say(NORMAL, f"{journal.skipped_lines} lignes incomplètes ignorées dans le journal")
+        journal.open(resume=resume)
+        return journal, completed
+
+    def start_workers(self):
+        """Crée le scheduler réseau et le pool CPU optionnel pour un traitement."""
+        # Fenêtre adaptative pour ne pas surcharger Perplexica
+        self.scheduler = AdaptiveScheduler(
+            max_concurrency=self.max_requests_in_flight(self.concurrency, self.speculative))
+        if self.cpu_workers:
+            self.cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers)
+        if self.speculative:
+            self.speculation_pool = ThreadPoolExecutor(max_workers=self.concurrency)
 
-    def process_all_brands(self, input_file, output_file):
+    def stop_workers(self):
+        if self.cpu_pool is not None:
+            self.cpu_pool.shutdown()
+            self.cpu_pool = None
+        if self.speculation_pool is not None:
+            # Les vérifications spéculatives inutiles se terminent (et remplissent le cache)
+            self.speculation_pool.shutdown()
+            self.speculation_pool = None
+            stats = self.speculation_stats
+            self.metrics.say(NORMAL, f"\nVérifications spéculatives: {stats['launched']} lancées, "
+                                     f"{stats['used']} utilisées, {stats['wasted']} inutiles")
+        stats = self.scheduler.stats
+        self.metrics.say(NORMAL, f"\nRequêtes: {stats['requests']}, erreurs: {stats['errors']}, "
+                                 f"réponses lentes: {stats['slow']}, fenêtre finale: {int(self.scheduler.limit)}")
+        self.metrics.say(NORMAL, self.client.summary())
+        self.metrics.say(NORMAL, self.tier_stats.summary())
+        self.metrics.say(NORMAL, self.prompt_stats.summary())
+        if self.cache is not None:
+            self.metrics.say(NORMAL, self.cache.summary())
+        if self.dedup is not None:
+            self.metrics.say(NORMAL, self.dedup.summary())
+        if self.ownership is not None:
+            self.metrics.say(NORMAL, self.ownership.summary())
+        if self.portfolios is not None:
+            self.metrics.say(NORMAL, self.portfolios.summary())
+        self.metrics.say(NORMAL, self.metrics.summary())
+        self.metrics.close()
+
+    def verify_rows(self, executor, indexed_rows, total, completed, journal):
+        """Vérifie des lignes (index, ligne) et retourne leurs résultats dans l'ordre.
+
+        Les lignes déjà présentes dans le journal sont reprises telles quelles ;
+        une seule vérification par paire (holding, marque), orthographes
+        rapprochées comprises, dont le résultat vaut pour toutes ses lignes.
+        """
+        indexed_rows = list(indexed_rows)
+        if self.speculative:
+            self.categories.update(((row['Holding Name'], row['Brand Name']), row.get('Class Key - Description'))
+                                   for i, row in indexed_rows)
+        self.prefetched = {}
+        if self.portfolios is not None:
+            self.prefetch_portfolios(executor, indexed_rows, completed)
+        if self.batch_size > 1:
+            self.prefetch_batches(executor, indexed_rows, completed)
+        keys = [row_key(i, row['Holding Name'], row['Brand Name']) for i, row in indexed_rows]
+        groups = {}
+        for key, (i, row) in zip(keys, indexed_rows):
+            if key not in completed:
+                args = (row['Holding Name'], row['Brand Name'], i, total)
+                groups.setdefault(self.pair_key(row['Holding Name'], row['Brand Name']), []).append(args)
+        
+        # executor.map conserve l'ordre des groupes (1ère apparition de chaque paire)
+        group_results = list(tqdm(
+            executor.map(lambda group: self.process_brand_journaled(group, journal), groups.values()),
+            total=len(groups),
+            desc="Vérification des marques",
+            disable=not self.metrics.shows(NORMAL)
+        ))
+        pending = {}
+        for group, result in zip(groups.values(), group_results):
+            for args in group:
+                pending[args[2]] = result
+        
+        # Fusionner les lignes reprises du journal et les nouvelles
+        return [completed[key] if key in completed else pending[i] for key, (i, row) in zip(keys, indexed_rows)]
+
+    def process_all_brands(self, input_file, output_file, resume=False, journal_file=None):
         try:
             # Lire le fichier source en préservant l'ordre
-            df = pd.read_csv(input_file)
+            df = read_table(input_file)
             total_brands = len(df)
-            print(f"\n{'='*50}")
-            print(f"Début de la vérification de {total_brands} marques")
-            print(f"{'='*50}\n")
+            self.metrics.say(NORMAL, f"\n{'='*50}\nDébut de la vérification de {total_brands} marques\n{'='*50}\n")
             
-            # Créer les nouvelles colonnes avec des valeurs par défaut
-            new_columns = {
-                'Propriété_Directe': False,
-                'Score_Confiance': 0,
-                'Type_Relation': 'Propriété directe',
-                'Zones_Géographiques': '',
-                'Date_Changement': '',
-                'Détails_Relation': '',
-                'Explication': '',
-                'Sources': [],
-                'À_Vérifier': True
-            }
+            # Journal des lignes terminées, relu en cas de reprise
+            journal, completed = self.open_journal(output_file, resume, journal_file)
             
-            # Ajouter les nouvelles colonnes à la fin du DataFrame
-            for col, default_value in new_columns.items():
-                df[col] = default_value
+            # Threads pour l'attente réseau, la concurrence n'est pas liée au nombre de CPU
+            self.start_workers()
+            try:
+                with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                    results = self.verify_rows(executor, df.iterrows(), total_brands, completed, journal)
+            finally:
+                journal.close()
+                self.stop_workers()
             
-            # Préparer les arguments pour le multiprocessing
-            args_list = [(row['Holding Name'], row['Brand Name'], i, total_brands) 
-                        for i, row in df.iterrows()]
+            # Mettre à jour le DataFrame avec les résultats, une colonne à la fois
+            # (les listes de sources ne peuvent pas être affectées cellule par cellule)
+            for col in RESULT_COLUMNS:
+                df[col] = [result[col] for result in results]
             
-            # Créer un pool de processus
-            with Pool(processes=self.num_processes) as pool:
-                # Utiliser tqdm pour afficher la progression
-                results = list(tqdm(
-                    pool.imap(self.process_brand, args_list),
-                    total=len(args_list),
-                    desc="Vérification des marques"
-                ))
+            # Sauvegarder les résultats
+            write_table(df, output_file)
             
-            # Mettre à jour le DataFrame avec les résultats
-            for i, result in enumerate(results):
-                for col in result:
-                    df.at[i, col] = result[col]
+            self.metrics.say(NORMAL, f"\n{'='*50}\nVérification terminée!\n"
+                                     f"Résultats sauvegardés dans {output_file}\n{'='*50}\n")
             
-            # Sauvegarder les résultats
-            df.to_csv(output_file, index=False)
+        except Exception as e:
+            self.metrics.say(QUIET, f"\nErreur lors du traitement des marques: {e}")
+            raise e
+
+    def process_all_brands_streaming(self, input_file, output_file, chunksize=5000,
+                                     columns=CATALOG_COLUMNS, resume=False, journal_file=None):
+        """Vérifie un catalogue volumineux bloc par bloc, à mémoire bornée.
+
+        Seules `columns` sont lues (None = toutes) et chaque bloc vérifié est
+        ajouté au fichier de sortie (CSV ou Parquet).
+        """
+        try:
+            self.metrics.say(NORMAL, f"\n{'='*50}\nDébut de la vérification en flux de {input_file} "
+                                     f"(blocs de {chunksize} lignes)\n{'='*50}\n")
             
-            print(f"\n{'='*50}")
-            print(f"Vérification terminée!")
-            print(f"Résultats sauvegardés dans {output_file}")
-            print(f"{'='*50}\n")
+            journal, completed = self.open_journal(output_file, resume, journal_file)
+            writer = open_writer(output_file)
+            total_rows = 0
+            
+            self.start_workers()
+            try:
+                with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                    for chunk in read_catalog_chunks(input_file, chunksize, columns):
+                        results = self.verify_rows(executor, zip(chunk.index, chunk.to_dict('records')),
+                                                   None, completed, journal)
+                        for col in RESULT_COLUMNS:
+                            chunk[col] = [result[col] for result in results]
+                        writer.write(chunk)
+                        total_rows += len(chunk)
+                        self.metrics.say(NORMAL, f"Bloc terminé: {total_rows} lignes écrites dans {output_file}")
+            finally:
+                journal.close()
+                writer.close()
+                self.stop_workers()
+            
+            self.metrics.say(NORMAL, f"\n{'='*50}\nVérification terminée!\n"
+                                     f"Résultats sauvegardés dans {output_file}\n{'='*50}\n")
             
         except Exception as e:
-            print(f"\nErreur lors du traitement des marques: {e}")
+            self.metrics.say(QUIET, f"\nErreur lors du traitement des marques: {e}")
             raise e
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Vérification concurrente de la propriété des marques")
+    parser.add_argument("--input", default="Carrefour Geniathon  - Tableau origine .csv",
+                        help="Fichier d'origine (CSV, ou Parquet si l'extension est .parquet)")
+    parser.add_argument("--output", default="brand_verification_multiprocessing.csv",
+                        help="Fichier de résultats : CSV, ou Parquet typé (booléens, score en float32, "
+                             "sources en liste de {title, url}) si l'extension est .parquet")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="Nombre maximal de requêtes Perplexica simultanées")
+    parser.add_argument("--cpu-workers", type=int, default=0,
+                        help="Taille du pool de processus pour le parsing et le scoring (0 = dans les threads)")
+    parser.add_argument("--cache-file", default="verification_cache.sqlite",
+                        help="Fichier SQLite du cache de vérification")
+    parser.add_argument("--cache-ttl-days", type=float, default=30,
+                        help="Durée de vie des entrées du cache, en jours")
+    parser.add_argument("--cache-max-entries", type=int, default=100000,
+                        help="Nombre maximal d'entrées du cache (éviction LRU)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Désactive le cache persistant")
+    parser.add_argument("--resume", action="store_true",
+                        help="Reprend une exécution interrompue à partir du journal")
+    parser.add_argument("--journal", default=None,
+                        help="Journal des lignes terminées (défaut: <output>.journal.jsonl)")
+    parser.add_argument("--perplexica-url", default="http://localhost:3000/api/search",
+                        help="URL de l'API de recherche Perplexica")
+    parser.add_argument("--gzip-requests", action="store_true",
+                        help="Compresse en gzip le corps des requêtes (le serveur doit le supporter)")
+    parser.add_argument("--max-rps", type=float, default=None,
+                        help="Nombre maximal de requêtes Perplexica par seconde (défaut: illimité)")
+    parser.add_argument("--max-concurrent", type=int, default=None,
+                        help="Nombre maximal de requêtes Perplexica simultanées, propre au processus "
+                             "(défaut: illimité)")
+    parser.add_argument("--rate-limit-file", default=None,
+                        help="Fichier SQLite pour partager la limite de débit entre processus")
+    parser.add_argument("--no-circuit-breaker", action="store_true",
+                        help="Désactive la suspension des envois quand le taux d'erreur s'envole")
+    parser.add_argument("--stream-responses", action="store_true",
+                        help="Lit les réponses de Perplexica en flux et mesure le délai jusqu'au verdict")
+    parser.add_argument("--stop-at-verdict", action="store_true",
+                        help="Avec --stream-responses, coupe la génération dès que les champs requis "
+                             "(belongs_to, explanation...) sont complets")
+    parser.add_argument("--speculative-second-pass", action="store_true",
+                        help="Lance le 2ème palier en même temps que le 1er pour les lignes prédites incertaines "
+                             "(historique du cache, holding, catégorie)")
+    parser.add_argument("--hedge-percentile", type=float, default=None,
+                        help="Double une requête restée sans réponse au-delà de ce percentile des durées "
+                             "observées (ex: 95) et garde la première réponse valide (défaut: désactivé)")
+    parser.add_argument("--tiers-file", default=None,
+                        help="Fichier JSON des paliers de vérification (modèle, modes, règles de promotion, "
+                             "coût par requête), défaut: deux passes gpt-4o-mini, la 2ème si confiance < 70%%")
+    parser.add_argument("--prompt-templates", nargs="+", default=None, metavar="TEMPLATE",
+                        help="Templates de prompt du registre (défaut: verification-fr-v1) ; avec plusieurs, "
+                             "test A/B : chaque paire (holding, marque) reçoit toujours le même template")
+    parser.add_argument("--prompts-file", default=None,
+                        help="Registre JSON des templates de prompt, défaut: brand_common/prompts/templates.json")
+    parser.add_argument("--patterns-file", default=None,
+                        help="Fichier JSON des listes de motifs (domaines officiels, phrases négatives), "
+                             "défaut: brand_common/patterns.json")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Nombre de marques d'une même holding vérifiées par requête (1 = désactivé)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Lit le fichier d'origine par blocs et écrit les résultats au fil de l'eau")
+    parser.add_argument("--chunksize", type=int, default=5000,
+                        help="Nombre de lignes par bloc en mode --stream")
+    parser.add_argument("--stream-all-columns", action="store_true",
+                        help="En mode --stream, conserve toutes les colonnes du fichier d'origine")
+    parser.add_argument("--dedup-threshold", type=float, default=1.0,
+                        help="Similarité (0-1) à partir de laquelle deux orthographes d'une marque de la même "
+                             "holding sont vérifiées une seule fois (0.9 par exemple) ; 1 = accents, casse, "
+                             "ponctuation et ordre des mots seulement (défaut)")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Ne regroupe que les paires (holding, marque) identiques au caractère près")
+    parser.add_argument("--ownership-graph", default=None,
+                        help="Fichier SQLite du graphe de propriété (marque → filiale → holding), enrichi par "
+                             "chaque vérification ; une chaîne connue évite la vérification complète")
+    parser.add_argument("--graph-resolve-confidence", type=float, default=90,
+                        help="Confiance minimale d'une chaîne connue pour résoudre la ligne sans appel à l'API")
+    parser.add_argument("--graph-confirm-confidence", type=float, default=70,
+                        help="Confiance minimale d'une chaîne connue pour la confirmer par une question courte "
+                             "au lieu de la vérification complète")
+    parser.add_argument("--portfolio-prefetch", action="store_true",
+                        help="Demande une fois le portefeuille de marques officiel de chaque grande holding ; "
+                             "il remplace la 1ère vérification des marques qui y figurent")
+    parser.add_argument("--portfolio-min-brands", type=int, default=50,
+                        help="Nombre minimal de marques à vérifier d'une holding pour demander son portefeuille")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="Détail par ligne (-v), réponses brutes de l'API (-vv)")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="N'affiche que les erreurs fatales (ni barre de progression, ni résumé)")
+    parser.add_argument("--log-file", default=None,
+                        help="Journal JSON Lines des mesures par ligne (durée par étape, requêtes, "
+                             "nouvelles tentatives, cache, tokens)")
+    parser.add_argument("--metrics-file", default=None,
+                        help="Fichier texte au format Prometheus des cumuls, réécrit pendant le traitement")
+    return parser.parse_args()
+
 def main():
-    verifier = BrandVerificationMulti()
-    output_file = "brand_verification_multiprocessing.csv"
+    args = parse_args()
+    if args.patterns_file:
+        configure_patterns(args.patterns_file)
+    if args.prompts_file:
+        configure_prompts(args.prompts_file)
+    cache = None
+    if not args.no_cache:
+        cache = VerificationCache(args.cache_file, ttl=args.cache_ttl_days * 24 * 3600,
+                                  max_entries=args.cache_max_entries)
+    client = PerplexicaClient(
+        url=args.perplexica_url,
+        system_instructions=SYSTEM_INSTRUCTIONS,
+        optimization_mode="accuracy",
+        max_connections=BrandVerificationMulti.max_requests_in_flight(args.concurrency,
+                                                                      args.speculative_second_pass),
+        compress_requests=args.gzip_requests,
+        limiter=RateLimiter(args.max_rps, max_concurrent=args.max_concurrent, state_file=args.rate_limit_file)
+        if args.max_rps or args.max_concurrent else None,
+        breaker=None if args.no_circuit_breaker else CircuitBreaker(),
+        stream_responses=args.stream_responses,
+        stop_early=args.stop_at_verdict,
+        hedge=HedgePolicy(args.hedge_percentile) if args.hedge_percentile else None
+    )
+    verifier = BrandVerificationMulti(concurrency=args.concurrency, cpu_workers=args.cpu_workers,
+                                      cache=cache, client=client, speculative=args.speculative_second_pass)
+    verifier.set_metrics(PipelineMetrics('verification_multi', QUIET if args.quiet else NORMAL + args.verbose,
+                                         args.log_file, args.metrics_file))
+    verifier.batch_size = args.batch_size
+    verifier.dedup = None if args.no_dedup else BrandIndex(args.dedup_threshold)
+    if args.ownership_graph:
+        verifier.ownership = OwnershipGraph(args.ownership_graph, args.graph_resolve_confidence,
+                                            args.graph_confirm_confidence)
+        verifier.metrics.say(NORMAL, f"Graphe de propriété: {len(verifier.ownership)} liens connus")
+    if args.portfolio_prefetch:
+        verifier.portfolios = PortfolioIndex(args.portfolio_min_brands, args.dedup_threshold)
+    if args.tiers_file:
+        verifier.set_tiers(load_tiers(args.tiers_file))
+    if args.prompt_templates:
+        verifier.set_prompt_templates(args.prompt_templates)
+    output_file = args.output
     
     try:
-        verifier.process_all_brands(
-            "Carrefour Geniathon  - Tableau origine .csv",
-            output_file
-        )
+        if args.stream:
+            columns = None if args.stream_all_columns else CATALOG_COLUMNS
+            verifier.process_all_brands_streaming(args.input, output_file, args.chunksize, columns,
+                                                  args.resume, args.journal)
+        else:
+            verifier.process_all_brands(args.input, output_file, args.resume, args.journal)
         
         # Vérifier que le fichier a été créé
         if os.path.exists(output_file):
-            print(f"\nLe fichier {output_file} a été créé avec succès!")
+            verifier.metrics.say(NORMAL, f"\nLe fichier {output_file} a été créé avec succès!")
             # Afficher les premières lignes du fichier
-            df = pd.read_csv(output_file)
-            print("\nAperçu des résultats:")
-            print(df.head())
+            if verifier.metrics.shows(NORMAL):
+                df = next(iter(read_catalog_chunks(output_file, 5, None, required=())), pd.DataFrame())
+                verifier.metrics.say(NORMAL, "\nAperçu des résultats:")
+                verifier.metrics.say(NORMAL, df.head())
         else:
-            print(f"\nErreur: Le fichier {output_file} n'a pas été créé.")
+            verifier.metrics.say(QUIET, f"\nErreur: Le fichier {output_file} n'a pas été créé.")
             
     except Exception as e:
-        print(f"\nUne erreur est survenue: {e}")
+        verifier.metrics.say(QUIET, f"\nUne erreur est survenue: {e}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,70 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class AdaptiveScheduler:
+    """Limiteur de concurrence adaptatif (AIMD) pour les appels réseau.
+
+    La fenêtre de requêtes simultanées grandit doucement tant que les réponses
+    sont rapides et est divisée par deux après une erreur ou une réponse
+    lente. Les pauses sur erreurs sont laissées au CircuitBreaker du client
+    et au back-off avec jitter des nouvelles tentatives : une pause propre au
+    scheduler relâcherait tous les threads en attente au même instant.
+    """
+
+    def __init__(self, max_concurrency=16, min_concurrency=1, slow_threshold=30.0, decrease_cooldown=5.0):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.slow_threshold = slow_threshold
+        self.decrease_cooldown = decrease_cooldown
+
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+        self.stats = {'requests': 0, 'errors': 0, 'slow': 0}
+
+    def acquire(self):
+        """Attend qu'une place soit libre dans la fenêtre."""
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def _decrease(self, now):
+        # Une seule réduction par période, sinon toutes les requêtes en vol
+        # d'une même vague lente feraient tomber la fenêtre au minimum
+        if now - self.last_decrease >= self.decrease_cooldown:
+            self.limit = max(self.min_concurrency, self.limit / 2)
+            self.last_decrease = now
+
+    def release(self, latency, error):
+        """Libère une place et ajuste la fenêtre selon l'issue de la requête."""
+        with self.condition:
+            now = time.monotonic()
+            self.in_flight -= 1
+            self.stats['requests'] += 1
+            if error:
+                self.stats['errors'] += 1
+                self._decrease(now)
+            elif latency > self.slow_threshold:
+                self.stats['slow'] += 1
+                self._decrease(now)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """Contexte autour d'un appel réseau: mesure la latence et détecte les erreurs."""
+        self.acquire()
+        start = time.monotonic()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.release(time.monotonic() - start, error)